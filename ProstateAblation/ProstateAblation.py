@@ -68,6 +68,7 @@ class ProstateAblationWidget(ModuleWidgetMixin, ScriptedLoadableModuleWidget):
   @logmethod(logging.DEBUG)
   def cleanup(self):
     ScriptedLoadableModuleWidget.cleanup(self)
+    self.session.guidanceRegistry.cleanup()
     self.patientWatchBox.sourceFile = None
     self.intraopWatchBox.sourceFile = None
 
@@ -113,8 +114,13 @@ class ProstateAblationWidget(ModuleWidgetMixin, ScriptedLoadableModuleWidget):
     self.affectiveZoneIcon = self.createIcon('icon-needle.png')
     self.showAffectiveZoneButton = self.createButton("", icon=self.affectiveZoneIcon, iconSize=iconSize, checkable=True, toolTip="Display the effective ablation zone")
     self.showAffectiveZoneButton.connect('toggled(bool)', self.session.onShowAffectiveZoneToggled)
+    self.reachabilityIcon = self.createIcon('icon-template.png')
+    self.showReachabilityButton = self.createButton("", icon=self.reachabilityIcon, iconSize=iconSize, checkable=True,
+                                                    toolTip="Display the region reachable through the template")
+    self.showReachabilityButton.connect('toggled(bool)', self.session.onShowReachabilityToggled)
     viewSettingButtons = [self.redOnlyLayoutButton, self.fourUpLayoutButton,
-                          self.settingsButton, self.screenShotButton, self.showAffectiveZoneButton]
+                          self.settingsButton, self.screenShotButton, self.showAffectiveZoneButton,
+                          self.showReachabilityButton]
     
     for step in self.session.steps:
       viewSettingButtons += step.viewSettingButtons
@@ -162,7 +168,7 @@ class ProstateAblationWidget(ModuleWidgetMixin, ScriptedLoadableModuleWidget):
 
   @vtk.calldata_type(vtk.VTK_STRING)
   def onCurrentSeriesChanged(self, caller, event, callData):
-    receivedFile = self.session.loadableList[callData][0] if callData else None
+    receivedFile = self.session.seriesRegistry.getFiles(callData)[0] if callData else None
     if self.patientWatchBox.sourceFile is None:
       self.patientWatchBox.sourceFile = receivedFile
     self.intraopWatchBox.sourceFile = receivedFile
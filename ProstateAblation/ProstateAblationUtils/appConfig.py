@@ -75,5 +75,19 @@ class ConfigurationParser(ModuleWidgetMixin):
         (not self.config.get('CurrentNeedleType', 'NeedleType') == self.getSetting("NeedleType")) :
       self.setSetting("NeedleType", self.config.get('CurrentNeedleType', 'NeedleType'))
 
+    self.setSetting("Streaming_Ingest", self.config.get('Intraop Ingest', 'Streaming'))
+    self.setSetting("Duplicate_Instances", self.config.get('Intraop Ingest', 'DuplicateInstances'))
+    self.setSetting("Record_Arrival_Timeline", self.config.get('Intraop Ingest', 'RecordArrivalTimeline'))
+    self.setSetting("Intraop_File_Watcher", self.config.get('Intraop Ingest', 'FileWatcher'))
+    self.setSetting("Intraop_Quiet_Period_Ms", self.config.get('Intraop Ingest', 'QuietPeriodMs'))
+    self.setSetting("Intraop_Listener", self.config.get('Intraop Ingest', 'Listener'))
+    self.setSetting("Intraop_Listener_Port", self.config.get('Intraop Ingest', 'ListenerPort'))
+    self.setSetting("Intraop_Listener_AE_Title", self.config.get('Intraop Ingest', 'ListenerAETitle'))
+    self.setSetting("Series_Volume_Budget_MB", self.config.get('Memory', 'SeriesVolumeBudgetMB'))
+    self.setSetting("Replay_Slice_Interval", self.config.get('Training Replay', 'SliceInterval'))
+    self.setSetting("Replay_Series_Interval", self.config.get('Training Replay', 'SeriesInterval'))
+    self.setSetting("Replay_Speed", self.config.get('Training Replay', 'Speed'))
+    self.setSetting("Reachability_Spacing", self.config.get('Guidance', 'ReachabilitySpacing'))
+
 
 
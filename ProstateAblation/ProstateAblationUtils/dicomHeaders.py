@@ -0,0 +1,116 @@
+""" Header extraction for incoming DICOM files.
+
+This module must not import slicer, qt or vtk: its functions are executed in worker processes that only have a plain
+Python interpreter available.
+"""
+
+import os
+import sys
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+  import pydicom
+except ImportError:
+  pydicom = None
+
+
+def readDICOMHeader(filename, keywords):
+  """ Reads all requested header fields of a file in a single pass.
+
+  Parsing is limited to the requested tags and stops before the pixel data.
+  """
+  dataset = pydicom.dcmread(filename, stop_before_pixels=True, force=True, specific_tags=list(keywords))
+  return getHeaderFromDataset(dataset, keywords)
+
+
+def getHeaderFromDataset(dataset, keywords):
+  """ Returns the requested header fields of an already parsed dataset as strings """
+  header = {}
+  for keyword in keywords:
+    value = dataset.get(keyword)
+    header[keyword] = "" if value is None else str(value)
+  return header
+
+
+def readDICOMHeaders(filenames, keywords):
+  headers = []
+  for filename in filenames:
+    try:
+      headers.append(readDICOMHeader(filename, keywords))
+    except Exception as exc:
+      logging.warning("Failed to read DICOM header of %s: %s" % (filename, exc))
+      headers.append(None)
+  return headers
+
+
+class DICOMHeaderExtractor(object):
+  """ Reads the header fields of batches of files on a thread or, for large batches, across a process pool.
+
+  Args:
+    keywords (list): DICOM keywords to be extracted
+    processPoolThreshold (int): minimum number of files of a single submission to be parsed in the process pool
+  """
+
+  CHUNK_SIZE = 32
+  PROCESS_POOL_THRESHOLD = 128
+
+  @property
+  def isAvailable(self):
+    return pydicom is not None
+
+  def __init__(self, keywords, processPoolThreshold=PROCESS_POOL_THRESHOLD):
+    self.keywords = list(keywords)
+    self.processPoolThreshold = processPoolThreshold
+    self._threadPool = ThreadPoolExecutor(max_workers=1)
+    self._processPool = None
+    self._processPoolFailed = False
+
+  def read(self, filename):
+    return readDICOMHeader(filename, self.keywords)
+
+  def submit(self, filenames):
+    """ Submits files for parsing.
+
+    Returns:
+      list of (filenames, future) tuples. Each future resolves to a list holding one header (or None) per file.
+    """
+    executor = self._threadPool
+    if len(filenames) >= self.processPoolThreshold:
+      executor = self._getProcessPool() or self._threadPool
+    chunks = [filenames[i:i + self.CHUNK_SIZE] for i in range(0, len(filenames), self.CHUNK_SIZE)]
+    return [(chunk, executor.submit(readDICOMHeaders, chunk, self.keywords)) for chunk in chunks]
+
+  def _getProcessPool(self):
+    if self._processPool or self._processPoolFailed:
+      return self._processPool
+    executable = self._getPythonExecutable()
+    if not executable:
+      logging.debug("No Python interpreter found for the DICOM header process pool, using a thread instead")
+      self._processPoolFailed = True
+      return None
+    try:
+      context = multiprocessing.get_context("spawn")
+      context.set_executable(executable)
+      self._processPool = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1), mp_context=context)
+    except (OSError, ValueError, NotImplementedError) as exc:
+      logging.warning("Could not start DICOM header process pool, falling back to a thread: %s" % exc)
+      self._processPoolFailed = True
+    return self._processPool
+
+  def _getPythonExecutable(self):
+    # The embedding application is not a Python interpreter, but ships one next to it
+    if os.path.basename(sys.executable).lower().startswith("python"):
+      return sys.executable
+    for name in ["PythonSlicer", "PythonSlicer.exe"]:
+      candidate = os.path.join(os.path.dirname(sys.executable), name)
+      if os.path.exists(candidate):
+        return candidate
+    return None
+
+  def shutdown(self):
+    self._threadPool.shutdown(wait=False)
+    if self._processPool:
+      self._processPool.shutdown(wait=False)
+      self._processPool = None
@@ -0,0 +1,256 @@
+import os
+import re
+import json
+import logging
+from collections import OrderedDict
+
+from SlicerDevelopmentToolboxUtils.constants import DICOMTAGS
+from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
+
+from ProstateAblationUtils.dicomHeaders import readDICOMHeader, pydicom
+
+
+class IntraopSeriesIndex(ModuleLogicMixin):
+  """ In-memory index of the intraop DICOM directory keyed by SeriesNumber.
+
+  Each file is read once when it is added. The index keeps the file list and the header fields of every series, so
+  that retrieving the files of a series does not require scanning and reparsing the whole directory.
+
+  Files holding an already indexed SOP instance are remembered, but either not added to their series or, if
+  replaceDuplicate is set, take the place of the older copy.
+  """
+
+  TAG_NOT_IN_INSTANCE = '__TAG_NOT_IN_INSTANCE__'
+
+  HEADER_TAGS = OrderedDict([("SeriesNumber", DICOMTAGS.SERIES_NUMBER),
+                             ("SeriesDescription", DICOMTAGS.SERIES_DESCRIPTION),
+                             ("PatientID", DICOMTAGS.PATIENT_ID),
+                             ("PatientName", DICOMTAGS.PATIENT_NAME),
+                             ("SOPInstanceUID", "0008,0018"),
+                             ("InstanceNumber", "0020,0013"),
+                             ("ImagePositionPatient", "0020,0032"),
+                             ("ImageOrientationPatient", "0020,0037"),
+                             ("ImagesInAcquisition", "0020,1002"),
+                             ("PixelSpacing", "0028,0030"),
+                             ("Rows", "0028,0010"),
+                             ("Columns", "0028,0011"),
+                             ("BitsAllocated", "0028,0100"),
+                             ("PixelRepresentation", "0028,0103"),
+                             ("RescaleIntercept", "0028,1052"),
+                             ("RescaleSlope", "0028,1053")])
+
+  NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+  @property
+  def isHeaderReadingThreadSafe(self):
+    return pydicom is not None
+
+  @property
+  def seriesNumbers(self):
+    return sorted(self._series.keys())
+
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self._headers = {}
+    self._series = {}
+    self._instances = {}
+
+  def __contains__(self, filename):
+    return filename in self._headers
+
+  def isHeaderComplete(self, header):
+    return header is not None and all(name in header for name in self.HEADER_TAGS.keys())
+
+  @classmethod
+  def getFloatValues(cls, header, name):
+    """ Parses multi-valued numeric header fields as written by pydicom ("[1.0, 2.0]") or DCMTK ("1.0\\2.0") """
+    value = header.get(name) if header else None
+    if not value or value == cls.TAG_NOT_IN_INSTANCE:
+      return []
+    return [float(v) for v in cls.NUMBER_PATTERN.findall(value)]
+
+  def readHeader(self, filename):
+    if self.isHeaderReadingThreadSafe:
+      return readDICOMHeader(filename, list(self.HEADER_TAGS.keys()))
+    return {name: self.getDICOMValue(filename, tag) for name, tag in self.HEADER_TAGS.items()}
+
+  def addFile(self, filename):
+    try:
+      return self._headers[filename]
+    except KeyError:
+      return self.addHeader(filename, self.readHeader(filename))
+
+  def getSOPInstanceUID(self, header):
+    value = header.get("SOPInstanceUID") if header else None
+    return value if value and value != self.TAG_NOT_IN_INSTANCE else None
+
+  def getDuplicate(self, filename, header):
+    """ Returns the indexed file holding the same SOP instance as the given file or None """
+    duplicate = self._instances.get(self.getSOPInstanceUID(header))
+    return duplicate if duplicate != filename else None
+
+  def addHeader(self, filename, header, replaceDuplicate=False):
+    if filename in self._headers:
+      return self._headers[filename]
+    duplicate = self.getDuplicate(filename, header)
+    self._headers[filename] = header
+    seriesNumber = self.getSeriesNumber(header)
+    if seriesNumber is None:
+      logging.debug("No valid SeriesNumber found in %s" % filename)
+      return header
+    if duplicate:
+      if replaceDuplicate:
+        self._replaceFile(duplicate, filename)
+      else:
+        logging.debug("Skipping %s, it holds the same SOP instance as %s" % (filename, duplicate))
+      return header
+    uid = self.getSOPInstanceUID(header)
+    if uid:
+      self._instances[uid] = filename
+    try:
+      entry = self._series[seriesNumber]
+    except KeyError:
+      entry = self._series[seriesNumber] = {"files": [], "header": header}
+    entry["files"].append(filename)
+    return header
+
+  def getSeriesNumber(self, header):
+    value = header.get("SeriesNumber")
+    if not value or value == self.TAG_NOT_IN_INSTANCE:
+      return None
+    try:
+      return int(value)
+    except ValueError:
+      return None
+
+  def _replaceFile(self, oldFilename, newFilename):
+    oldHeader = self._headers.pop(oldFilename, None)
+    entry = self._series.get(self.getSeriesNumber(oldHeader)) if oldHeader else None
+    if entry and oldFilename in entry["files"]:
+      entry["files"][entry["files"].index(oldFilename)] = newFilename
+    self._instances[self.getSOPInstanceUID(oldHeader)] = newFilename
+    logging.debug("Replaced %s by %s holding the same SOP instance" % (oldFilename, newFilename))
+
+  def getHeader(self, filename):
+    return self._headers.get(filename)
+
+  def getSeriesHeader(self, seriesNumber):
+    try:
+      return self._series[seriesNumber]["header"]
+    except KeyError:
+      return None
+
+  def getFileList(self, seriesNumber):
+    try:
+      return list(self._series[seriesNumber]["files"])
+    except KeyError:
+      return []
+
+  def removeSeries(self, seriesNumber):
+    entry = self._series.pop(seriesNumber, None)
+    if entry:
+      for filename in entry["files"]:
+        self._instances.pop(self.getSOPInstanceUID(self._headers.pop(filename, None)), None)
+    return entry["files"] if entry else []
+
+  def removeFile(self, filename):
+    header = self._headers.pop(filename, None)
+    if self._instances.get(self.getSOPInstanceUID(header)) == filename:
+      del self._instances[self.getSOPInstanceUID(header)]
+    seriesNumber = self.getSeriesNumber(header) if header else None
+    entry = self._series.get(seriesNumber)
+    if entry and filename in entry["files"]:
+      entry["files"].remove(filename)
+      if not entry["files"]:
+        del self._series[seriesNumber]
+
+
+class DICOMHeaderCache(ModuleLogicMixin):
+  """ Persistent JSON-lines cache of indexed DICOM header fields.
+
+  Entries are keyed by the path relative to the case directory together with file size and modification time. A
+  file whose size or modification time changed is treated as unknown and will be read again, as is a file whose
+  cached header lacks any of the required fields (e.g. written before further tags were indexed).
+
+  Args:
+    directory (str): directory holding the cache file
+    rootDirectory (str): directory the cached paths are relative to
+    requiredFields (list): header fields every cached header must hold
+  """
+
+  FILE_NAME = "DICOMHeaderCache.jsonl"
+
+  @property
+  def filename(self):
+    return os.path.join(self.directory, self.FILE_NAME)
+
+  def __init__(self, directory, rootDirectory, requiredFields=None):
+    self.directory = directory
+    self.rootDirectory = rootDirectory
+    self.requiredFields = list(requiredFields or [])
+    self._entries = {}
+    self._pending = []
+    self.load()
+
+  def load(self):
+    self._entries = {}
+    if not os.path.exists(self.filename):
+      return
+    lineCount = 0
+    with open(self.filename) as cacheFile:
+      for line in cacheFile:
+        lineCount += 1
+        try:
+          entry = json.loads(line)
+          self._entries[entry["path"]] = (entry["size"], entry["mtime"], entry["header"])
+        except (ValueError, KeyError):
+          logging.debug("Skipping corrupt header cache entry in %s" % self.filename)
+    if lineCount > 2 * len(self._entries):
+      self.compact()
+
+  def _getKey(self, filename):
+    return os.path.relpath(filename, self.rootDirectory)
+
+  def _getSizeAndModificationTime(self, filename):
+    try:
+      stat = os.stat(filename)
+    except OSError:
+      return None, None
+    return stat.st_size, stat.st_mtime
+
+  def get(self, filename):
+    try:
+      size, mtime, header = self._entries[self._getKey(filename)]
+    except KeyError:
+      return None
+    if (size, mtime) != self._getSizeAndModificationTime(filename):
+      return None
+    if any(name not in header for name in self.requiredFields):
+      return None
+    return header
+
+  def put(self, filename, header):
+    size, mtime = self._getSizeAndModificationTime(filename)
+    if size is None:
+      return
+    key = self._getKey(filename)
+    self._entries[key] = (size, mtime, header)
+    self._pending.append({"path": key, "size": size, "mtime": mtime, "header": header})
+
+  def flush(self):
+    if not self._pending:
+      return
+    if not os.path.exists(self.directory):
+      self.createDirectory(self.directory)
+    with open(self.filename, 'a') as cacheFile:
+      for entry in self._pending:
+        cacheFile.write(json.dumps(entry) + "\n")
+    self._pending = []
+
+  def compact(self):
+    self._pending = []
+    with open(self.filename, 'w') as cacheFile:
+      for key, (size, mtime, header) in self._entries.items():
+        cacheFile.write(json.dumps({"path": key, "size": size, "mtime": mtime, "header": header}) + "\n")
@@ -0,0 +1,332 @@
+import os
+import sys
+import time
+import errno
+import struct
+import ctypes
+import ctypes.util
+import logging
+from collections import deque
+
+import ctk
+import qt
+import slicer
+
+from SlicerDevelopmentToolboxUtils.events import SlicerDevelopmentToolboxEvents
+from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
+
+
+class DICOMIndexingWorker(ModuleLogicMixin):
+  """ Background indexing stage for incoming intraop DICOM files.
+
+  Header parsing is done by the headerExtractor off the GUI thread while the GUI thread only collects finished results
+  in order, adds them in batches to the Slicer DICOM database and hands them to the batchHandler. Progress events are
+  limited to a few per second.
+
+  Args:
+    headerReader (callable): reads the header of a single file on the GUI thread. Used if no headerExtractor is
+      available or if the extractor failed.
+    batchHandler (callable): called on the GUI thread with a list of (filename, header) tuples. May return files of
+      the batch that must not be added to the DICOM database, e.g. duplicates of already indexed instances. If it
+      raises, the files of the batch are logged and skipped.
+    finishedHandler (callable): called on the GUI thread once all queued files were handled, even if some of them
+      failed.
+    headerExtractor (DICOMHeaderExtractor): parses batches of files on a thread or process pool
+  """
+
+  ProgressEvent = SlicerDevelopmentToolboxEvents.NewFileIndexedEvent
+
+  BATCH_SIZE = 50
+  POLL_INTERVAL_MS = 20
+  PROGRESS_INTERVAL = 0.25
+
+  @property
+  def busy(self):
+    return len(self._queue) > 0
+
+  def __init__(self, headerReader, batchHandler, finishedHandler, headerExtractor=None):
+    self.headerReader = headerReader
+    self.batchHandler = batchHandler
+    self.finishedHandler = finishedHandler
+    self.headerExtractor = headerExtractor
+    self.indexer = ctk.ctkDICOMIndexer()
+    self.timer = qt.QTimer()
+    self.timer.setInterval(self.POLL_INTERVAL_MS)
+    self.timer.timeout.connect(self.processResults)
+    self._queue = deque()
+    self._queuedFiles = set()
+    self._processing = False
+    self.reset()
+
+  def reset(self):
+    self.timer.stop()
+    for _, _, pending in self._queue:
+      if pending:
+        pending[0].cancel()
+    self._queue.clear()
+    self._queuedFiles.clear()
+    self._total = 0
+    self._processed = 0
+    self._lastProgressTime = 0
+
+  def isQueued(self, filename):
+    return filename in self._queuedFiles
+
+  def enqueue(self, files):
+    """ Queues files for indexing.
+
+    Args:
+      files (list): (filename, header, databaseKnowsFile) tuples. Files with a known header are not parsed again and
+        files already known by the database are not added again.
+    """
+    pendingHeaders = {}
+    unknownFiles = [filename for filename, header, _ in files if header is None]
+    if unknownFiles and self.headerExtractor:
+      for chunk, future in self.headerExtractor.submit(unknownFiles):
+        for position, filename in enumerate(chunk):
+          pendingHeaders[filename] = (future, position)
+    for filename, header, databaseKnowsFile in files:
+      self._queue.append((filename, (header, databaseKnowsFile), pendingHeaders.get(filename)))
+      self._queuedFiles.add(filename)
+    self._total += len(files)
+    if self._queue and not self.timer.isActive():
+      self.timer.start()
+
+  def processResults(self):
+    if self._processing or not self._queue:
+      return
+    self._processing = True
+    try:
+      self._processNextBatch()
+    finally:
+      self._processing = False
+
+  def _processNextBatch(self):
+    batch = []
+    filesToAdd = []
+    while self._queue and len(batch) < self.BATCH_SIZE:
+      filename, (header, databaseKnowsFile), pending = self._queue[0]
+      if pending and not pending[0].done():
+        break
+      self._queue.popleft()
+      self._queuedFiles.discard(filename)
+      header = self._getHeader(filename, header, pending)
+      if header is None:
+        continue
+      if not databaseKnowsFile:
+        filesToAdd.append(filename)
+      batch.append((filename, header))
+    self._processed = self._total - len(self._queue)
+    if batch:
+      try:
+        excludedFiles = self.batchHandler(batch)
+      except Exception as exc:
+        logging.warning("Skipping %d files that could not be indexed (%s): %s" %
+                        (len(batch), ", ".join(filename for filename, _ in batch), exc))
+        excludedFiles = set(filename for filename, _ in batch)
+      if excludedFiles:
+        filesToAdd = [filename for filename in filesToAdd if filename not in excludedFiles]
+    self.addFilesToDatabase(filesToAdd)
+    self.updateProgress(batch[-1][0] if batch else None)
+    if not self._queue:
+      self.timer.stop()
+      self._total = self._processed = 0
+      self.finishedHandler()
+
+  def addFilesToDatabase(self, files):
+    if files:
+      self.indexer.addListOfFiles(slicer.dicomDatabase, files, None)
+
+  def _getHeader(self, filename, header, pending):
+    if header is not None:
+      return header
+    if pending:
+      future, position = pending
+      try:
+        return future.result()[position]
+      except Exception as exc:
+        logging.warning("Header extraction failed for %s, reading it directly: %s" % (filename, exc))
+    try:
+      return self.headerReader(filename)
+    except Exception as exc:
+      logging.warning("Failed to read DICOM header of %s: %s" % (filename, exc))
+      return None
+
+  def updateProgress(self, lastFile):
+    now = time.time()
+    finished = not self._queue
+    if not lastFile or (not finished and now - self._lastProgressTime < self.PROGRESS_INTERVAL):
+      return
+    self._lastProgressTime = now
+    self.invokeEvent(self.ProgressEvent, ["Indexing file %s" % lastFile, self._total, self._processed].__str__())
+
+  def waitForCompletion(self):
+    while self.busy:
+      self.processResults()
+      if self.busy:
+        slicer.app.processEvents()
+        time.sleep(0.005)
+
+  def shutdown(self):
+    self.reset()
+    if self.headerExtractor:
+      self.headerExtractor.shutdown()
+
+
+class IncomingFilePoller(ModuleLogicMixin):
+  """ Reports files landing in a directory while a series is still being received.
+
+  A file is reported once its size stayed the same for two consecutive polls, so that files still being written by the
+  receiver are not picked up.
+
+  Args:
+    directory (str): directory to be watched
+    isKnown (callable): returns True for files that were already handled
+    handler (callable): called with the list of newly completed file names
+  """
+
+  POLL_INTERVAL_MS = 500
+
+  def __init__(self, directory, isKnown, handler):
+    self.directory = directory
+    self.isKnown = isKnown
+    self.handler = handler
+    self._sizes = {}
+    self.timer = qt.QTimer()
+    self.timer.setInterval(self.POLL_INTERVAL_MS)
+    self.timer.timeout.connect(self.poll)
+
+  def start(self):
+    self._sizes = {}
+    self.timer.start()
+
+  def stop(self):
+    self.timer.stop()
+
+  def poll(self):
+    completedFiles = []
+    sizes = {}
+    for filename in os.listdir(self.directory):
+      path = os.path.join(self.directory, filename)
+      if self.isKnown(path) or not os.path.isfile(path):
+        continue
+      size = os.path.getsize(path)
+      if size and self._sizes.get(path) == size:
+        completedFiles.append(filename)
+      else:
+        sizes[path] = size
+    self._sizes = sizes
+    if completedFiles:
+      self.handler(sorted(completedFiles))
+
+
+class InotifyFileWatcher(ModuleLogicMixin):
+  """ Reports files landing in a directory as soon as the receiver closes them, using Linux inotify.
+
+  Every file closed after writing (or moved into the directory) is reported on its own. Once no file arrived for the
+  quiet period, the quietHandler is called so that series can be completed without waiting for the receiver to finish
+  its batch. Files written before the watcher was started are not reported.
+
+  Args:
+    directory (str): directory to be watched
+    isKnown (callable): returns True for files that were already handled
+    handler (callable): called with the list of newly completed file names
+    quietHandler (callable): called without arguments after the quiet period following the last reported file
+    quietPeriod (int): quiet period in milliseconds
+  """
+
+  IN_CLOSE_WRITE = 0x00000008
+  IN_MOVED_TO = 0x00000080
+  IN_Q_OVERFLOW = 0x00004000
+  IN_NONBLOCK = os.O_NONBLOCK
+  IN_CLOEXEC = 0o2000000
+  EVENT_HEADER = struct.Struct("iIII")
+
+  _libc = None
+
+  @classmethod
+  def getLibC(cls):
+    if cls._libc is None:
+      libraryName = ctypes.util.find_library("c")
+      cls._libc = ctypes.CDLL(libraryName or "libc.so.6", use_errno=True)
+    return cls._libc
+
+  @classmethod
+  def isAvailable(cls):
+    if not sys.platform.startswith("linux"):
+      return False
+    try:
+      return hasattr(cls.getLibC(), "inotify_init1")
+    except OSError:
+      return False
+
+  def __init__(self, directory, isKnown, handler, quietHandler=None, quietPeriod=1000):
+    self.directory = directory
+    self.isKnown = isKnown
+    self.handler = handler
+    self.quietHandler = quietHandler
+    self._fd = None
+    self._notifier = None
+    self.quietTimer = qt.QTimer()
+    self.quietTimer.setSingleShot(True)
+    self.quietTimer.setInterval(quietPeriod)
+    self.quietTimer.timeout.connect(self.onQuietPeriodElapsed)
+
+  def start(self):
+    self.stop()
+    libc = self.getLibC()
+    fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+    if fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    path = self.directory.encode(sys.getfilesystemencoding())
+    if libc.inotify_add_watch(fd, path, self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+      error = ctypes.get_errno()
+      os.close(fd)
+      raise OSError(error, "inotify_add_watch failed for %s" % self.directory)
+    self._fd = fd
+    self._notifier = qt.QSocketNotifier(fd, qt.QSocketNotifier.Read)
+    self._notifier.activated.connect(self.readEvents)
+
+  def stop(self):
+    self.quietTimer.stop()
+    if self._notifier:
+      self._notifier.setEnabled(False)
+      self._notifier = None
+    if self._fd is not None:
+      os.close(self._fd)
+      self._fd = None
+
+  def readEvents(self, *args):
+    completedFiles = []
+    while self._fd is not None:
+      try:
+        data = os.read(self._fd, 64 * 1024)
+      except OSError as exc:
+        if exc.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+          logging.warning("Reading inotify events of %s failed: %s" % (self.directory, exc))
+        break
+      if not data:
+        break
+      completedFiles += self.parseEvents(data)
+    completedFiles = [f for f in completedFiles if not self.isKnown(os.path.join(self.directory, f))]
+    if completedFiles:
+      self.handler(sorted(set(completedFiles)))
+      self.quietTimer.start()
+
+  def parseEvents(self, data):
+    filenames = []
+    offset = 0
+    while offset + self.EVENT_HEADER.size <= len(data):
+      _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+      offset += self.EVENT_HEADER.size
+      name = data[offset:offset + length].rstrip(b"\0").decode(sys.getfilesystemencoding(), "replace")
+      offset += length
+      if mask & self.IN_Q_OVERFLOW:
+        logging.warning("inotify queue of %s overflowed, remaining files are imported by the receiver" % self.directory)
+      elif name:
+        filenames.append(name)
+    return filenames
+
+  def onQuietPeriodElapsed(self):
+    if self.quietHandler:
+      self.quietHandler()
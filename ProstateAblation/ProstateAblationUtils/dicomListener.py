@@ -0,0 +1,162 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import qt
+
+from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
+
+from ProstateAblationUtils.dicomHeaders import getHeaderFromDataset
+from ProstateAblationUtils.volumeAssembly import getRescaledPixels
+
+try:
+  from pynetdicom import AE, evt, AllStoragePresentationContexts, VerificationPresentationContexts
+except ImportError:
+  AE = None
+
+
+class InProcessDICOMListener(ModuleLogicMixin):
+  """ C-STORE SCP receiving intraop instances within the Slicer process.
+
+  Received datasets are not parsed again: their header fields and decoded pixels are handed to the receivedHandler
+  together with the file they were written to on a worker thread. Files are written into a hidden sibling directory
+  first and moved into the directory once complete, so that directory watchers never see partial files.
+  All handlers are called on the GUI thread.
+
+  Args:
+    directory (str): directory the received instances are stored in, e.g. the intraop DICOM directory of a case
+    keywords (list): DICOM keywords passed to the receivedHandler
+    receivedHandler (callable): called with a list of (filename, header, pixels) tuples of received instances once
+      their files were written. pixels is None if the pixel data could not be decoded.
+    finishedHandler (callable): called without arguments once all associations were closed and all files written
+    port (int): port to listen on
+    aeTitle (str): application entity title of the listener
+  """
+
+  POLL_INTERVAL_MS = 20
+  INCOMING_DIRECTORY_SUFFIX = ".incoming"
+  SUCCESS = 0x0000
+  OUT_OF_RESOURCES = 0xA700
+
+  @staticmethod
+  def isAvailable():
+    return AE is not None
+
+  @property
+  def incomingDirectory(self):
+    directory = os.path.normpath(self.directory)
+    return os.path.join(os.path.dirname(directory), "." + os.path.basename(directory) + self.INCOMING_DIRECTORY_SUFFIX)
+
+  @property
+  def isRunning(self):
+    return self._server is not None
+
+  def __init__(self, directory, keywords, receivedHandler, finishedHandler, port=11112, aeTitle="PROSTATEABLATION"):
+    if AE is None:
+      raise RuntimeError("pynetdicom is required for the in-process DICOM listener")
+    self.directory = directory
+    self.keywords = list(keywords)
+    self.receivedHandler = receivedHandler
+    self.finishedHandler = finishedHandler
+    self.port = port
+    self.aeTitle = aeTitle
+    self._server = None
+    self._executor = None
+    self._lock = threading.Lock()
+    self._pending = []
+    self._reservedFiles = set()
+    self._openAssociations = 0
+    self._unfinished = False
+    self.timer = qt.QTimer()
+    self.timer.setInterval(self.POLL_INTERVAL_MS)
+    self.timer.timeout.connect(self.processResults)
+
+  def start(self):
+    self.stop()
+    if not os.path.exists(self.incomingDirectory):
+      os.makedirs(self.incomingDirectory)
+    ae = AE(ae_title=self.aeTitle)
+    ae.supported_contexts = AllStoragePresentationContexts + VerificationPresentationContexts
+    handlers = [(evt.EVT_C_STORE, self.onStore), (evt.EVT_ACCEPTED, self.onAssociationAccepted),
+                (evt.EVT_RELEASED, self.onAssociationClosed), (evt.EVT_ABORTED, self.onAssociationClosed)]
+    self._executor = ThreadPoolExecutor(max_workers=1)
+    self._server = ae.start_server(("", self.port), block=False, evt_handlers=handlers)
+    self.timer.start()
+    logging.info("Listening for DICOM data on port %d as %s" % (self.port, self.aeTitle))
+
+  def stop(self):
+    if self._server:
+      self._server.shutdown()
+      self._server = None
+    if self._executor:
+      self._executor.shutdown(wait=True)
+      self._executor = None
+    self.processResults()
+    self.timer.stop()
+
+  def onAssociationAccepted(self, event):
+    with self._lock:
+      self._openAssociations += 1
+
+  def onAssociationClosed(self, event):
+    with self._lock:
+      self._openAssociations = max(0, self._openAssociations - 1)
+
+  def onStore(self, event):
+    """ Called on the association thread for every received instance """
+    try:
+      dataset = event.dataset
+      dataset.file_meta = event.file_meta
+      header = getHeaderFromDataset(dataset, self.keywords)
+    except Exception as exc:
+      logging.warning("Could not read received DICOM instance: %s" % exc)
+      return self.OUT_OF_RESOURCES
+    try:
+      pixels = getRescaledPixels(dataset)
+    except Exception as exc:
+      logging.debug("Could not decode pixels of %s: %s" % (header.get("SOPInstanceUID"), exc))
+      pixels = None
+    with self._lock:
+      filename = self._reserveFilename(str(dataset.get("SOPInstanceUID", "")) or "instance")
+      future = self._executor.submit(self.persist, dataset, filename)
+      self._pending.append((filename, header, pixels, future))
+      self._unfinished = True
+    return self.SUCCESS
+
+  def _reserveFilename(self, sopInstanceUID):
+    filename = os.path.join(self.directory, "%s.dcm" % sopInstanceUID)
+    count = 1
+    while filename in self._reservedFiles or os.path.exists(filename):
+      filename = os.path.join(self.directory, "%s.%d.dcm" % (sopInstanceUID, count))
+      count += 1
+    self._reservedFiles.add(filename)
+    return filename
+
+  def persist(self, dataset, filename):
+    temporaryFile = os.path.join(self.incomingDirectory, os.path.basename(filename))
+    dataset.save_as(temporaryFile, write_like_original=False)
+    os.rename(temporaryFile, filename)
+
+  def processResults(self):
+    with self._lock:
+      persisted, pending = [], []
+      for instance in self._pending:
+        (persisted if instance[3].done() else pending).append(instance)
+      self._pending = pending
+      self._reservedFiles.difference_update(instance[0] for instance in persisted)
+      finished = self._unfinished and not self._pending and not self._openAssociations
+      if finished:
+        self._unfinished = False
+    received = []
+    for filename, header, pixels, future in persisted:
+      try:
+        future.result()
+      except Exception as exc:
+        logging.warning("Could not write received DICOM instance %s: %s" % (filename, exc))
+        continue
+      received.append((filename, header, pixels))
+    if received:
+      self.receivedHandler(received)
+    if finished:
+      self.finishedHandler()
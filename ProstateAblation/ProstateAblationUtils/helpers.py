@@ -95,15 +95,14 @@ class NewCaseSelectionNameWidget(qt.QMessageBox, ModuleWidgetMixin):
     self.notice.text = "" if not os.path.exists(self.newCaseDirectory) else "Note: Directory already exists."
 
 
-class SeriesTypeManager(LogicBase):
+class SeriesTypeManager(LogicBase, metaclass=Singleton):
 
   SeriesTypeManuallyAssignedEvent = vtk.vtkCommand.UserEvent + 2334
 
   MODULE_NAME = constants.MODULE_NAME
 
-  __metaclass__ = Singleton
-
   assignedSeries = {}
+  seriesRegistry = None
 
   def __init__(self):
     LogicBase.__init__(self)
@@ -116,7 +115,13 @@ class SeriesTypeManager(LogicBase):
     try:
       return self.assignedSeries[series]
     except KeyError:
+      pass
+    record = self.seriesRegistry.getByName(series) if self.seriesRegistry else None
+    if record is None:
       return self.computeSeriesType(series)
+    if record.seriesType is None:
+      record.seriesType = self.computeSeriesType(series)
+    return record.seriesType
 
   def checkInSetting(self, series, settingName):
     seriesType = None
@@ -125,7 +130,7 @@ class SeriesTypeManager(LogicBase):
         if keyWord in series:
           seriesType = keyWord
           break
-    elif type(self.getSetting(settingName)) is type(unicode()):
+    elif isinstance(self.getSetting(settingName), str):
       if self.getSetting(settingName) in series:
         seriesType = self.getSetting(settingName)
     return seriesType
@@ -172,12 +177,19 @@ class SeriesTypeManager(LogicBase):
                                                                                self.isCoverTemplate(series) or
                                                                                self.isGuidance(series) or
                                                                                self.isVibe(series))
+  def getPrefetchPriority(self, series):
+    """ Returns the loading priority of a series (lower values first) or None if it is not worth loading ahead """
+    for priority, isType in enumerate([self.isCoverTemplate, self.isGuidance, self.isCoverProstate, self.isVibe]):
+      if isType(series):
+        return priority
+    return None
+
   def isWorkableSeries(self, series):
     return (self.isCoverProstate(series) or self.isCoverTemplate(series) or self.isGuidance(series) or self.isVibe(series))
 
   def _hasSeriesType(self, series, seriesType):
     listItems = [str(item) for item in seriesType]
-    if self.assignedSeries.has_key(series):
+    if series in self.assignedSeries:
       for serieName in listItems:
         if self.assignedSeries[series] == serieName:
           return True
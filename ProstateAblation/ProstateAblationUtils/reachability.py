@@ -0,0 +1,145 @@
+import logging
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import qt
+import slicer
+
+from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
+
+from ProstateAblationUtils.templateHoleIndex import ReachabilityGrid, findNearestPaths
+
+
+class TemplateReachabilityBuilder(ModuleLogicMixin):
+  """ Rasterizes the reach of the registered template on a worker thread.
+
+  The needle paths are copied from the z-frame registration when a build is started, so that the worker never touches
+  MRML nodes. Once built, the nearest hole, depth and in-range flag of any position within the grid are a single array
+  lookup away. Reachable voxels can be shown as label map overlay.
+
+  Args:
+    builtHandler (callable): called on the GUI thread without arguments once a grid was built
+  """
+
+  POLL_INTERVAL_MS = 50
+  VOLUME_NAME = "TemplateReachability"
+  REACHABLE_LABEL = 1
+  LABEL_OPACITY = 0.3
+  # lateral margin around the outermost needle paths in mm
+  REACH_MARGIN = 10.0
+
+  @property
+  def isRunning(self):
+    return self._job is not None
+
+  def __init__(self, builtHandler=None):
+    self.builtHandler = builtHandler
+    self._executor = ThreadPoolExecutor(max_workers=1)
+    self.timer = qt.QTimer()
+    self.timer.setInterval(self.POLL_INTERVAL_MS)
+    self.timer.timeout.connect(self.processResult)
+    self._job = None
+    self.grid = None
+    self.volumeNode = None
+    self.overlayVisible = False
+
+  def reset(self):
+    self.cancel()
+    self.grid = None
+    self.volumeNode = None
+    self.overlayVisible = False
+
+  def cancel(self):
+    if self._job:
+      self._job[0].set()
+    self._job = None
+    self.timer.stop()
+
+  def start(self, zFrameRegistration, spacing, fieldOfView=None):
+    """ Starts rasterizing the needle paths of the template
+
+    Args:
+      zFrameRegistration (ProstateAblationZFrameRegistrationStepLogic): logic holding the registered needle paths
+      spacing (float): voxel size in mm
+      fieldOfView (vtkMRMLVolumeNode): the grid is limited to the bounds of this volume, e.g. the cover template
+    """
+    self.cancel()
+    self.grid = None
+    origins = numpy.array(zFrameRegistration.pathOrigins)
+    vectors = numpy.array(zFrameRegistration.pathVectors)
+    maxDepths = numpy.array(zFrameRegistration.templateMaxDepth, dtype=float)
+    if not len(origins):
+      return
+    bounds = self.getReachBounds(origins, vectors, maxDepths)
+    if fieldOfView:
+      volumeBounds = [0.0] * 6
+      fieldOfView.GetRASBounds(volumeBounds)
+      bounds[0::2] = numpy.maximum(bounds[0::2], volumeBounds[0::2])
+      bounds[1::2] = numpy.minimum(bounds[1::2], volumeBounds[1::2])
+      if numpy.any(bounds[1::2] < bounds[0::2]):
+        logging.info("The template cannot reach into %s" % fieldOfView.GetName())
+        return
+    findPaths = partial(findNearestPaths, origins=origins, vectors=vectors,
+                        holeIndex=zFrameRegistration.templateHoleIndex,
+                        worldToTemplate=zFrameRegistration.worldToTemplate)
+    cancelled = threading.Event()
+    self._job = (cancelled, self._executor.submit(ReachabilityGrid.create, bounds, spacing, findPaths, maxDepths,
+                                                  isCancelled=cancelled.is_set))
+    self.timer.start()
+
+  def getReachBounds(self, origins, vectors, maxDepths):
+    ends = origins + vectors * maxDepths[:, numpy.newaxis]
+    points = numpy.concatenate([origins, ends])
+    bounds = numpy.zeros(6)
+    bounds[0::2] = points.min(axis=0) - self.REACH_MARGIN
+    bounds[1::2] = points.max(axis=0) + self.REACH_MARGIN
+    return bounds
+
+  def processResult(self):
+    if not self._job or not self._job[1].done():
+      return
+    _, future = self._job
+    self._job = None
+    self.timer.stop()
+    try:
+      grid = future.result()
+    except Exception as exc:
+      logging.warning("Could not compute the template reachability: %s" % exc)
+      return
+    if grid is None:
+      return
+    self.grid = grid
+    logging.debug("Template reachability computed for %d voxels" % grid.paths.size)
+    if self.volumeNode and slicer.mrmlScene.IsNodePresent(self.volumeNode):
+      self.updateVolumeNode()
+    if self.overlayVisible:
+      self.setOverlayVisible(True)
+    if self.builtHandler:
+      self.builtHandler()
+
+  def lookup(self, positions):
+    """ Returns path indices, depths, in-range flags and whether inside of the grid, None while no grid is built """
+    return self.grid.lookup(positions) if self.grid else None
+
+  def setOverlayVisible(self, visible):
+    self.overlayVisible = visible
+    if self.volumeNode and not slicer.mrmlScene.IsNodePresent(self.volumeNode):
+      self.volumeNode = None
+    if visible and self.grid:
+      if not self.volumeNode:
+        self.volumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode", self.VOLUME_NAME)
+        self.volumeNode.CreateDefaultDisplayNodes()
+        self.updateVolumeNode()
+      slicer.util.setSliceViewerLayers(label=self.volumeNode, labelOpacity=self.LABEL_OPACITY)
+    elif self.volumeNode:
+      for compositeNode in slicer.util.getNodesByClass("vtkMRMLSliceCompositeNode"):
+        if compositeNode.GetLabelVolumeID() == self.volumeNode.GetID():
+          compositeNode.SetLabelVolumeID(None)
+
+  def updateVolumeNode(self):
+    labels = numpy.where(self.grid.inRange, self.REACHABLE_LABEL, 0).astype(numpy.uint8)
+    slicer.util.updateVolumeFromArray(self.volumeNode, labels)
+    self.volumeNode.SetOrigin(*self.grid.origin)
+    self.volumeNode.SetSpacing(self.grid.spacing, self.grid.spacing, self.grid.spacing)
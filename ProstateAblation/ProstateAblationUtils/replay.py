@@ -0,0 +1,307 @@
+""" Replay of received DICOM data into a directory following the cadence of a scanner.
+
+This module must not import slicer, qt or vtk, so that it can be used from a plain Python interpreter as well.
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import zipfile
+import threading
+
+try:
+  import pydicom
+  from pydicom.errors import InvalidDicomError
+except ImportError:
+  pydicom = None
+
+
+class ReplayTimingProfile(object):
+  """ Cadence of a scanner sending series one after another
+
+  Args:
+    sliceInterval (float): seconds between two slices of a series
+    seriesInterval (float): seconds between the last slice of a series and the first slice of the next one
+    overrides (dict): SeriesDescription substring -> (sliceInterval, seriesInterval) for specific series types, e.g.
+      {"COVER TEMPLATE": (0.05, 30)}. The interval of a series is the pause before it.
+  """
+
+  def __init__(self, sliceInterval=0.1, seriesInterval=15.0, overrides=None):
+    self.sliceInterval = sliceInterval
+    self.seriesInterval = seriesInterval
+    self.overrides = overrides or {}
+
+  def getIntervals(self, description):
+    for substring, intervals in self.overrides.items():
+      if substring.lower() in (description or "").lower():
+        return intervals
+    return self.sliceInterval, self.seriesInterval
+
+  def createTimeline(self, headers):
+    """ Returns the timeline for replaying the given files in the order a scanner would send them
+
+    Args:
+      headers (dict): name -> (SeriesNumber, SeriesDescription, InstanceNumber)
+
+    Returns:
+      list: (offset in seconds, name, SeriesNumber) sorted by offset
+    """
+    series = {}
+    for name, (seriesNumber, description, instanceNumber) in headers.items():
+      series.setdefault(seriesNumber, (description, []))[1].append((instanceNumber, name))
+    timeline = []
+    offset = 0.0
+    for seriesIndex, seriesNumber in enumerate(sorted(series)):
+      description, slices = series[seriesNumber]
+      sliceInterval, seriesInterval = self.getIntervals(description)
+      if seriesIndex:
+        offset += seriesInterval
+      for sliceIndex, (_, name) in enumerate(sorted(slices)):
+        if sliceIndex:
+          offset += sliceInterval
+        timeline.append((offset, name, seriesNumber))
+    return timeline
+
+
+class ReplaySource(object):
+  """ Files to be replayed, identified by their name relative to the source """
+
+  def getNames(self):
+    raise NotImplementedError
+
+  def open(self, name):
+    raise NotImplementedError
+
+  def close(self):
+    pass
+
+  def readHeaders(self, stopEvent=None):
+    """ Returns name -> (SeriesNumber, SeriesDescription, InstanceNumber) for all DICOM files of the source
+
+    Every file is parsed from its opened stream up to the pixel data. Returns None if stopEvent (threading.Event) is
+    set before all files were read.
+    """
+    headers = {}
+    for name in self.getNames():
+      if stopEvent is not None and stopEvent.is_set():
+        return None
+      with self.open(name) as sourceFile:
+        try:
+          dataset = pydicom.dcmread(sourceFile, stop_before_pixels=True,
+                                    specific_tags=["SeriesNumber", "SeriesDescription", "InstanceNumber"])
+        except (InvalidDicomError, EOFError, ValueError) as exc:
+          logging.debug("Not replaying %s: %s" % (name, exc))
+          continue
+      headers[name] = (int(dataset.get("SeriesNumber") or 0), str(dataset.get("SeriesDescription", "")),
+                       int(dataset.get("InstanceNumber") or 0))
+    return headers
+
+
+class ZipReplaySource(ReplaySource):
+  """ Members of a zip archive, e.g. the training sample data, read without extracting the archive """
+
+  def __init__(self, filename):
+    self.zipFile = zipfile.ZipFile(filename, "r")
+
+  def getNames(self):
+    return [info.filename for info in self.zipFile.infolist() if not info.filename.endswith("/") and
+            not os.path.basename(info.filename).startswith(".") and not info.filename.startswith("__MACOSX")]
+
+  def open(self, name):
+    return self.zipFile.open(name)
+
+  def close(self):
+    self.zipFile.close()
+
+
+class DirectoryReplaySource(ReplaySource):
+  """ Files below a directory, e.g. the intraop DICOM directory of an archived case """
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def getNames(self):
+    names = []
+    for root, _, files in os.walk(self.directory):
+      names += [os.path.relpath(os.path.join(root, f), self.directory) for f in files if not f.startswith(".")]
+    return names
+
+  def open(self, name):
+    return open(os.path.join(self.directory, name), "rb")
+
+
+class ArrivalTimeline(object):
+  """ JSON-lines log of the files received for a case.
+
+  Every entry holds the path relative to the case directory, the file size, the SeriesNumber, the modification time of
+  the file as arrival time and the time the file was indexed. Entries are appended, each file is logged once.
+  """
+
+  FILE_NAME = "ArrivalTimeline.jsonl"
+
+  @property
+  def filename(self):
+    return os.path.join(self.directory, self.FILE_NAME)
+
+  def __init__(self, directory, rootDirectory):
+    self.directory = directory
+    self.rootDirectory = rootDirectory
+    self.entries = []
+    self._paths = set()
+    self._pending = []
+    self.load()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, filename):
+    return self._getKey(filename) in self._paths
+
+  def _getKey(self, filename):
+    return os.path.relpath(filename, self.rootDirectory)
+
+  def load(self):
+    self.entries = []
+    self._paths = set()
+    if not os.path.exists(self.filename):
+      return
+    with open(self.filename) as timelineFile:
+      for line in timelineFile:
+        try:
+          entry = json.loads(line)
+          self._paths.add(entry["path"])
+        except (ValueError, KeyError):
+          logging.debug("Skipping corrupt arrival timeline entry in %s" % self.filename)
+          continue
+        self.entries.append(entry)
+
+  def record(self, filename, seriesNumber, indexedTime=None):
+    key = self._getKey(filename)
+    if key in self._paths:
+      return
+    try:
+      stat = os.stat(filename)
+    except OSError:
+      return
+    entry = {"path": key, "size": stat.st_size, "series": seriesNumber, "time": stat.st_mtime,
+             "indexed": indexedTime if indexedTime is not None else time.time()}
+    self._paths.add(key)
+    self.entries.append(entry)
+    self._pending.append(entry)
+
+  def flush(self):
+    if not self._pending:
+      return
+    if not os.path.exists(self.directory):
+      os.makedirs(self.directory)
+    with open(self.filename, 'a') as timelineFile:
+      for entry in self._pending:
+        timelineFile.write(json.dumps(entry) + "\n")
+    self._pending = []
+
+  def createReplayTimeline(self):
+    """ Returns (offset in seconds, path relative to the case directory, SeriesNumber) in order of arrival """
+    entries = sorted(self.entries, key=lambda e: e["time"])
+    if not entries:
+      return []
+    startTime = entries[0]["time"]
+    return [(entry["time"] - startTime, entry["path"], entry["series"]) for entry in entries]
+
+
+class DICOMReplayEngine(object):
+  """ Copies the files of a source into a directory following a timeline, like a scanner pushing to the receiver.
+
+  Files are written on a background thread so that the receiving application keeps running its event loop. If no
+  timeline is given, it is created from the DICOM headers of the source and the timing profile when the replay
+  starts.
+
+  Args:
+    source (ReplaySource): files to be replayed
+    destination (str): directory to write the files into, e.g. the intraop DICOM directory of a case
+    profile (ReplayTimingProfile): cadence used for creating the timeline
+    timeline (list): (offset in seconds, name, SeriesNumber) sorted by offset
+    speed (float): speed multiplier. Can be changed while replaying. 0 writes as fast as possible.
+  """
+
+  WAIT_INTERVAL = 0.05
+
+  @property
+  def isRunning(self):
+    return self._thread is not None and self._thread.is_alive()
+
+  @property
+  def progress(self):
+    return self.numberOfWrittenFiles, len(self.timeline) if self.timeline is not None else None
+
+  def __init__(self, source, destination, profile=None, timeline=None, speed=1.0):
+    if timeline is None and pydicom is None:
+      raise RuntimeError("pydicom is required for creating a replay timeline")
+    self.source = source
+    self.destination = destination
+    self.profile = profile or ReplayTimingProfile()
+    self.timeline = timeline
+    self.speed = speed
+    self.numberOfWrittenFiles = 0
+    self.writtenFiles = []
+    self.firstWriteTimes = {}
+    self.lastWriteTimes = {}
+    self._thread = None
+    self._stopEvent = threading.Event()
+
+  def start(self):
+    self._stopEvent.clear()
+    self._thread = threading.Thread(target=self.run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    self._stopEvent.set()
+
+  def join(self, timeout=None):
+    if self._thread:
+      self._thread.join(timeout)
+
+  def run(self):
+    try:
+      if self.timeline is None:
+        headers = self.source.readHeaders(self._stopEvent)
+        if headers is None:
+          return
+        self.timeline = self.profile.createTimeline(headers)
+      if not os.path.exists(self.destination):
+        os.makedirs(self.destination)
+      replayTime = 0.0
+      lastTime = time.time()
+      for offset, name, seriesNumber in self.timeline:
+        while replayTime < offset:
+          if self._stopEvent.is_set():
+            return
+          if self.speed <= 0:
+            replayTime = offset
+            break
+          self._stopEvent.wait(min(self.WAIT_INTERVAL, (offset - replayTime) / self.speed))
+          now = time.time()
+          replayTime += (now - lastTime) * self.speed
+          lastTime = now
+        if self._stopEvent.is_set():
+          return
+        self.writeFile(name, seriesNumber)
+    finally:
+      self.source.close()
+
+  def writeFile(self, name, seriesNumber=None):
+    filename = os.path.join(self.destination, os.path.basename(name))
+    try:
+      with self.source.open(name) as sourceFile, open(filename, "wb") as destinationFile:
+        shutil.copyfileobj(sourceFile, destinationFile)
+    except (IOError, OSError, KeyError) as exc:
+      logging.warning("Could not replay %s: %s" % (name, exc))
+      return
+    now = time.time()
+    self.firstWriteTimes.setdefault(seriesNumber, now)
+    self.lastWriteTimes[seriesNumber] = now
+    self.writtenFiles.append(filename)
+    self.numberOfWrittenFiles += 1
+    logging.debug("Replayed %s" % filename)
@@ -0,0 +1,103 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import qt
+
+from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
+
+from ProstateAblationUtils.volumeAssembly import decodeSeriesVolume
+
+
+class SeriesPrefetcher(ModuleLogicMixin):
+  """ Decodes series on a worker thread before they are requested.
+
+  Series are decoded one at a time in order of their priority (lower values first). Volume nodes are created by the
+  loadedHandler on the GUI thread.
+
+  Args:
+    loadedHandler (callable): called on the GUI thread with the series, the decoded files, the decoded array and the
+      slice geometries
+  """
+
+  POLL_INTERVAL_MS = 50
+
+  def __init__(self, loadedHandler):
+    self.loadedHandler = loadedHandler
+    self._executor = ThreadPoolExecutor(max_workers=1)
+    self.timer = qt.QTimer()
+    self.timer.setInterval(self.POLL_INTERVAL_MS)
+    self.timer.timeout.connect(self.processResult)
+    self._queue = []
+    self._current = None
+
+  def reset(self):
+    self.timer.stop()
+    self._queue = []
+    if self._current:
+      self._current[2].cancel()
+    self._current = None
+
+  def enqueue(self, series, files, headers, priority):
+    """ Queues a series for decoding. priority may be any sortable value, e.g. a tuple. """
+    if self.isPending(series):
+      return
+    self._queue.append((priority, series, list(files), headers))
+    self._queue.sort(key=lambda job: job[0])
+    self._submitNext()
+
+  def isPending(self, series):
+    return (self._current and self._current[0] == series) or any(job[1] == series for job in self._queue)
+
+  def discard(self, series):
+    self._queue = [job for job in self._queue if job[1] != series]
+
+  def take(self, series, files):
+    """ Returns the decoded (array, geometries) of a series that is being prefetched, waiting for it if needed.
+
+    Series that are only queued or that are being decoded from other files than the given ones are dropped and None is
+    returned, so that the caller loads them directly.
+    """
+    self.discard(series)
+    if not self._current or self._current[0] != series:
+      return None
+    _, decodedFiles, future = self._current
+    self._current = None
+    self._submitNext()
+    if decodedFiles != list(files):
+      future.cancel()
+      return None
+    try:
+      return future.result()
+    except Exception as exc:
+      logging.info("Prefetching %s failed: %s" % (series, exc))
+      return None
+
+  def _submitNext(self):
+    if self._current or not self._queue:
+      return
+    _, series, files, headers = self._queue.pop(0)
+    self._current = (series, files, self._executor.submit(decodeSeriesVolume, files, headers))
+    if not self.timer.isActive():
+      self.timer.start()
+
+  def processResult(self):
+    if not self._current:
+      self.timer.stop()
+      return
+    series, files, future = self._current
+    if not future.done():
+      return
+    self._current = None
+    try:
+      array, geometries = future.result()
+    except Exception as exc:
+      logging.info("Prefetching %s failed: %s" % (series, exc))
+    else:
+      self.loadedHandler(series, files, array, geometries)
+    self._submitNext()
+    if not self._current:
+      self.timer.stop()
+
+  def shutdown(self):
+    self.reset()
+    self._executor.shutdown(wait=False)
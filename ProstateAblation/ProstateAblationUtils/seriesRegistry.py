@@ -0,0 +1,103 @@
+import bisect
+
+
+class SeriesRecord(object):
+  """ Received intraop series
+
+  Attributes:
+    number (int): SeriesNumber
+    description (str): SeriesDescription
+    name (str): "<number>: <description>" as shown to the user and used as series identifier
+    files (list): loadable files of the series
+    seriesType (str): series type computed by the SeriesTypeManager, None until computed
+    patientID (str): PatientID
+    patientName (str): PatientName
+  """
+
+  __slots__ = ("number", "description", "name", "files", "seriesType", "patientID", "patientName")
+
+  def __init__(self, number, description, patientID=None, patientName=None):
+    self.number = number
+    self.description = description
+    self.name = "{}: {}".format(number, description)
+    self.files = []
+    self.seriesType = None
+    self.patientID = patientID
+    self.patientName = patientName
+
+  def __repr__(self):
+    return "SeriesRecord(%r)" % self.name
+
+
+class SeriesRegistry(object):
+  """ Received series ordered by SeriesNumber with constant time lookup by number and by name. """
+
+  @property
+  def names(self):
+    if self._names is None:
+      self._names = [self._records[number].name for number in self._numbers]
+    return self._names
+
+  @property
+  def loadableRecords(self):
+    return [record for record in self if record.files]
+
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self._numbers = []
+    self._records = {}
+    self._recordsByName = {}
+    self._names = None
+
+  def __len__(self):
+    return len(self._numbers)
+
+  def __iter__(self):
+    return (self._records[number] for number in self._numbers)
+
+  def __reversed__(self):
+    return (self._records[number] for number in reversed(self._numbers))
+
+  def __contains__(self, name):
+    return name in self._recordsByName
+
+  def add(self, number, description, patientID=None, patientName=None):
+    """ Returns the record of the series with the given number, creating it if it does not exist yet """
+    try:
+      return self._records[number]
+    except KeyError:
+      pass
+    record = SeriesRecord(number, description, patientID, patientName)
+    bisect.insort(self._numbers, number)
+    self._records[number] = record
+    self._recordsByName[record.name] = record
+    self._names = None
+    return record
+
+  def insert(self, record):
+    if record.number in self._records:
+      raise ValueError("Series %d already exists" % record.number)
+    bisect.insort(self._numbers, record.number)
+    self._records[record.number] = record
+    self._recordsByName[record.name] = record
+    self._names = None
+
+  def get(self, number):
+    return self._records.get(number)
+
+  def getByName(self, name):
+    return self._recordsByName.get(name)
+
+  def getFiles(self, name):
+    record = self._recordsByName.get(name)
+    return record.files if record else []
+
+  def remove(self, number):
+    record = self._records.pop(number, None)
+    if record:
+      del self._numbers[bisect.bisect_left(self._numbers, number)]
+      del self._recordsByName[record.name]
+      self._names = None
+    return record
@@ -1,12 +1,24 @@
 import os, logging
+from collections import OrderedDict
 import vtk, ctk, ast, qt
 import numpy
 import slicer
 from ProstateAblationUtils.sessionData import SessionData
 from ProstateAblationUtils.constants import ProstateAblationConstants as constants
 from ProstateAblationUtils.steps.plugins.targetsDefinition import TargetsDefinitionPlugin
-from ProstateAblationUtils.steps.plugins.targetsDefinitionTable import ZFrameGuidanceComputation
+from ProstateAblationUtils.steps.plugins.targetsDefinitionTable import ZFrameGuidanceRegistry
 from ProstateAblationUtils.helpers import SeriesTypeManager
+from ProstateAblationUtils.dicomIndex import IntraopSeriesIndex, DICOMHeaderCache
+from ProstateAblationUtils.dicomHeaders import DICOMHeaderExtractor
+from ProstateAblationUtils.dicomIngest import DICOMIndexingWorker, IncomingFilePoller, InotifyFileWatcher
+from ProstateAblationUtils.dicomListener import InProcessDICOMListener
+from ProstateAblationUtils.volumeCache import SeriesVolumeCache
+from ProstateAblationUtils.voxelCache import SeriesVoxelCache
+from ProstateAblationUtils.seriesPrefetch import SeriesPrefetcher
+from ProstateAblationUtils.reachability import TemplateReachabilityBuilder
+from ProstateAblationUtils.seriesRegistry import SeriesRegistry
+from ProstateAblationUtils.replay import ArrivalTimeline
+from ProstateAblationUtils.volumeAssembly import ProgressiveSeriesAssembler, loadSeriesVolume, createSeriesVolumeNode
 
 from SlicerDevelopmentToolboxUtils.exceptions import DICOMValueError, UnknownSeriesError
 from SlicerDevelopmentToolboxUtils.constants import DICOMTAGS, FileExtension, STYLE
@@ -42,6 +54,9 @@ class ProstateAblationSession(StepBasedSession):
 
   AffectedAreaDisplayChangedEvent = vtk.vtkCommand.UserEvent + 165
 
+  SeriesAssemblyProgressEvent = vtk.vtkCommand.UserEvent + 166
+  SeriesQuarantineChangedEvent = vtk.vtkCommand.UserEvent + 167
+
   SeriesTypeManuallyAssignedEvent = SeriesTypeManager.SeriesTypeManuallyAssignedEvent
 
   MODULE_NAME = constants.MODULE_NAME
@@ -62,6 +77,86 @@ class ProstateAblationSession(StepBasedSession):
     # was outputDir
     return os.path.join(self.directory, "ProstateAblationOutputs")
 
+  @property
+  def headerCache(self):
+    self._headerCache = getattr(self, "_headerCache", None)
+    if not self.directory:
+      return None
+    if not self._headerCache or self._headerCache.directory != self.outputDirectory:
+      self._headerCache = DICOMHeaderCache(self.outputDirectory, self.directory,
+                                           requiredFields=IntraopSeriesIndex.HEADER_TAGS.keys())
+    return self._headerCache
+
+  @property
+  def voxelCache(self):
+    self._voxelCache = getattr(self, "_voxelCache", None)
+    if not self.directory:
+      return None
+    if not self._voxelCache or os.path.dirname(self._voxelCache.directory) != self.outputDirectory:
+      self._voxelCache = SeriesVoxelCache(self.outputDirectory)
+    return self._voxelCache
+
+  @property
+  def arrivalTimeline(self):
+    self._arrivalTimeline = getattr(self, "_arrivalTimeline", None)
+    if not self.directory or not self.recordArrivalTimeline:
+      return None
+    if not self._arrivalTimeline or self._arrivalTimeline.directory != self.outputDirectory:
+      self._arrivalTimeline = ArrivalTimeline(self.outputDirectory, self.directory)
+    return self._arrivalTimeline
+
+  @property
+  def seriesList(self):
+    return self.seriesRegistry.names
+
+  @property
+  def streamingIngest(self):
+    return str(self.getSetting("Streaming_Ingest")).lower() == "true"
+
+  @property
+  def replaceDuplicateInstances(self):
+    return str(self.getSetting("Duplicate_Instances")).lower() == "replace"
+
+  @property
+  def useInotifyWatcher(self):
+    return str(self.getSetting("Intraop_File_Watcher")).lower() == "inotify"
+
+  @property
+  def useInProcessListener(self):
+    return str(self.getSetting("Intraop_Listener")).lower() == "inprocess"
+
+  @property
+  def inProcessListenerPort(self):
+    try:
+      return int(self.getSetting("Intraop_Listener_Port"))
+    except (TypeError, ValueError):
+      return 11112
+
+  @property
+  def incomingQuietPeriod(self):
+    try:
+      return int(self.getSetting("Intraop_Quiet_Period_Ms"))
+    except (TypeError, ValueError):
+      return 1000
+
+  @property
+  def recordArrivalTimeline(self):
+    return str(self.getSetting("Record_Arrival_Timeline")).lower() == "true"
+
+  @property
+  def seriesVolumeBudget(self):
+    try:
+      return int(float(self.getSetting("Series_Volume_Budget_MB")) * 1024 * 1024)
+    except (TypeError, ValueError):
+      return 0
+
+  @property
+  def reachabilitySpacing(self):
+    try:
+      return float(self.getSetting("Reachability_Spacing"))
+    except (TypeError, ValueError):
+      return 0
+
   @property
   def approvedCoverTemplate(self):
     try:
@@ -84,7 +179,9 @@ class ProstateAblationSession(StepBasedSession):
     self._zFrameRegistrationSuccessful = value
     if self._zFrameRegistrationSuccessful:
       self.save()
+      self.guidanceRegistry.invalidateAll()
       self.invokeEvent(self.ZFrameRegistrationSuccessfulEvent)
+      self.updateReachability()
 
   @property
   def currentSeries(self):
@@ -96,7 +193,7 @@ class ProstateAblationSession(StepBasedSession):
     if series == self.currentSeries:
       return
     print("set current Series on session")
-    if series and series not in self.seriesList :
+    if series and series not in self.seriesRegistry:
       raise UnknownSeriesError("Series %s is unknown" % series)
     self._currentSeries = series
     self.invokeEvent(self.CurrentSeriesChangedEvent, series)
@@ -108,14 +205,33 @@ class ProstateAblationSession(StepBasedSession):
     else:
       return self.getOrCreateVolumeForSeries(self.currentSeries)
 
+  @property
+  def currentSeriesPreviewVolume(self):
+    if not self.currentSeries:
+      return None
+    else:
+      return self.getOrCreateVolumeForSeries(self.currentSeries, partial=True)
+
   def __init__(self):
     StepBasedSession.__init__(self)
+    self.seriesRegistry = SeriesRegistry()
     self.seriesTypeManager = SeriesTypeManager()
+    self.seriesTypeManager.seriesRegistry = self.seriesRegistry
     self.seriesTypeManager.addEventObserver(self.seriesTypeManager.SeriesTypeManuallyAssignedEvent,
                                             lambda caller, event: self.invokeEvent(self.SeriesTypeManuallyAssignedEvent))
+    self.guidanceRegistry = ZFrameGuidanceRegistry(self)
     self.targetingPlugin = TargetsDefinitionPlugin(self)
-    self.needlePathCaculator = ZFrameGuidanceComputation(self)
     self.segmentationEditor = slicer.qMRMLSegmentEditorWidget()
+    self.seriesIndex = IntraopSeriesIndex()
+    headerExtractor = DICOMHeaderExtractor(IntraopSeriesIndex.HEADER_TAGS.keys())
+    self.indexingWorker = DICOMIndexingWorker(self.seriesIndex.readHeader, self.onFilesIndexed,
+                                              self.onIndexingFinished,
+                                              headerExtractor=headerExtractor if headerExtractor.isAvailable else None)
+    self.indexingWorker.addEventObserver(self.indexingWorker.ProgressEvent, self.onIndexingProgress)
+    self.seriesPrefetcher = SeriesPrefetcher(self.onSeriesPrefetched)
+    self.reachability = TemplateReachabilityBuilder()
+    self.incomingFileWatcher = None
+    self.inProcessListener = None
     self.resetAndInitializeMembers()
     self.resetAndInitializedTargetsAndSegments()
   
@@ -126,14 +242,36 @@ class ProstateAblationSession(StepBasedSession):
     self.data = SessionData()
     self.trainingMode = False
     self.resetIntraopDICOMReceiver()
-    self.loadableList = {}
-    self.seriesList = []
-    self.alreadyLoadedSeries = {}
+    self.resetIndexing()
+    self.seriesRegistry.clear()
+    self.quarantinedSeries = OrderedDict()
+    self.quarantineReferences = {}
+    self.seriesPrefetcher = getattr(self, "seriesPrefetcher", None)
+    if self.seriesPrefetcher:
+      self.seriesPrefetcher.reset()
+    self.reachability = getattr(self, "reachability", None)
+    if self.reachability:
+      self.reachability.reset()
+    self.alreadyLoadedSeries = SeriesVolumeCache(self.seriesVolumeBudget)
     self._currentSeries = None
     self.retryMode = False
     self.lastSelectedModelIndex = None
     self.previousStep = None
 
+  def resetIndexing(self):
+    self.indexingWorker.reset()
+    self.seriesIndex.clear()
+    self._indexedFiles = []
+    self._indexedSeries = set()
+    self._newSeries = []
+    self._pendingNewSeries = []
+    self._receptionFinished = False
+    self._receivedPixels = {}
+    for assembler in getattr(self, "seriesAssemblers", {}).values():
+      if assembler.volumeNode and not assembler.finalized:
+        slicer.mrmlScene.RemoveNode(assembler.volumeNode)
+    self.seriesAssemblers = {}
+
   def resetAndInitializedTargetsAndSegments(self):
     self.displayForTargets = dict()
     self.needleTypeForTargets = dict()
@@ -358,12 +496,14 @@ class ProstateAblationSession(StepBasedSession):
       # http://viewvc.slicer.org/viewvc.cgi/NAMICSandBox/trunk/IGTLoadableModules/ProstateNav/TransPerinealProstateCryoTemplate/vtkMRMLTransPerinealProstateCryoTemplateNode.cxx?revision=8043&view=markup
       offsetFromTip = 5.0 #unit mm
       coneHeight = 5.0
-      for targetIndex in range(targetingNode.GetNumberOfFiducials()):
-        if self.displayForTargets.get(targetingNode.GetNthMarkupID(targetIndex)) == qt.Qt.Checked:
+      displayedTargets = [targetIndex for targetIndex in range(targetingNode.GetNumberOfFiducials())
+                          if self.displayForTargets.get(targetingNode.GetNthMarkupID(targetIndex)) == qt.Qt.Checked]
+      guidance = self.guidanceRegistry.getOrCreate(targetingNode)
+      nearestPaths = dict(zip(displayedTargets, guidance.getNearestPaths(displayedTargets)))
+      for targetIndex in displayedTargets:
+        (start, end, indexX, indexY, depth, inRange) = nearestPaths[targetIndex]
+        if start is not None:
           affectedBallAreaRadius = self.GetIceBallRadius(self.needleTypeForTargets.get(targetingNode.GetNthMarkupID(targetIndex)))  # unit mm
-          targetPosition = [0.0,0.0,0.0]
-          targetingNode.GetNthFiducialPosition(targetIndex, targetPosition)
-          (start, end, indexX, indexY, depth, inRange) = self.needlePathCaculator.computeNearestPath(targetPosition)
           needleDirection = (numpy.array(end) - numpy.array(start))/numpy.linalg.norm(numpy.array(end)-numpy.array(start))
           cone = vtk.vtkConeSource()
           cone.SetRadius(1.5)
@@ -426,6 +566,18 @@ class ProstateAblationSession(StepBasedSession):
   def setupLoadedTransform(self):
     self._zFrameRegistrationSuccessful = True
     self.steps[1].applyZFrameTransform()
+    self.guidanceRegistry.invalidateAll()
+    self.updateReachability()
+
+  def updateReachability(self):
+    if not self.reachabilitySpacing or not self.zFrameRegistrationSuccessful:
+      self.reachability.cancel()
+      return
+    self.reachability.start(self.guidanceRegistry.zFrameRegistration, self.reachabilitySpacing,
+                            fieldOfView=self.approvedCoverTemplate)
+
+  def onShowReachabilityToggled(self, checked):
+    self.reachability.setOverlayVisible(checked)
 
   def setupLoadedTargets(self):
     if self.data.intraOpTargets:
@@ -439,20 +591,60 @@ class ProstateAblationSession(StepBasedSession):
     logging.info("Starting DICOM Receiver for intra-procedural data")
     if not self.data.completed:
       self.resetIntraopDICOMReceiver()
-      self.intraopDICOMReceiver = SmartDICOMReceiver(self.intraopDICOMDirectory)
-      self._observeIntraopDICOMReceiverEvents()
-      self.intraopDICOMReceiver.start(not (self.trainingMode or self.data.completed))
+      if self.useInProcessListener and not self.trainingMode and InProcessDICOMListener.isAvailable():
+        self.startInProcessDICOMListener()
+      else:
+        if self.useInProcessListener and not self.trainingMode:
+          logging.warning("pynetdicom is not available, receiving intraop data with storescp instead")
+        self.intraopDICOMReceiver = SmartDICOMReceiver(self.intraopDICOMDirectory)
+        self._observeIntraopDICOMReceiverEvents()
+        self.intraopDICOMReceiver.start(not (self.trainingMode or self.data.completed))
     else:
       self.invokeEvent(SlicerDevelopmentToolboxEvents.StoppedEvent)
     self.importDICOMSeries(self.getFileList(self.intraopDICOMDirectory))
+    if not self.data.completed and (self.streamingIngest or self.useInotifyWatcher) and not self.trainingMode and \
+        not self.inProcessListener:
+      self.incomingFileWatcher = self.createIncomingFileWatcher()
+      self.incomingFileWatcher.start()
     if self.intraopDICOMReceiver:
       self.intraopDICOMReceiver.forceStatusChangeEventUpdate()
 
+  def startInProcessDICOMListener(self):
+    self.inProcessListener = InProcessDICOMListener(self.intraopDICOMDirectory, IntraopSeriesIndex.HEADER_TAGS.keys(),
+                                                    self.onInstancesReceived, self.onIncomingDataQuiet,
+                                                    port=self.inProcessListenerPort,
+                                                    aeTitle=self.getSetting("Intraop_Listener_AE_Title") or
+                                                            "PROSTATEABLATION")
+    try:
+      self.inProcessListener.start()
+    except Exception as exc:
+      slicer.util.errorDisplay("Could not start the DICOM listener on port %d: %s" % (self.inProcessListenerPort, exc))
+      self.inProcessListener = None
+      return
+    self.onDICOMReceiverStatusChanged(None, None, "Waiting for incoming DICOM data on port %d" %
+                                      self.inProcessListenerPort)
+
   def resetIntraopDICOMReceiver(self):
     self.intraopDICOMReceiver = getattr(self, "intraopDICOMReceiver", None)
     if self.intraopDICOMReceiver:
       self.intraopDICOMReceiver.stop()
       self.intraopDICOMReceiver.removeEventObservers()
+    self.incomingFileWatcher = getattr(self, "incomingFileWatcher", None)
+    if self.incomingFileWatcher:
+      self.incomingFileWatcher.stop()
+      self.incomingFileWatcher = None
+    self.inProcessListener = getattr(self, "inProcessListener", None)
+    if self.inProcessListener:
+      self.inProcessListener.stop()
+      self.inProcessListener = None
+
+  def createIncomingFileWatcher(self):
+    if self.useInotifyWatcher:
+      if InotifyFileWatcher.isAvailable():
+        return InotifyFileWatcher(self.intraopDICOMDirectory, self.isFileIndexed, self.onIncomingFilesCompleted,
+                                  self.onIncomingDataQuiet, self.incomingQuietPeriod)
+      logging.warning("inotify is not available on this system, polling %s instead" % self.intraopDICOMDirectory)
+    return IncomingFilePoller(self.intraopDICOMDirectory, self.isFileIndexed, self.onIncomingFilesCompleted)
 
   def _observeIntraopDICOMReceiverEvents(self):
     self.intraopDICOMReceiver.addEventObserver(self.intraopDICOMReceiver.IncomingDataReceiveFinishedEvent,
@@ -469,127 +661,348 @@ class ProstateAblationSession(StepBasedSession):
 
   @vtk.calldata_type(vtk.VTK_STRING)
   def onDICOMSeriesReceived(self, caller, event, callData):
-    self.importDICOMSeries(ast.literal_eval(callData))
+    self._receptionFinished = True
+    self.importDICOMSeries(ast.literal_eval(callData), wait=False)
+    if not self.indexingWorker.busy:
+      self.finalizeSeriesAssemblers()
     if self.trainingMode is True:
       self.resetIntraopDICOMReceiver()
 
-  def importDICOMSeries(self, newFileList):
-    indexer = ctk.ctkDICOMIndexer()
+  def isFileIndexed(self, filename):
+    return filename in self.seriesIndex or self.indexingWorker.isQueued(filename)
+
+  def onIncomingFilesCompleted(self, newFileList):
+    self.importDICOMSeries(newFileList, wait=False)
+
+  def onInstancesReceived(self, instances):
+    # the files were written already, the worker indexes them and adds them to the DICOM database
+    self._receivedPixels.update((filename, pixels) for filename, _, pixels in instances if pixels is not None)
+    self.indexingWorker.enqueue([(filename, header, False) for filename, header, _ in instances])
 
-    newSeries = []
-    for currentIndex, currentFile in enumerate(newFileList, start=1):
-      self.invokeEvent(SlicerDevelopmentToolboxEvents.NewFileIndexedEvent,
-                       ["Indexing file %s" % currentFile, len(newFileList), currentIndex].__str__())
-      slicer.app.processEvents()
+  def onIncomingDataQuiet(self):
+    self._receptionFinished = True
+    if not self.indexingWorker.busy:
+      self.finalizeSeriesAssemblers()
+
+  def importDICOMSeries(self, newFileList, wait=True):
+    files = []
+    seen = set()
+    for currentFile in newFileList:
       currentFile = os.path.join(self.intraopDICOMDirectory, currentFile)
-      indexer.addFile(slicer.dicomDatabase, currentFile, None)
-      series = self.makeSeriesNumberDescription(currentFile)
-      if series not in self.seriesList:
-        if not series.split(": ")[0] == '__TAG_NOT_IN_INSTANCE__':
-          self.seriesList.append(series)
-          newSeries.append(series)
-          self.loadableList[series] = self.createLoadableFileListForSeries(series)
-    self.seriesList = sorted(self.seriesList, key=lambda s: int(s.split(": ")[0]))
-
-    if len(newFileList):
-      self.verifyPatientIDEquality(newFileList)
-      self.invokeEvent(self.NewImageSeriesReceivedEvent, newSeries.__str__())
-
-  def verifyPatientIDEquality(self, receivedFiles):
-    seriesNumberPatientID = self.getAdditionalInformationForReceivedSeries(receivedFiles)
-    dicomFileName = self.getPatientIDValidationSource()
-    if not dicomFileName:
-      return
-    currentInfo = self.getPatientInformation(dicomFileName)
-    currentID = currentInfo["PatientID"]
-    patientName = currentInfo["PatientName"]
-    for seriesNumber, receivedInfo in seriesNumberPatientID.items():
-      patientID = receivedInfo["PatientID"]
-      if patientID is not None and patientID != currentID:
-        m = 'WARNING:\n' \
-            'Current case:\n' \
-            '  Patient ID: {0}\n' \
-            '  Patient Name: {1}\n' \
-            'Received image\n' \
-            '  Patient ID: {2}\n' \
-            '  Patient Name : {3}\n\n' \
-            'Do you want to keep this series? '.format(currentID, patientName, patientID, receivedInfo["PatientName"])
-        if not slicer.util.confirmYesNoDisplay(m, title="Patient IDs Not Matching", windowTitle="ProstateAblation"):
-          self.deleteSeriesFromSeriesList(seriesNumber)
+      if currentFile in seen or currentFile in self.seriesIndex or self.indexingWorker.isQueued(currentFile):
+        continue
+      seen.add(currentFile)
+      header = self.getCachedHeader(currentFile)
+      databaseKnowsFile = header is not None and bool(slicer.dicomDatabase.seriesForFile(currentFile))
+      files.append((currentFile, header, databaseKnowsFile))
+    self.indexingWorker.enqueue(files)
+    if wait:
+      self.indexingWorker.waitForCompletion()
+
+  @vtk.calldata_type(vtk.VTK_STRING)
+  def onIndexingProgress(self, caller, event, callData):
+    self.invokeEvent(SlicerDevelopmentToolboxEvents.NewFileIndexedEvent, callData)
+
+  def onFilesIndexed(self, indexedFiles):
+    duplicates = set()
+    replacedSeries = set()
+    arrivalTimeline = self.arrivalTimeline
+    for currentFile, header in indexedFiles:
+      receivedPixels = self._receivedPixels.pop(currentFile, None)
+      if self.headerCache and self.headerCache.get(currentFile) is None:
+        self.headerCache.put(currentFile, header)
+      duplicate = self.seriesIndex.getDuplicate(currentFile, header)
+      header = self.seriesIndex.addHeader(currentFile, header, replaceDuplicate=self.replaceDuplicateInstances)
+      self._indexedFiles.append(currentFile)
+      seriesNumber = self.seriesIndex.getSeriesNumber(header)
+      if arrivalTimeline is not None:
+        arrivalTimeline.record(currentFile, seriesNumber)
+      if seriesNumber is None:
+        continue
+      if duplicate:
+        if self.onDuplicateInstanceReceived(currentFile, duplicate, seriesNumber):
+          replacedSeries.add(seriesNumber)
+        else:
+          duplicates.add(currentFile)
+        continue
+      record = self.seriesRegistry.get(seriesNumber)
+      if record is None:
+        try:
+          self.makeSeriesNumberDescription(currentFile)
+        except DICOMValueError as exc:
+          logging.warning("Skipping %s: %s" % (currentFile, exc))
+          continue
+        if any(r.number == seriesNumber for r in self.quarantinedSeries.values()):
+          continue
+        record = self.seriesRegistry.add(seriesNumber, header["SeriesDescription"], header["PatientID"],
+                                         header["PatientName"])
+        self._newSeries.append(record.name)
+      series = record.name
+      self._indexedSeries.add(series)
+      if self.isSeriesAssembledProgressively(series):
+        self.getOrCreateSeriesAssembler(series).addSlice(currentFile, header, receivedPixels)
+    for series, assembler in self.seriesAssemblers.items():
+      lastUpdateTime = assembler.lastUpdateTime
+      if assembler.update() and assembler.lastUpdateTime != lastUpdateTime:
+        self.invokeEvent(self.SeriesAssemblyProgressEvent, series)
+    for seriesNumber in replacedSeries:
+      # includes files of the batch the database knew before their series was removed from it
+      self.indexingWorker.addFilesToDatabase(self.seriesIndex.getFileList(seriesNumber))
+    return duplicates
+
+  def onDuplicateInstanceReceived(self, currentFile, duplicate, seriesNumber):
+    """ Returns True if currentFile replaced the duplicate, which is then removed from the database and deleted """
+    if not self.replaceDuplicateInstances:
+      logging.info("Skipping %s, the same instance was received before as %s" % (currentFile, duplicate))
+      return False
+    logging.info("Replacing %s by %s holding the same instance" % (duplicate, currentFile))
+    seriesInstanceUID = slicer.dicomDatabase.seriesForFile(duplicate) if slicer.dicomDatabase else None
+    if seriesInstanceUID:
+      # single instances cannot be removed from the database, the series is added again once the batch was indexed
+      slicer.dicomDatabase.removeSeries(seriesInstanceUID)
+    if os.path.exists(duplicate):
+      os.remove(duplicate)
+    record = self.seriesRegistry.get(seriesNumber)
+    if record:
+      self._indexedSeries.add(record.name)
+    return True
+
+  def isSeriesAssembledProgressively(self, series):
+    if not self.streamingIngest or self.trainingMode or series in self.alreadyLoadedSeries:
+      return False
+    if not (self.incomingFileWatcher or self.inProcessListener) or not self.seriesTypeManager.isWorkableSeries(series):
+      return False
+    assembler = self.seriesAssemblers.get(series)
+    return assembler is None or (assembler.valid and not assembler.finalized)
+
+  def getOrCreateSeriesAssembler(self, series):
+    try:
+      return self.seriesAssemblers[series]
+    except KeyError:
+      assembler = self.seriesAssemblers[series] = ProgressiveSeriesAssembler(series)
+      return assembler
+
+  def isSeriesBeingAssembled(self, series):
+    assembler = self.seriesAssemblers.get(series)
+    return assembler is not None and not assembler.finalized
+
+  def finalizeSeriesAssemblers(self):
+    self._receptionFinished = False
+    for series, assembler in self.seriesAssemblers.items():
+      volume = assembler.finalize()
+      if volume:
+        self.alreadyLoadedSeries[series] = volume
+        self.storeInVoxelCache(series, assembler.files, volume)
+      elif assembler.volumeNode:
+        slicer.mrmlScene.RemoveNode(assembler.volumeNode)
+    self.seriesAssemblers = {}
+    self.alreadyLoadedSeries.evict(self.getPinnedVolumes())
+    pendingNewSeries, self._pendingNewSeries = self._pendingNewSeries, []
+    pendingNewSeries = [series for series in pendingNewSeries if series in self.seriesRegistry]
+    if pendingNewSeries:
+      self.announceNewImageSeries(pendingNewSeries)
+
+  def onIndexingFinished(self):
+    receivedFiles, receivedSeries, newSeries = self._indexedFiles, self._indexedSeries, self._newSeries
+    for series in receivedSeries:
+      self.seriesRegistry.getByName(series).files = self.createLoadableFileListForSeries(series)
+    self._indexedFiles, self._indexedSeries, self._newSeries = [], set(), []
+    if self._receptionFinished:
+      self.finalizeSeriesAssemblers()
+    if self.headerCache:
+      self.headerCache.flush()
+    if self.arrivalTimeline:
+      self.arrivalTimeline.flush()
+
+    if len(receivedFiles):
+      quarantined = self.verifyPatientIDEquality(receivedSeries)
+      newSeries = [series for series in newSeries if series not in quarantined]
+      # steps act on announced series, so that series still being assembled are announced once they are complete
+      self._pendingNewSeries += [series for series in newSeries if self.isSeriesBeingAssembled(series)]
+      newSeries = [series for series in newSeries if series not in self._pendingNewSeries]
+      self.announceNewImageSeries(newSeries)
+
+  def getCachedHeader(self, filename):
+    header = self.seriesIndex.getHeader(filename)
+    if header is None and self.headerCache:
+      header = self.headerCache.get(filename)
+    return header if self.seriesIndex.isHeaderComplete(header) else None
+
+  def verifyPatientIDEquality(self, receivedSeries):
+    """ Moves received series of a different patient than the current case into the quarantine
+
+    Returns:
+      list of quarantined series
+    """
+    currentRecord = self.getPatientIDValidationSource()
+    if not currentRecord:
+      return []
+    quarantined = []
+    for series in receivedSeries:
+      record = self.seriesRegistry.getByName(series)
+      if record.patientID is not None and record.patientID != currentRecord.patientID:
+        self.quarantineSeries(record, currentRecord)
+        quarantined.append(series)
+    if quarantined:
+      self.invokeEvent(self.SeriesQuarantineChangedEvent, quarantined.__str__())
+    return quarantined
 
   def getPatientIDValidationSource(self):
+    """ Returns the record of the series the patient ID of received series is compared with """
     # TODO: For loading case purposes it would be nice to keep track which series were accepted
-    if len(self.loadableList.keys()) > 1:
-      keylist = self.loadableList.keys()
-      keylist.sort(key=lambda x: int(x.split(": ")[0]))
-      return self.loadableList[keylist[0]][0]
-    else:
-      return None
-
-  def getOrCreateVolumeForSeries(self, series):
+    loadableRecords = self.seriesRegistry.loadableRecords
+    return loadableRecords[0] if len(loadableRecords) > 1 else None
+
+  def quarantineSeries(self, record, referenceRecord):
+    logging.warning("Patient ID of series %s does not match the current case. Moving it to quarantine." % record.name)
+    self.quarantinedSeries[record.name] = self.seriesRegistry.remove(record.number)
+    self.quarantineReferences[record.name] = (referenceRecord.patientID, referenceRecord.patientName)
+    self.unloadSeries(record.name)
+
+  def unloadSeries(self, series):
+    self.seriesPrefetcher.discard(series)
+    for volume in [self.alreadyLoadedSeries.pop(series), getattr(self.seriesAssemblers.pop(series, None),
+                                                                 "volumeNode", None)]:
+      if volume and slicer.mrmlScene.IsNodePresent(volume):
+        slicer.mrmlScene.RemoveNode(volume)
+
+  def getQuarantineReference(self, series):
+    """ Returns (patientID, patientName) of the current case at the time the series was quarantined or None """
+    return self.quarantineReferences.get(series)
+
+  def acceptQuarantinedSeries(self, series):
+    record = self.quarantinedSeries.pop(series)
+    self.quarantineReferences.pop(series, None)
+    record.files = self.seriesIndex.getFileList(record.number)
+    self.seriesRegistry.insert(record)
+    self.invokeEvent(self.SeriesQuarantineChangedEvent, [series].__str__())
+    self.announceNewImageSeries([series])
+
+  def rejectQuarantinedSeries(self, series):
+    record = self.quarantinedSeries.pop(series)
+    self.quarantineReferences.pop(series, None)
+    for seriesFile in self.seriesIndex.removeSeries(record.number):
+      logging.debug("removing {} from filesystem".format(seriesFile))
+      os.remove(seriesFile)
+    self.invokeEvent(self.SeriesQuarantineChangedEvent, [series].__str__())
+
+  def getOrCreateVolumeForSeries(self, series, partial=False):
+    """ Returns the volume of the series, loading it if needed.
+
+    While a series is still being assembled from received slices, its volume is incomplete. It is returned for
+    display only if partial is set, otherwise None is returned until the series was finalized.
+    """
+    assembler = self.seriesAssemblers.get(series)
+    if assembler and not assembler.finalized:
+      if partial and assembler.valid and assembler.volumeNode:
+        return assembler.update(force=True)
+      if not partial:
+        logging.info("%s is still being received" % series)
+        return None
     try:
       volume = self.alreadyLoadedSeries[series]
     except KeyError:
       logging.info("Need to load volume")
-      files = self.loadableList[series]
-      loadables = self.scalarVolumePlugin.examine([files])
-      success, volume = slicer.util.loadVolume(files[0], returnNode=True)
-      volume.SetName(loadables[0].name)
+      files = self.seriesRegistry.getFiles(series)
+      volume = self.voxelCache.load(series, files) if self.voxelCache else None
+      if volume is None:
+        prefetched = self.seriesPrefetcher.take(series, files)
+        if prefetched:
+          volume = createSeriesVolumeNode(prefetched[0], prefetched[1], series)
+        else:
+          volume = self.loadSeriesVolumeFromCachedHeaders(series, files)
+        if volume is None:
+          loadables = self.scalarVolumePlugin.examine([files])
+          success, volume = slicer.util.loadVolume(files[0], returnNode=True)
+          volume.SetName(loadables[0].name)
+        self.storeInVoxelCache(series, files, volume)
       self.alreadyLoadedSeries[series] = volume
+      self.alreadyLoadedSeries.evict(self.getPinnedVolumes())
     slicer.app.processEvents()
     return volume
 
+  def storeInVoxelCache(self, series, files, volume):
+    if self.voxelCache and not self.trainingMode:
+      self.voxelCache.store(series, files, volume)
+
+  def getPinnedVolumes(self):
+    # the planning volume is the one targets were segmented on
+    return [self.approvedCoverTemplate, self.data.initialVolume, self.segmentationEditor.masterVolumeNode(),
+            self.alreadyLoadedSeries.get(self.currentSeries)]
+
+  def announceNewImageSeries(self, newSeries):
+    # prefetching is started directly, as the module widget removes all observers of the session when it is created
+    self.prefetchSeries(newSeries)
+    self.invokeEvent(self.NewImageSeriesReceivedEvent, newSeries.__str__())
+
+  def prefetchSeries(self, newSeries):
+    if self.isLoading() or not self.seriesIndex.isHeaderReadingThreadSafe:
+      return
+    for series in newSeries:
+      priority = self.seriesTypeManager.getPrefetchPriority(series)
+      if priority is None or series in self.alreadyLoadedSeries or series in self.seriesAssemblers:
+        continue
+      record = self.seriesRegistry.getByName(series)
+      headers = [self.seriesIndex.getHeader(f) for f in record.files]
+      if record.files and all(self.seriesIndex.isHeaderComplete(header) for header in headers):
+        self.seriesPrefetcher.enqueue(series, record.files, headers, (priority, -record.number))
+
+  def onSeriesPrefetched(self, series, files, array, geometries):
+    if series in self.alreadyLoadedSeries or not self.seriesRegistry.getFiles(series):
+      return
+    if files != self.seriesRegistry.getFiles(series):
+      logging.debug("Discarding prefetched %s as files were added while decoding" % series)
+      return
+    self.alreadyLoadedSeries[series] = createSeriesVolumeNode(array, geometries, series)
+    self.storeInVoxelCache(series, files, self.alreadyLoadedSeries.get(series))
+    self.alreadyLoadedSeries.evict(self.getPinnedVolumes())
+
+  def loadSeriesVolumeFromCachedHeaders(self, series, files):
+    headers = [self.seriesIndex.getHeader(f) for f in files]
+    if not all(self.seriesIndex.isHeaderComplete(header) for header in headers):
+      return None
+    try:
+      return loadSeriesVolume(files, headers, series)
+    except Exception as exc:
+      logging.info("Falling back to the DICOM scalar volume plugin for %s: %s" % (series, exc))
+      return None
+
   def createLoadableFileListForSeries(self, series):
-    seriesNumber = int(series.split(": ")[0])
-    loadableList = []
-    for dcm in self.getFileList(self.intraopDICOMDirectory):
-      currentFile = os.path.join(self.intraopDICOMDirectory, dcm)
-      if self.getDICOMValue(currentFile, DICOMTAGS.SERIES_NUMBER) and (not self.getDICOMValue(currentFile, DICOMTAGS.SERIES_NUMBER)  == '__TAG_NOT_IN_INSTANCE__'):
-        try:
-          int(self.getDICOMValue(currentFile, DICOMTAGS.SERIES_NUMBER))
-        except:
-          print("nothing: %s" % self.getDICOMValue(currentFile, DICOMTAGS.SERIES_NUMBER))
-        currentSeriesNumber = int(self.getDICOMValue(currentFile, DICOMTAGS.SERIES_NUMBER))
-        if currentSeriesNumber and currentSeriesNumber == seriesNumber:
-          loadableList.append(currentFile)
-    return loadableList
+    return self.seriesIndex.getFileList(self.seriesRegistry.getByName(series).number)
 
   def deleteSeriesFromSeriesList(self, seriesNumber):
-    for series in self.seriesList:
-      currentSeriesNumber = int(series.split(": ")[0])
-      if currentSeriesNumber == seriesNumber:
-        self.seriesList.remove(series)
-        for seriesFile in self.loadableList[series]:
-          logging.debug("removing {} from filesystem".format(seriesFile))
-          os.remove(seriesFile)
-        del self.loadableList[series]
+    record = self.seriesRegistry.remove(seriesNumber)
+    if not record:
+      return
+    self.seriesIndex.removeSeries(seriesNumber)
+    self.unloadSeries(record.name)
+    for seriesFile in record.files:
+      logging.debug("removing {} from filesystem".format(seriesFile))
+      os.remove(seriesFile)
 
   def makeSeriesNumberDescription(self, dcmFile):
-    seriesDescription = self.getDICOMValue(dcmFile, DICOMTAGS.SERIES_DESCRIPTION)
-    seriesNumber = self.getDICOMValue(dcmFile, DICOMTAGS.SERIES_NUMBER)
+    header = self.getHeader(dcmFile)
+    seriesDescription = header["SeriesDescription"]
+    seriesNumber = header["SeriesNumber"]
     if not (seriesNumber and seriesDescription):
       raise DICOMValueError("Missing Attribute(s):\nFile: {}\nseriesNumber: {}\nseriesDescription: {}"
                             .format(dcmFile, seriesNumber, seriesDescription))
     return "{}: {}".format(seriesNumber, seriesDescription)
 
-  def getAdditionalInformationForReceivedSeries(self, fileList):
-    seriesNumberPatientID = {}
-    for currentFile in [os.path.join(self.intraopDICOMDirectory, f) for f in fileList]:
-      seriesNumber = int(self.getDICOMValue(currentFile, DICOMTAGS.SERIES_NUMBER))
-      if seriesNumber not in seriesNumberPatientID.keys():
-        seriesNumberPatientID[seriesNumber]= self.getPatientInformation(currentFile)
-    return seriesNumberPatientID
-
   def getPatientInformation(self, currentFile):
+    header = self.getHeader(currentFile)
     return {
-      "PatientID": self.getDICOMValue(currentFile, DICOMTAGS.PATIENT_ID),
-      "PatientName": self.getDICOMValue(currentFile, DICOMTAGS.PATIENT_NAME),
-      "SeriesDescription": self.getDICOMValue(currentFile, DICOMTAGS.SERIES_DESCRIPTION)}
+      "PatientID": header["PatientID"],
+      "PatientName": header["PatientName"],
+      "SeriesDescription": header["SeriesDescription"]}
+
+  def getHeader(self, currentFile):
+    return self.seriesIndex.getHeader(currentFile) or self.seriesIndex.readHeader(currentFile)
 
   def getSeriesForSubstring(self, substring):
-    for series in reversed(self.seriesList):
-      if substring in series:
-        return series
+    for record in reversed(self.seriesRegistry):
+      if substring in record.name:
+        return record.name
     return None
 
   def loadCaseData(self):
@@ -685,6 +1098,9 @@ class ProstateAblationSession(StepBasedSession):
       return needleRadius
 
   def takeActionForCurrentSeries(self, event = None):
+    if self.isSeriesBeingAssembled(self.currentSeries):
+      slicer.util.warningDisplay("%s is still being received, please wait until it is complete." % self.currentSeries)
+      return
     callData = None
     if self.seriesTypeManager.isCoverTemplate(self.currentSeries):
       event = self.InitiateZFrameCalibrationEvent
@@ -101,7 +101,7 @@ class SessionData(ModuleLogicMixin):
                                                         intraOpTargetsInfo["targetFile"],
                                                         slicer.util.loadMarkupsFiducialList)
           self.savedNeedleTypeForTargets = intraOpTargetsInfo.get("needleType")
-        elif type(intraOpTargetsInfo) == type(unicode()): # ensure backward compatibility to load old data
+        elif isinstance(intraOpTargetsInfo, str): # ensure backward compatibility to load old data
           self.intraOpTargets = self._loadOrGetFileData(directory, data["intraOpTargets"],
                                                         slicer.util.loadMarkupsFiducialList)
         self.intraOpTargets.SetLocked(True)
@@ -110,7 +110,7 @@ class SessionData(ModuleLogicMixin):
         zFrameRegistration = data["zFrameRegistration"]
         volume = self._loadOrGetFileData(directory, zFrameRegistration["volume"], slicer.util.loadVolume)
         transform = self._loadOrGetFileData(directory, zFrameRegistration["transform"], slicer.util.loadTransform)
-        name = zFrameRegistration["name"] if zFrameRegistration.has_key("name") else volume.GetName()
+        name = zFrameRegistration["name"] if "name" in zFrameRegistration else volume.GetName()
         self.zFrameRegistrationResult = ZFrameRegistrationResult(name)
         self.zFrameRegistrationResult.volume = volume
         self.zFrameRegistrationResult.transform = transform
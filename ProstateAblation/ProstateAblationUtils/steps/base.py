@@ -66,6 +66,7 @@ class ProstateAblationWidgetBase(qt.QWidget, ModuleWidgetMixin):
     self.session.addEventObserver(self.session.CloseCaseEvent, self.onCaseClosed)
     self.session.addEventObserver(self.session.NewImageSeriesReceivedEvent, self.onNewImageSeriesReceived)
     self.session.addEventObserver(self.session.CurrentSeriesChangedEvent, self.onCurrentSeriesChanged)
+    self.session.addEventObserver(self.session.SeriesAssemblyProgressEvent, self.onSeriesAssemblyProgress)
 
   def removeSessionEventObservers(self):
     self.session.removeEventObserver(self.session.NewCaseStartedEvent, self.onNewCaseStarted)
@@ -73,6 +74,7 @@ class ProstateAblationWidgetBase(qt.QWidget, ModuleWidgetMixin):
     self.session.removeEventObserver(self.session.CloseCaseEvent, self.onCaseClosed)
     self.session.removeEventObserver(self.session.NewImageSeriesReceivedEvent, self.onNewImageSeriesReceived)
     self.session.removeEventObserver(self.session.CurrentSeriesChangedEvent, self.onCurrentSeriesChanged)
+    self.session.removeEventObserver(self.session.SeriesAssemblyProgressEvent, self.onSeriesAssemblyProgress)
   
   def getSetting(self, setting, moduleName=None, default=None):
     return GeneralModuleMixin.getSetting(self, setting, moduleName=moduleName if moduleName else self.MODULE_NAME,
@@ -139,6 +141,10 @@ class ProstateAblationWidgetBase(qt.QWidget, ModuleWidgetMixin):
   def onCurrentSeriesChanged(self, caller, event, callData=None):
     pass
 
+  @vtk.calldata_type(vtk.VTK_STRING)
+  def onSeriesAssemblyProgress(self, caller, event, callData):
+    pass
+
   def setupFourUpView(self, volume, clearLabels=True):
     self.setBackgroundToVolumeID(volume.GetID(), clearLabels)
     self.layoutManager.setLayout(constants.LAYOUT_FOUR_UP)
@@ -187,7 +193,7 @@ class ProstateAblationWidgetBase(qt.QWidget, ModuleWidgetMixin):
       result = self.session.data.getResultsBySeries(selectedSeries)[0]
       volume = result.volumes.fixed
     except IndexError:
-      volume = self.session.getOrCreateVolumeForSeries(selectedSeries)
+      volume = self.session.getOrCreateVolumeForSeries(selectedSeries, partial=True)
     self.setBackgroundToVolumeID(volume.GetID())
 
 
@@ -37,11 +37,13 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
     super(ProstateAblationOverviewStep, self).cleanup()
     self._seriesModel.clear()
     self.trackTargetsButton.enabled = False
+    self.quarantineButton.visible = False
     self.updateIntraopSeriesSelectorTable()
 
   def setupIcons(self):
     self.trackIcon = self.createIcon('icon-track.png')
     self.skipIcon = Icons.skip
+    self.quarantineIcon = slicer.app.style().standardIcon(qt.QStyle.SP_MessageBoxWarning)
 
   def setup(self):
     super(ProstateAblationOverviewStep, self).setup()
@@ -53,6 +55,8 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
                                                 enabled=False)
     self.needleTipLocateButton = self.createButton("", icon=self.skipIcon, iconSize=iconSize,
                                                      toolTip="Measure Target Distance", enabled=False)
+    self.quarantineButton = self.createButton("", icon=self.quarantineIcon, iconSize=iconSize, visible=False,
+                                              toolTip="Review series of a different patient")
     self.setupIntraopSeriesSelector()
     self.layout().addWidget(self.caseManagerPlugin)
     self.addPlugin(self.caseManagerPlugin)
@@ -71,17 +75,20 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
     super(ProstateAblationOverviewStep, self).setupConnections()
     self.needleTipLocateButton.clicked.connect(self.onNeedleTipLocateButtonClicked)
     self.trackTargetsButton.clicked.connect(self.onTrackTargetsButtonClicked)
+    self.quarantineButton.clicked.connect(self.onQuarantineButtonClicked)
     self.intraopSeriesSelector.connect('currentIndexChanged(QString)', self.onIntraopSeriesSelectionChanged)
 
   def addSessionObservers(self):
     super(ProstateAblationOverviewStep, self).addSessionObservers()
     self.session.addEventObserver(self.session.SeriesTypeManuallyAssignedEvent, self.onSeriesTypeManuallyAssigned)
     self.session.addEventObserver(self.session.ZFrameRegistrationSuccessfulEvent, self.onZFrameRegistrationSuccessful)
+    self.session.addEventObserver(self.session.SeriesQuarantineChangedEvent, self.onSeriesQuarantineChanged)
 
   def removeSessionEventObservers(self):
     ProstateAblationStep.removeSessionEventObservers(self)
     self.session.removeEventObserver(self.session.SeriesTypeManuallyAssignedEvent, self.onSeriesTypeManuallyAssigned)
     self.session.removeEventObserver(self.session.ZFrameRegistrationSuccessfulEvent, self.onZFrameRegistrationSuccessful)
+    self.session.removeEventObserver(self.session.SeriesQuarantineChangedEvent, self.onSeriesQuarantineChanged)
 
   def onNeedleTipLocateButtonClicked(self):
     selectedSeries = self.intraopSeriesSelector.currentText
@@ -95,6 +102,39 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
   def onTrackTargetsButtonClicked(self):
     self.session.takeActionForCurrentSeries()
 
+  def onQuarantineButtonClicked(self):
+    for series, record in list(self.session.quarantinedSeries.items()):
+      reference = self.session.getQuarantineReference(series)
+      if reference:
+        m = 'WARNING:\n' \
+            'Current case:\n' \
+            '  Patient ID: {0}\n' \
+            '  Patient Name: {1}\n' \
+            'Received image {4}\n' \
+            '  Patient ID: {2}\n' \
+            '  Patient Name : {3}\n\n' \
+            'Do you want to keep this series? '.format(reference[0], reference[1],
+                                                       record.patientID, record.patientName, series)
+      else:
+        m = 'WARNING:\n' \
+            'Received image {2}\n' \
+            '  Patient ID: {0}\n' \
+            '  Patient Name : {1}\n\n' \
+            'Do you want to keep this series? '.format(record.patientID, record.patientName, series)
+      if slicer.util.confirmYesNoDisplay(m, title="Patient IDs Not Matching", windowTitle="ProstateAblation"):
+        self.session.acceptQuarantinedSeries(series)
+      else:
+        self.session.rejectQuarantinedSeries(series)
+
+  @vtk.calldata_type(vtk.VTK_STRING)
+  def onSeriesQuarantineChanged(self, caller, event, callData):
+    numberOfSeries = len(self.session.quarantinedSeries)
+    self.quarantineButton.visible = numberOfSeries > 0
+    self.quarantineButton.text = str(numberOfSeries) if numberOfSeries else ""
+    if numberOfSeries and not self.session.isLoading():
+      customStatusProgressBar = CustomStatusProgressbar()
+      customStatusProgressBar.text = "%d series of a different patient await review." % numberOfSeries
+
   @logmethod(logging.INFO)
   def onIntraopSeriesSelectionChanged(self, selectedSeries=None):
     self.session.currentSeries = selectedSeries
@@ -118,7 +158,7 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
       index = next((i for i in range(model.rowCount()) if model.item(i).text() == callData), None)
       self.intraopSeriesSelector.currentIndex = index
       self.intraopSeriesSelector.setToolTip(callData)
-      self.setupFourUpView(self.session.currentSeriesVolume)
+      self.setupFourUpView(self.session.currentSeriesPreviewVolume)
 
   @logmethod(logging.INFO)
   def onZFrameRegistrationSuccessful(self, caller, event):
@@ -147,6 +187,7 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
     self.horizontalLayout.addWidget(self.intraopSeriesSelector)
     self.horizontalLayout.addWidget(self.trackTargetsButton)
     self.horizontalLayout.addWidget(self.needleTipLocateButton)
+    self.horizontalLayout.addWidget(self.quarantineButton)
     self.layout().addWidget(self.horizontalBox)
     self.updateIntraopSeriesSelectorTable()
 
@@ -165,13 +206,19 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
       return
     selectedSeries = self.intraopSeriesSelector.currentText
     if selectedSeries != "" and self.session.isTrackingPossible(selectedSeries):
-      selectedSeriesNumber = int(selectedSeries.split(": ")[0])
-
-      newImageSeries = ast.literal_eval(callData)
-      newImageSeriesNumbers = [int(s.split(": ")[0]) for s in newImageSeries]
-      if selectedSeriesNumber in newImageSeriesNumbers:
+      if selectedSeries in ast.literal_eval(callData):
         self.takeActionOnSelectedSeries()
 
+  @vtk.calldata_type(vtk.VTK_STRING)
+  def onSeriesAssemblyProgress(self, caller, event, callData):
+    assembler = self.session.seriesAssemblers.get(callData)
+    if not self.active or self.session.isLoading() or not assembler:
+      return
+    customStatusProgressBar = CustomStatusProgressbar()
+    customStatusProgressBar.text = "Receiving %s: %s slices" % (callData, assembler.getReceivedSlab())
+    if self.redCompositeNode.GetBackgroundVolumeID() != assembler.volumeNode.GetID():
+      self.setBackgroundToVolumeID(assembler.volumeNode.GetID())
+
   def onCaseOpened(self, caller, event):
     if self.active and not self.session.isLoading():
       self.selectMostRecentEligibleSeries()
@@ -187,8 +234,8 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
     self.intraopSeriesSelector.blockSignals(True)
     currentIndex = self.intraopSeriesSelector.currentIndex
     self._seriesModel.clear()
-    for series in self.session.seriesList:
-      sItem = qt.QStandardItem(series)
+    for record in self.session.seriesRegistry:
+      sItem = qt.QStandardItem(record.name)
       self._seriesModel.appendRow(sItem)
       color = COLOR.GREEN
       self._seriesModel.setData(sItem.index(), color, qt.Qt.BackgroundRole)
@@ -204,10 +251,9 @@ class ProstateAblationOverviewStep(ProstateAblationStep):
     self.intraopSeriesSelector.setCurrentIndex(-1)
     self.intraopSeriesSelector.blockSignals(False)
     index = -1
-    for item in list(reversed(range(len(self.session.seriesList)))):
-      series = self._seriesModel.item(item).text()
-      if seriesTypeManager.isWorkableSeries(series):
-        index = self.intraopSeriesSelector.findText(series)
+    for record in reversed(self.session.seriesRegistry):
+      if seriesTypeManager.isWorkableSeries(record.name):
+        index = self.intraopSeriesSelector.findText(record.name)
         break
     rowCount = self.intraopSeriesSelector.model().rowCount()
     self.intraopSeriesSelector.setCurrentIndex(index if index != -1 else (rowCount-1 if rowCount else -1))
@@ -6,6 +6,7 @@ import slicer
 from ProstateAblationUtils.constants import ProstateAblationConstants as constants
 from ProstateAblationUtils.steps.base import ProstateAblationPlugin, ProstateAblationLogicBase
 from ProstateAblationUtils.steps.zFrameRegistration import ProstateAblationZFrameRegistrationStepLogic
+from ProstateAblationUtils.templateHoleIndex import computePathDistances, findNearestPaths
 from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
 from SlicerDevelopmentToolboxUtils.decorators import onModuleSelected
 from SlicerDevelopmentToolboxUtils.helpers import SliceAnnotation
@@ -140,12 +141,15 @@ class CustomTargetTableModel(qt.QAbstractTableModel, ModuleLogicMixin):
   @targetList.setter
   def targetList(self, targetList):
     self._targetList = targetList
-    if self.currentGuidanceComputation and self.observer:
-      self.currentGuidanceComputation.RemoveObserver(self.observer)
+    if self.currentGuidanceComputation:
+      self.currentGuidanceComputation.removeEventObserver(vtk.vtkCommand.ModifiedEvent, self.updateTable)
+      self.currentGuidanceComputation.removeEventObserver(ZFrameGuidanceComputation.TargetModifiedEvent,
+                                                          self.onTargetModified)
     self.currentGuidanceComputation = self.getOrCreateNewGuidanceComputation(targetList)
     if self.currentGuidanceComputation:
-      self.observer = self.currentGuidanceComputation.addEventObserver(vtk.vtkCommand.ModifiedEvent,
-                                                                       self.updateTable)
+      self.currentGuidanceComputation.addEventObserver(vtk.vtkCommand.ModifiedEvent, self.updateTable)
+      self.currentGuidanceComputation.addEventObserver(ZFrameGuidanceComputation.TargetModifiedEvent,
+                                                       self.onTargetModified)
     self.beginResetModel();
     self.endResetModel();
 
@@ -158,27 +162,13 @@ class CustomTargetTableModel(qt.QAbstractTableModel, ModuleLogicMixin):
   def coverProstateTargetList(self, targetList):
     self._coverProstateTargetList = targetList
 
-  @property
-  def cursorPosition(self):
-    return self._cursorPosition
-
-  @cursorPosition.setter
-  def cursorPosition(self, cursorPosition):
-    self._cursorPosition = cursorPosition
-    self.dataChanged(self.index(0, 1), self.index(self.rowCount()-1, 2))
-
   def __init__(self, ProstateAblationSession, targets=None, parent=None, *args):
     qt.QAbstractTableModel.__init__(self, parent, *args)
     self.session = ProstateAblationSession
-    self._cursorPosition = None
     self._targetList = None
-    self._guidanceComputations = []
     self.currentGuidanceComputation = None
     self.targetList = targets
-    self.computeCursorDistances = False
     self.currentTargetIndex = -1
-    self.observer = None
-    self.session.addEventObserver(self.session.ZFrameRegistrationSuccessfulEvent, self.onZFrameRegistrationSuccessful)
 
   def flags(self, index):
     if index.column() == self.getColunmNumForHeaderName(self.COLUMN_DISPLAY) \
@@ -199,27 +189,21 @@ class CustomTargetTableModel(qt.QAbstractTableModel, ModuleLogicMixin):
     return -1
 
   def getOrCreateNewGuidanceComputation(self, targetList):
-    if not targetList:
-      return None
-    guidance = None
-    for crntGuidance in self._guidanceComputations:
-      if crntGuidance.targetList is targetList:
-        guidance = crntGuidance
-        break
-    if not guidance:
-      self._guidanceComputations.append(ZFrameGuidanceComputation(self.session, targetList))
-      guidance = self._guidanceComputations[-1]
-    if self._targetList is targetList:
+    guidance = self.session.guidanceRegistry.getOrCreate(targetList)
+    if guidance and self._targetList is targetList:
       self.updateTable()
     return guidance
 
-  def onZFrameRegistrationSuccessful(self, caller, event):
-    self._guidanceComputations = []
-
   def updateTable(self, caller=None, event=None):
     self.dataChanged(self.index(0, self.getColunmNumForHeaderName(self.COLUMN_HOLE)), self.index(self.rowCount() - 1, self.getColunmNumForHeaderName(self.COLUMN_DEPTH)))
     self.invokeEvent(vtk.vtkCommand.ModifiedEvent)
 
+  @vtk.calldata_type(vtk.VTK_STRING)
+  def onTargetModified(self, caller, event, callData):
+    row = int(callData)
+    self.dataChanged(self.index(row, self.getColunmNumForHeaderName(self.COLUMN_HOLE)),
+                     self.index(row, self.getColunmNumForHeaderName(self.COLUMN_DEPTH)))
+
   def rowCount(self):
     try:
       number_of_targets = self.targetList.GetNumberOfFiducials()
@@ -249,6 +233,8 @@ class CustomTargetTableModel(qt.QAbstractTableModel, ModuleLogicMixin):
     elif col == self.getColunmNumForHeaderName(self.COLUMN_NEEDLETYPE):
       return None
     elif col == 3 and self.session.zFrameRegistrationSuccessful:
+      if role == qt.Qt.ToolTipRole:
+        return "Nearest holes:\n" + self.currentGuidanceComputation.getAlternativeHolesText(row)
       return self.currentGuidanceComputation.getZFrameHole(row)
     elif col == 4 and self.session.zFrameRegistrationSuccessful:
       return self.currentGuidanceComputation.getZFrameDepth(row)
@@ -294,33 +280,69 @@ class CustomTargetTableModel(qt.QAbstractTableModel, ModuleLogicMixin):
 
 class ZFrameGuidanceComputation(ModuleLogicMixin):
 
-  SUPPORTED_EVENTS = [vtk.vtkCommand.ModifiedEvent]
+  TargetModifiedEvent = vtk.vtkCommand.UserEvent + 338
+
+  NUMBER_OF_ALTERNATIVE_PATHS = 4
 
-  def __init__(self, ProstateAblationSession, targetList = None):
-    self.zFrameRegistration = ProstateAblationZFrameRegistrationStepLogic(ProstateAblationSession)
+  SUPPORTED_EVENTS = [vtk.vtkCommand.ModifiedEvent, TargetModifiedEvent]
+
+  def __init__(self, ProstateAblationSession, targetList = None, zFrameRegistration = None):
+    self.zFrameRegistration = zFrameRegistration or ProstateAblationZFrameRegistrationStepLogic(ProstateAblationSession)
     self.session = ProstateAblationSession
     self.targetList = targetList
+    self.observers = []
     if self.targetList:
-      self.observer = self.targetList.AddObserver(self.targetList.PointModifiedEvent, self.calculate)
-      self.observer = self.targetList.AddObserver(self.targetList.MarkupRemovedEvent, self.calculate)
+      self.observers.append(self.targetList.AddObserver(self.targetList.PointModifiedEvent, self.onPointModified))
+      self.observers.append(self.targetList.AddObserver(self.targetList.MarkupRemovedEvent, self.invalidateAll))
     self.reset()
     self.calculate()
 
   def __del__(self):
-    if self.targetList and self.observer:
-      self.targetList.RemoveObserver(self.observer)
+    self.cleanup()
+
+  def cleanup(self):
+    if self.targetList:
+      for observer in self.observers:
+        self.targetList.RemoveObserver(observer)
+    self.observers = []
+    self.targetList = None
+    self.reset()
 
   def reset(self):
     self.needleStartEndPositions = {}
+    self.nearestPaths = {}
+    self.alternativeHoles = {}
     self.computedHoles = {}
     self.computedDepth = {}
 
+  def invalidate(self, index):
+    self.needleStartEndPositions.pop(index, None)
+    self.nearestPaths.pop(index, None)
+    self.alternativeHoles.pop(index, None)
+    self.computedHoles.pop(index, None)
+    self.computedDepth.pop(index, None)
+
+  @vtk.calldata_type(vtk.VTK_INT)
+  def onPointModified(self, caller, event, callData):
+    if callData is None or not 0 <= callData < self.targetList.GetNumberOfFiducials():
+      self.invalidateAll()
+      return
+    # recomputed lazily once the hole or depth of the target is requested
+    self.invalidate(callData)
+    self.invokeEvent(self.TargetModifiedEvent, str(callData))
+
+  def invalidateAll(self, caller=None, event=None):
+    # e.g. after removing a target, as the indices of the remaining targets shifted
+    self.reset()
+    self.invokeEvent(vtk.vtkCommand.ModifiedEvent)
+
   def calculate(self, caller=None, event=None):
     if not self.targetList:
       return
     self.reset()
-    for index in range(self.targetList.GetNumberOfFiducials()):
-      self.calculateZFrameHoleAndDepth(index)
+    positions = [self.getTargetPosition(self.targetList, index) for index in range(self.targetList.GetNumberOfFiducials())]
+    for index, (pathIndex, depth) in enumerate(zip(*self.findNearestPaths(positions))):
+      self.storeNearestPath(index, pathIndex, depth)
     self.invokeEvent(vtk.vtkCommand.ModifiedEvent)
 
   def getNeedleEndPos(self, index):
@@ -342,40 +364,101 @@ class ZFrameGuidanceComputation(ModuleLogicMixin):
     else:
       return self.computedDepth[index][1]
 
+  def getAlternativeHoles(self, index):
+    """ Returns (indexX, indexY, depth[cm], inRange, distance[mm]) of the holes closest to the target, nearest first """
+    if index not in self.alternativeHoles:
+      indices, depths, inRange, distances = \
+        [values[0] for values in self.findAlternativePaths([self.getTargetPosition(self.targetList, index)])]
+      templateIndex = numpy.asarray(self.zFrameRegistration.templateIndex).reshape(-1, 2)[indices]
+      self.alternativeHoles[index] = list(zip(templateIndex[:, 0], templateIndex[:, 1], numpy.round(depths / 10, 1),
+                                              inRange, distances))
+    return self.alternativeHoles[index]
+
+  def getAlternativeHolesText(self, index):
+    return "\n".join("(%s, %s): %.1f mm off, depth %s" % (indexX, indexY, distance,
+                                                         '%.1f' % depth if inRange else '(%.1f)' % depth)
+                     for indexX, indexY, depth, inRange, distance in self.getAlternativeHoles(index))
+
   def getZFrameDepthInRange(self, index):
     if index not in self.computedHoles.keys():
       self.calculateZFrameHoleAndDepth(index)
     return self.computedDepth[index][0]
 
   def calculateZFrameHoleAndDepth(self, index):
-    targetPosition = self.getTargetPosition(self.targetList, index)
-    (start, end, indexX, indexY, depth, inRange) = self.computeNearestPath(targetPosition)
+    pathIndices, depths = self.findNearestPaths([self.getTargetPosition(self.targetList, index)])
+    self.storeNearestPath(index, pathIndices[0], depths[0])
+
+  def getNearestPaths(self, indices):
+    """ Returns (start, end, indexX, indexY, depth, inRange) of the nearest needle path for every target index.
+
+    Targets without a cached result are computed in one batch.
+    """
+    missing = [index for index in indices if index not in self.nearestPaths]
+    if missing:
+      positions = [self.getTargetPosition(self.targetList, index) for index in missing]
+      for index, pathIndex, depth in zip(missing, *self.findNearestPaths(positions)):
+        self.storeNearestPath(index, pathIndex, depth)
+    return [self.nearestPaths[index] for index in indices]
+
+  def storeNearestPath(self, index, pathIndex, depth):
+    self.nearestPaths[index] = self.createNearestPath(pathIndex, depth)
+    (start, end, indexX, indexY, depth, inRange) = self.nearestPaths[index]
     logging.debug("start:{}, end:{}, indexX:{}, indexY:{}, depth:{}, inRange:{}".format(start, end, indexX, indexY, depth, inRange))
-    needleDirection = (numpy.array(end) - numpy.array(start)) / numpy.linalg.norm(numpy.array(end) - numpy.array(start))
-    self.needleStartEndPositions[index] = (start, start + depth * needleDirection)
+    if pathIndex != -1:
+      # the needle follows the nearest path even if the target is out of its range
+      start, end = self.getNeedleStartEndPointFromPathOrigins(pathIndex)
+      needleDirection = (end - start) / numpy.linalg.norm(end - start)
+      self.needleStartEndPositions[index] = (start, start + depth * needleDirection)
+    else:
+      self.needleStartEndPositions[index] = (None, None)
     self.computedHoles[index] = [indexX, indexY]
     self.computedDepth[index] = [inRange, round(depth/10, 1)]
 
+  def findNearestPaths(self, positions):
+    """ Returns the indices of the needle paths closest to each of the M positions and the depths along these paths.
+
+    Positions are transformed into the template frame and looked up in the template hole index if the template has
+    parallel paths and is registered rigidly. Otherwise projection, perpendicular distance and depth are computed for
+    all M x N pairs of positions and paths at once. The index is -1 if no template is loaded.
+    """
+    registration = self.zFrameRegistration
+    return findNearestPaths(positions, registration.pathOrigins, registration.pathVectors,
+                            registration.templateHoleIndex, registration.worldToTemplate)
+
+  def computePathDistances(self, points):
+    """ Returns the depths along and the squared perpendicular distances to all N needle paths as M x N arrays """
+    return computePathDistances(points, self.zFrameRegistration.pathOrigins, self.zFrameRegistration.pathVectors)
+
+  def findAlternativePaths(self, positions, k=NUMBER_OF_ALTERNATIVE_PATHS):
+    """ Returns the k needle paths closest to each of the M positions, nearest first.
+
+    Returns:
+      tuple: M x k arrays of path indices, depths along the paths, whether the depths are in range of the paths and
+        perpendicular distances of the positions to the paths. k is limited by the number of paths.
+    """
+    points = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+    k = min(k, len(self.zFrameRegistration.pathOrigins))
+    if k < 1 or not len(points):
+      return (numpy.empty((len(points), 0), dtype=int), numpy.empty((len(points), 0)),
+              numpy.empty((len(points), 0), dtype=bool), numpy.empty((len(points), 0)))
+    aproj, mag2 = self.computePathDistances(points)
+    candidates = numpy.argpartition(mag2, k - 1, axis=1)[:, :k]
+    rows = numpy.arange(len(points))[:, numpy.newaxis]
+    indices = candidates[rows, numpy.argsort(mag2[rows, candidates], axis=1)]
+    depths = aproj[rows, indices]
+    inRange = (depths > 0) & (depths < numpy.asarray(self.zFrameRegistration.templateMaxDepth)[indices])
+    return indices, depths, inRange, numpy.sqrt(numpy.maximum(mag2[rows, indices], 0))
+
+  def computeNearestPaths(self, positions):
+    """ Returns (start, end, indexX, indexY, depth, inRange) of the nearest needle path for every position """
+    return [self.createNearestPath(index, depth) for index, depth in zip(*self.findNearestPaths(positions))]
+
   def computeNearestPath(self, pos):
-    minMag2 = numpy.Inf
-    minDepth = 0.0
-    minIndex = -1
+    return self.computeNearestPaths([pos])[0]
+
+  def createNearestPath(self, minIndex, minDepth):
     needleStart = None
     needleEnd = None
-
-    p = numpy.array(pos)
-    for i, orig in enumerate(self.zFrameRegistration.pathOrigins):
-      vec = self.zFrameRegistration.pathVectors[i]
-      op = p - orig
-      aproj = numpy.inner(op, vec)
-      perp = op-aproj*vec
-      mag2 = numpy.vdot(perp, perp)
-      if mag2 < minMag2:
-        minMag2 = mag2
-        minIndex = i
-        minDepth = aproj
-      i += 1
-
     indexX = '--'
     indexY = '--'
     inRange = False
@@ -387,7 +470,7 @@ class ZFrameGuidanceComputation(ModuleLogicMixin):
         inRange = True
         needleStart, needleEnd = self.getNeedleStartEndPointFromPathOrigins(minIndex)
 
-    return needleStart, needleEnd, indexX, indexY, minDepth, inRange
+    return needleStart, needleEnd, indexX, indexY, float(minDepth), inRange
 
   def getNeedleStartEndPointFromPathOrigins(self, index):
     start = self.zFrameRegistration.pathOrigins[index]
@@ -399,6 +482,77 @@ class ZFrameGuidanceComputation(ModuleLogicMixin):
     return start, end
 
 
+class ZFrameGuidanceRegistry(object):
+  """ Guidance computations of the session, one per markups node, shared by all target tables.
+
+  Entries are looked up by the ID of the markups node and share one z-frame registration logic. An entry and its
+  observers are released as soon as its node is removed from the scene or the scene is closed, so that the registry
+  never keeps nodes alive. Weak references would not help with that: the scene holds the nodes, and the Python wrapper
+  of a VTK object may be collected while the node itself is still alive. The scene is observed once entries are
+  created, cleanup releases all entries and stops observing it. The session invalidates all entries in place after a
+  new z-frame registration.
+  """
+
+  @property
+  def zFrameRegistration(self):
+    if self._zFrameRegistration is None:
+      self._zFrameRegistration = ProstateAblationZFrameRegistrationStepLogic(self.session)
+    return self._zFrameRegistration
+
+  def __init__(self, ProstateAblationSession):
+    self.session = ProstateAblationSession
+    self._zFrameRegistration = None
+    self._computations = {}
+    self._sceneObservers = []
+
+  def observeScene(self):
+    if not self._sceneObservers:
+      self._sceneObservers = [
+        slicer.mrmlScene.AddObserver(slicer.vtkMRMLScene.NodeAboutToBeRemovedEvent, self.onNodeAboutToBeRemoved),
+        slicer.mrmlScene.AddObserver(slicer.vtkMRMLScene.EndCloseEvent, self.onSceneClosed)]
+
+  def cleanup(self):
+    self.clear()
+    for observer in self._sceneObservers:
+      slicer.mrmlScene.RemoveObserver(observer)
+    self._sceneObservers = []
+
+  def __contains__(self, targetList):
+    guidance = self._computations.get(targetList.GetID()) if targetList else None
+    return guidance is not None and guidance.targetList is targetList
+
+  def getOrCreate(self, targetList):
+    if not targetList:
+      return None
+    if targetList not in self:
+      self.remove(targetList.GetID())
+      self.observeScene()
+      self._computations[targetList.GetID()] = ZFrameGuidanceComputation(self.session, targetList,
+                                                                         self.zFrameRegistration)
+    return self._computations[targetList.GetID()]
+
+  def remove(self, nodeID):
+    guidance = self._computations.pop(nodeID, None)
+    if guidance:
+      guidance.cleanup()
+
+  def clear(self):
+    for nodeID in list(self._computations.keys()):
+      self.remove(nodeID)
+
+  @vtk.calldata_type(vtk.VTK_OBJECT)
+  def onNodeAboutToBeRemoved(self, caller, event, callData):
+    if callData and callData.GetID() in self._computations:
+      self.remove(callData.GetID())
+
+  def onSceneClosed(self, caller, event):
+    self.clear()
+
+  def invalidateAll(self):
+    for guidance in list(self._computations.values()):
+      guidance.invalidateAll()
+
+
 class TargetsDefinitionTableLogic(ProstateAblationLogicBase):
 
   def __init__(self, ProstateAblationSession):
@@ -415,6 +569,10 @@ class TargetsDefinitionTable(ProstateAblationPlugin):
 
   TargetPosUpdatedEvent = vtk.vtkCommand.UserEvent + 337
 
+  HOVER_GUIDANCE_KEY = 'd'
+  # the readout follows the cursor at most once per display frame
+  HOVER_REFRESH_INTERVAL_MS = 16
+
   @property
   def lastSelectedModelIndex(self):
     return self.session.lastSelectedModelIndex
@@ -466,8 +624,10 @@ class TargetsDefinitionTable(ProstateAblationPlugin):
     self.checkBoxList = dict()
     self.comboBoxList = dict()
     self.keyPressEventObservers = {}
-    self.keyReleaseEventObservers = {}
     self.mouseReleaseEventObservers = {}
+    self.cursorObserver = None
+    self.cursorPosition = None
+    self.hoverAnnotation = None
 
   def setup(self):
     super(TargetsDefinitionTable, self).setup()
@@ -483,6 +643,10 @@ class TargetsDefinitionTable(ProstateAblationPlugin):
     self.targetTable.minimumHeight = 150
     self.targetTable.setStyleSheet("QTableView::item:selected{background-color: #ff7f7f; color: black};")
     self.layout().addWidget(self.targetTable)
+    self.hoverTimer = qt.QTimer()
+    self.hoverTimer.setSingleShot(True)
+    self.hoverTimer.setInterval(self.HOVER_REFRESH_INTERVAL_MS)
+    self.hoverTimer.timeout.connect(self.updateHoverGuidance)
 
   def cleanup(self):
     self.onDeactivation()
@@ -528,6 +692,7 @@ class TargetsDefinitionTable(ProstateAblationPlugin):
   def onDeactivation(self):
     super(TargetsDefinitionTable, self).onDeactivation()
     self.disableTargetMovingMode()
+    self.disableHoverGuidance()
     self.disconnectKeyEventObservers()
 
   def connectKeyEventObservers(self):
@@ -536,42 +701,102 @@ class TargetsDefinitionTable(ProstateAblationPlugin):
       interactors += [self.redSliceViewInteractor, self.greenSliceViewInteractor]
     for interactor in interactors:
       self.keyPressEventObservers[interactor] = interactor.AddObserver("KeyPressEvent", self.onKeyPressedEvent)
-      self.keyReleaseEventObservers[interactor] = interactor.AddObserver("KeyReleaseEvent", self.onKeyReleasedEvent)
 
   def disconnectKeyEventObservers(self):
     for interactor, tag in self.keyPressEventObservers.items():
       interactor.RemoveObserver(tag)
-    for interactor, tag in self.keyReleaseEventObservers.items():
-      interactor.RemoveObserver(tag)
+    self.keyPressEventObservers = {}
 
   def onKeyPressedEvent(self, caller, event):
-    if not caller.GetKeySym() == 'd':
-      return
-    if not self.targetTableModel.computeCursorDistances:
-      self.targetTableModel.computeCursorDistances = True
-      self.calcCursorTargetsDistance()
-      self.crosshairButton.addEventObserver(self.crosshairButton.CursorPositionModifiedEvent,
-                                            self.calcCursorTargetsDistance)
-
-  def onKeyReleasedEvent(self, caller, event):
-    if not caller.GetKeySym() == 'd':
+    if not caller.GetKeySym() == self.HOVER_GUIDANCE_KEY:
       return
-    self.targetTableModel.computeCursorDistances = False
-    self.crosshairButton.removeEventObserver(self.crosshairButton.CursorPositionModifiedEvent,
-                                             self.calcCursorTargetsDistance)
+    if self.cursorObserver is None:
+      self.enableHoverGuidance()
+    else:
+      self.disableHoverGuidance()
 
-  @vtk.calldata_type(vtk.VTK_OBJECT)
-  def calcCursorTargetsDistance(self, caller, event, callData):
-    if not self.targetTableModel.computeCursorDistances:
+  def enableHoverGuidance(self):
+    crosshairNode = slicer.mrmlScene.GetFirstNodeByClass("vtkMRMLCrosshairNode")
+    if not crosshairNode:
       return
-    ras = xyz = [0.0, 0.0, 0.0]
-    insideView = callData.GetCursorPositionRAS(ras)
-    sliceNode = callData.GetCursorPositionXYZ(xyz)
-
+    self.cursorObserver = (crosshairNode,
+                           crosshairNode.AddObserver(slicer.vtkMRMLCrosshairNode.CursorPositionModifiedEvent,
+                                                     self.onCursorPositionModified))
+    self.onCursorPositionModified(crosshairNode)
+
+  def disableHoverGuidance(self):
+    if self.cursorObserver:
+      crosshairNode, tag = self.cursorObserver
+      crosshairNode.RemoveObserver(tag)
+    self.cursorObserver = None
+    self.cursorPosition = None
+    self.hoverTimer.stop()
+    self.removeHoverAnnotation()
+
+  def onCursorPositionModified(self, caller, event=None):
+    ras = [0.0, 0.0, 0.0]
+    xyz = [0.0, 0.0, 0.0]
+    insideView = caller.GetCursorPositionRAS(ras)
+    sliceNode = caller.GetCursorPositionXYZ(xyz)
     if not insideView or sliceNode not in [self.redSliceNode, self.yellowSliceNode, self.greenSliceNode]:
-      self.targetTableModel.cursorPosition = None
+      self.cursorPosition = None
+    else:
+      self.cursorPosition = (sliceNode, ras)
+    # mouse moves in between only replace the position, so that at most one readout is computed per frame
+    if not self.hoverTimer.isActive():
+      self.hoverTimer.start()
+
+  def updateHoverGuidance(self):
+    if not self.cursorPosition:
+      self.removeHoverAnnotation()
       return
-    self.targetTableModel.cursorPosition = ras
+    sliceNode, position = self.cursorPosition
+    widget = {self.redSliceNode: self.redWidget, self.yellowSliceNode: self.yellowWidget,
+              self.greenSliceNode: self.greenWidget}[sliceNode]
+    text = self.getHoverGuidanceText(position)
+    if self.hoverAnnotation and self.hoverAnnotation[0] is sliceNode:
+      self.hoverAnnotation[1].text = text
+    else:
+      self.removeHoverAnnotation()
+      self.hoverAnnotation = (sliceNode, SliceAnnotation(widget, text, opacity=0.6, verticalAlign="bottom",
+                                                         horizontalAlign="center"))
+
+  def removeHoverAnnotation(self):
+    if self.hoverAnnotation:
+      self.hoverAnnotation[1].remove()
+    self.hoverAnnotation = None
+
+  def getHoverGuidanceText(self, position):
+    lines = []
+    if self.session.zFrameRegistrationSuccessful:
+      indexX, indexY, depth, inRange = self.getHoleAtPosition(position)
+      lines.append("Hole: (%s, %s)  Depth: %s" % (indexX, indexY, '%.1f' % depth if inRange else '(%.1f)' % depth))
+    if self.currentTargets:
+      for index in range(self.currentTargets.GetNumberOfFiducials()):
+        targetPosition = self.logic.getTargetPosition(self.currentTargets, index)
+        lines.append("%s: %.1f mm" % (self.currentTargets.GetNthFiducialLabel(index),
+                                      numpy.linalg.norm(numpy.array(position) - targetPosition)))
+    return "\n".join(lines)
+
+  def getHoleAtPosition(self, position):
+    """ Returns (indexX, indexY, depth[cm], inRange) of the needle path nearest to the RAS position.
+
+    The precomputed reachability grid is read if the position is within it, otherwise the template hole index of the
+    z-frame registration is queried.
+    """
+    registration = self.session.guidanceRegistry.zFrameRegistration
+    lookup = self.session.reachability.lookup([position])
+    if lookup is not None and lookup[3][0]:
+      pathIndex, depth, inRange = lookup[0][0], lookup[1][0], lookup[2][0]
+    else:
+      pathIndices, depths = findNearestPaths([position], registration.pathOrigins, registration.pathVectors,
+                                             registration.templateHoleIndex, registration.worldToTemplate)
+      pathIndex, depth = pathIndices[0], depths[0]
+      inRange = pathIndex != -1 and 0 < depth < registration.templateMaxDepth[pathIndex]
+    if pathIndex == -1:
+      return '--', '--', 0.0, False
+    indexX, indexY = registration.templateIndex[pathIndex][:2]
+    return indexX, indexY, round(depth / 10, 1), inRange
 
   def onTargetSelectionChanged(self, modelIndex=None):
     # onCurrentResultSelected event
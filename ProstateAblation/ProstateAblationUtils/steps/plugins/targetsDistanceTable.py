@@ -5,6 +5,7 @@ import logging
 import slicer
 from ProstateAblationUtils.constants import ProstateAblationConstants as constants
 from ProstateAblationUtils.steps.base import ProstateAblationPlugin, ProstateAblationLogicBase
+from ProstateAblationUtils.steps.plugins.targetsDefinitionTable import ZFrameGuidanceComputation
 from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
 from SlicerDevelopmentToolboxUtils.decorators import onModuleSelected
 from SlicerDevelopmentToolboxUtils.helpers import SliceAnnotation
@@ -30,13 +31,17 @@ class TargetsDistanceTableModel(qt.QAbstractTableModel, ModuleLogicMixin):
   @targetList.setter
   def targetList(self, targetList):
     self._targetList = targetList
-    if self.currentGuidanceComputation and self.observer:
-      self.currentGuidanceComputation.RemoveObserver(self.observer)
+    if self.currentGuidanceComputation:
+      self.currentGuidanceComputation.removeEventObserver(vtk.vtkCommand.ModifiedEvent, self.updateTable)
+      self.currentGuidanceComputation.removeEventObserver(ZFrameGuidanceComputation.TargetModifiedEvent,
+                                                          self.onTargetModified)
     self.currentGuidanceComputation = self.getOrCreateNewGuidanceComputation(targetList)
     if self.currentGuidanceComputation:
-      self.observer = self.currentGuidanceComputation.addEventObserver(vtk.vtkCommand.ModifiedEvent,
-                                                                       self.updateTable)
-    self.reset()
+      self.currentGuidanceComputation.addEventObserver(vtk.vtkCommand.ModifiedEvent, self.updateTable)
+      self.currentGuidanceComputation.addEventObserver(ZFrameGuidanceComputation.TargetModifiedEvent,
+                                                       self.onTargetModified)
+    self.beginResetModel()
+    self.endResetModel()
 
   @property
   def coverProstateTargetList(self):
@@ -47,27 +52,13 @@ class TargetsDistanceTableModel(qt.QAbstractTableModel, ModuleLogicMixin):
   def coverProstateTargetList(self, targetList):
     self._coverProstateTargetList = targetList
 
-  @property
-  def cursorPosition(self):
-    return self._cursorPosition
-
-  @cursorPosition.setter
-  def cursorPosition(self, cursorPosition):
-    self._cursorPosition = cursorPosition
-    self.dataChanged(self.index(0, 1), self.index(self.rowCount()-1, 2))
-
   def __init__(self, ProstateAblationSession, targets=None, parent=None, *args):
     qt.QAbstractTableModel.__init__(self, parent, *args)
     self.session = ProstateAblationSession
-    self._cursorPosition = None
     self._targetList = None
-    self._guidanceComputations = []
     self.currentGuidanceComputation = None
     self.targetList = targets
-    self.computeCursorDistances = False
     self.currentTargetIndex = -1
-    self.observer = None
-    self.session.addEventObserver(self.session.ZFrameRegistrationSuccessfulEvent, self.onZFrameRegistrationSuccessful)
   
   def flags(self, index):
     if index.column() == self.getColunmNumForHeaderName(self.COLUMN_DISPLAY) \
@@ -88,27 +79,20 @@ class TargetsDistanceTableModel(qt.QAbstractTableModel, ModuleLogicMixin):
     return -1
 
   def getOrCreateNewGuidanceComputation(self, targetList):
-    if not targetList:
-      return None
-    guidance = None
-    for crntGuidance in self._guidanceComputations:
-      if crntGuidance.targetList is targetList:
-        guidance = crntGuidance
-        break
-    if not guidance:
-      self._guidanceComputations.append(ZFrameGuidanceComputation(self.session, targetList))
-      guidance = self._guidanceComputations[-1]
-    if self._targetList is targetList:
+    guidance = self.session.guidanceRegistry.getOrCreate(targetList)
+    if guidance and self._targetList is targetList:
       self.updateTable()
     return guidance
 
-  def onZFrameRegistrationSuccessful(self, caller, event):
-    self._guidanceComputations = []
-
   def updateTable(self, caller=None, event=None):
-    self.dataChanged(self.index(0, self.getColunmNumForHeaderName(self.COLUMN_HOLE)), self.index(self.rowCount() - 1, self.getColunmNumForHeaderName(self.COLUMN_DEPTH)))
+    self.dataChanged(self.index(0, 0), self.index(self.rowCount() - 1, self.columnCount() - 1))
     self.invokeEvent(vtk.vtkCommand.ModifiedEvent)
 
+  @vtk.calldata_type(vtk.VTK_STRING)
+  def onTargetModified(self, caller, event, callData):
+    row = int(callData)
+    self.dataChanged(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
   def rowCount(self):
     try:
       number_of_targets = self.targetList.GetNumberOfFiducials()
@@ -247,8 +231,6 @@ class TargetsDistanceTable(ProstateAblationPlugin):
     self.movingEnabled = kwargs.pop("movingEnabled", False)
     self.checkBoxList = dict()
     self.comboBoxList = dict()
-    self.keyPressEventObservers = {}
-    self.keyReleaseEventObservers = {}
     self.mouseReleaseEventObservers = {}
 
   def setup(self):
@@ -295,57 +277,12 @@ class TargetsDistanceTable(ProstateAblationPlugin):
     super(TargetsDistanceTable, self).onActivation()
     self.moveTargetMode = False
     self.currentlyMovedTargetModelIndex = None
-    self.connectKeyEventObservers()
     if self.currentTargets:
       self.onTargetSelectionChanged()
 
   def onDeactivation(self):
     super(TargetsDistanceTable, self).onDeactivation()
     self.disableTargetMovingMode()
-    self.disconnectKeyEventObservers()
-
-  def connectKeyEventObservers(self):
-    interactors = [self.yellowSliceViewInteractor]
-    if self.layoutManager.layout == constants.LAYOUT_FOUR_UP:
-      interactors += [self.redSliceViewInteractor, self.greenSliceViewInteractor]
-    for interactor in interactors:
-      self.keyPressEventObservers[interactor] = interactor.AddObserver("KeyPressEvent", self.onKeyPressedEvent)
-      self.keyReleaseEventObservers[interactor] = interactor.AddObserver("KeyReleaseEvent", self.onKeyReleasedEvent)
-
-  def disconnectKeyEventObservers(self):
-    for interactor, tag in self.keyPressEventObservers.items():
-      interactor.RemoveObserver(tag)
-    for interactor, tag in self.keyReleaseEventObservers.items():
-      interactor.RemoveObserver(tag)
-
-  def onKeyPressedEvent(self, caller, event):
-    if not caller.GetKeySym() == 'd':
-      return
-    if not self.targetTableModel.computeCursorDistances:
-      self.targetTableModel.computeCursorDistances = True
-      self.calcCursorTargetsDistance()
-      self.crosshairButton.addEventObserver(self.crosshairButton.CursorPositionModifiedEvent,
-                                            self.calcCursorTargetsDistance)
-
-  def onKeyReleasedEvent(self, caller, event):
-    if not caller.GetKeySym() == 'd':
-      return
-    self.targetTableModel.computeCursorDistances = False
-    self.crosshairButton.removeEventObserver(self.crosshairButton.CursorPositionModifiedEvent,
-                                             self.calcCursorTargetsDistance)
-
-  @vtk.calldata_type(vtk.VTK_OBJECT)
-  def calcCursorTargetsDistance(self, caller, event, callData):
-    if not self.targetTableModel.computeCursorDistances:
-      return
-    ras = xyz = [0.0, 0.0, 0.0]
-    insideView = callData.GetCursorPositionRAS(ras)
-    sliceNode = callData.GetCursorPositionXYZ(xyz)
-
-    if not insideView or sliceNode not in [self.redSliceNode, self.yellowSliceNode, self.greenSliceNode]:
-      self.targetTableModel.cursorPosition = None
-      return
-    self.targetTableModel.cursorPosition = ras
 
   def onTargetSelectionChanged(self, modelIndex=None):
     # onCurrentResultSelected event
@@ -1,5 +1,6 @@
 import os
 import ast
+import logging
 import shutil
 import qt
 import vtk
@@ -8,6 +9,7 @@ import slicer
 
 from ProstateAblationUtils.constants import ProstateAblationConstants
 from ProstateAblationUtils.steps.base import ProstateAblationPlugin
+from ProstateAblationUtils.replay import DICOMReplayEngine, ReplayTimingProfile, ZipReplaySource
 
 from SlicerDevelopmentToolboxUtils.helpers import SampleDataDownloader
 from SlicerDevelopmentToolboxUtils.decorators import *
@@ -16,10 +18,16 @@ from SlicerDevelopmentToolboxUtils.decorators import *
 class ProstateAblationTrainingPlugin(ProstateAblationPlugin):
 
   NAME = "Training"
+  REPLAY_POLL_INTERVAL_MS = 500
+  # the replay thread checks for being stopped between files, so that it ends within this time
+  REPLAY_STOP_TIMEOUT_S = 2.0
 
   def __init__(self, ProstateAblationSession):
     super(ProstateAblationTrainingPlugin, self).__init__(ProstateAblationSession)
     self.sampleDownloader = SampleDataDownloader(True)
+    self.replayEngine = None
+    self.replayTimer = qt.QTimer()
+    self.replayTimer.setInterval(self.REPLAY_POLL_INTERVAL_MS)
 
   def setup(self):
     super(ProstateAblationTrainingPlugin, self).setup()
@@ -28,13 +36,33 @@ class ProstateAblationTrainingPlugin(ProstateAblationPlugin):
     self.collapsibleTrainingArea.text = "Training Incoming Data Simulation"
 
     self.simulateIntraopPhaseButton = self.createButton("Simulate intraop reception", enabled=True)
+    self.stopSimulationButton = self.createButton("Stop", enabled=False)
+    self.timedReplayCheckBox = qt.QCheckBox("Timed replay")
+    self.timedReplayCheckBox.checked = False
+    self.timedReplayCheckBox.toolTip = "Send the sample series with the cadence of a scanner instead of all at once"
+    self.replaySpeedSpinBox = qt.QDoubleSpinBox()
+    self.replaySpeedSpinBox.minimum = 0
+    self.replaySpeedSpinBox.maximum = 100
+    self.replaySpeedSpinBox.singleStep = 0.5
+    self.replaySpeedSpinBox.suffix = "x"
+    self.replaySpeedSpinBox.specialValueText = "no delay"
+    self.replaySpeedSpinBox.value = self.getReplaySetting("Replay_Speed", 1)
+    self.replaySpeedSpinBox.toolTip = "Speed multiplier of the timed replay"
+    self.replaySpeedSpinBox.enabled = False
+    self.replayStatusLabel = qt.QLabel("")
 
     self.trainingsAreaLayout = qt.QGridLayout(self.collapsibleTrainingArea)
-    self.trainingsAreaLayout.addWidget(self.createHLayout([self.simulateIntraopPhaseButton]))
+    self.trainingsAreaLayout.addWidget(self.createHLayout([self.simulateIntraopPhaseButton, self.stopSimulationButton]))
+    self.trainingsAreaLayout.addWidget(self.createHLayout([self.timedReplayCheckBox, qt.QLabel("Speed:"),
+                                                           self.replaySpeedSpinBox, self.replayStatusLabel]))
     self.layout().addWidget(self.collapsibleTrainingArea)
 
   def setupConnections(self):
     self.simulateIntraopPhaseButton.clicked.connect(self.startIntraopPhaseSimulation)
+    self.stopSimulationButton.clicked.connect(self.stopIntraopPhaseSimulation)
+    self.timedReplayCheckBox.toggled.connect(lambda checked: setattr(self.replaySpeedSpinBox, "enabled", checked))
+    self.replaySpeedSpinBox.valueChanged.connect(self.onReplaySpeedChanged)
+    self.replayTimer.timeout.connect(self.onReplayTimerTimeout)
 
   def setupSessionObservers(self):
     super(ProstateAblationTrainingPlugin, self).setupSessionObservers()
@@ -48,9 +76,61 @@ class ProstateAblationTrainingPlugin(ProstateAblationPlugin):
     self.simulateIntraopPhaseButton.enabled = True
     intraopZipFile = self.initiateSampleDataDownload(ProstateAblationConstants.INTRAOP_SAMPLE_DATA_URL)
     if not self.sampleDownloader.wasCanceled() and intraopZipFile:
-      print(intraopZipFile)
-      self.unzipFileAndCopyToDirectory(intraopZipFile, self.session.intraopDICOMDirectory)
-      
+      if self.timedReplayCheckBox.checked:
+        self.startTimedReplay(intraopZipFile, self.session.intraopDICOMDirectory)
+      else:
+        self.unzipFileAndCopyToDirectory(intraopZipFile, self.session.intraopDICOMDirectory)
+
+  def getReplaySetting(self, name, default):
+    try:
+      return float(self.getSetting(name))
+    except (TypeError, ValueError):
+      return default
+
+  def startTimedReplay(self, filepath, destination):
+    import zipfile
+    self.stopIntraopPhaseSimulation()
+    try:
+      source = ZipReplaySource(filepath)
+    except zipfile.BadZipfile as exc:
+      slicer.util.errorDisplay("An error appeared while reading %s. If the file is corrupt, please delete it and try "
+                               "again." % filepath, detailedText=str(exc))
+      return
+    profile = ReplayTimingProfile(self.getReplaySetting("Replay_Slice_Interval", 0.1),
+                                  self.getReplaySetting("Replay_Series_Interval", 15))
+    self.replayEngine = DICOMReplayEngine(source, destination, profile, speed=self.replaySpeedSpinBox.value)
+    self.replayEngine.start()
+    self.simulateIntraopPhaseButton.enabled = False
+    self.stopSimulationButton.enabled = True
+    self.replayTimer.start()
+
+  def stopIntraopPhaseSimulation(self):
+    self.replayTimer.stop()
+    if self.replayEngine:
+      self.replayEngine.stop()
+      self.replayEngine.join(self.REPLAY_STOP_TIMEOUT_S)
+      if self.replayEngine.isRunning:
+        logging.warning("Replay did not stop within %.1f s, leaving it to finish in the background"
+                        % self.REPLAY_STOP_TIMEOUT_S)
+      self.replayEngine = None
+    self.replayStatusLabel.text = ""
+    self.stopSimulationButton.enabled = False
+
+  def onReplaySpeedChanged(self, value):
+    if self.replayEngine:
+      self.replayEngine.speed = value
+
+  def onReplayTimerTimeout(self):
+    written, total = self.replayEngine.progress
+    if total is None:
+      self.replayStatusLabel.text = "Reading sample data..."
+    else:
+      self.replayStatusLabel.text = "%d/%d files sent" % (written, total)
+    if not self.replayEngine.isRunning:
+      self.replayTimer.stop()
+      self.replayEngine = None
+      self.stopSimulationButton.enabled = False
+      self.simulateIntraopPhaseButton.enabled = True
 
   def initiateSampleDataDownload(self, url):
     filename = os.path.basename(url)
@@ -101,5 +181,6 @@ class ProstateAblationTrainingPlugin(ProstateAblationPlugin):
 
   @vtk.calldata_type(vtk.VTK_STRING)
   def onCaseClosed(self, caller, event, callData):
+    self.stopIntraopPhaseSimulation()
     self.simulateIntraopPhaseButton.enabled = False
     
@@ -1,4 +1,4 @@
-import sys, os
+import sys, os, logging
 import qt, vtk
 import csv, numpy
 import slicer
@@ -8,6 +8,7 @@ import SimpleITK as sitk
 import sitkUtils
 
 from ProstateAblationUtils.constants import ProstateAblationConstants
+from ProstateAblationUtils.templateHoleIndex import TemplateHoleIndex
 from ProstateAblationUtils.steps.base import ProstateAblationLogicBase, ProstateAblationStep
 
 from SlicerDevelopmentToolboxUtils.decorators import onModuleSelected
@@ -49,9 +50,7 @@ class OpenSourceZFrameRegistration(ZFrameRegistrationBase):
     print(params)
     slicer.cli.run(slicer.modules.zframeregistration, None, params, wait_for_completion=True)
 
-class ProstateAblationZFrameRegistrationStepLogic(ProstateAblationLogicBase):
-
-  __metaclass__ = Singleton
+class ProstateAblationZFrameRegistrationStepLogic(ProstateAblationLogicBase, metaclass=Singleton):
 
   ZFRAME_MODEL_PATH = 'zframe-model.vtk'
   ZFRAME_TEMPLATE_VTK_FILE_NAME = 'CryoTemplate.vtk'
@@ -69,6 +68,24 @@ class ProstateAblationZFrameRegistrationStepLogic(ProstateAblationLogicBase):
   def zFrameSuccessfulLoaded(self):
     return self.zFrameModelNode
 
+  @property
+  def pathOrigins(self):
+    """ Nx3 origins of needle paths (after transformation by parent transform node) """
+    self.updateTemplateVectors()
+    return self._pathOrigins
+
+  @property
+  def pathVectors(self):
+    """ Nx3 normal vectors of needle paths (after transformation by parent transform node) """
+    self.updateTemplateVectors()
+    return self._pathVectors
+
+  @property
+  def worldToTemplate(self):
+    """ 4x4 inverse of the parent transform, None unless the transform is rigid """
+    self.updateTemplateVectors()
+    return self._worldToTemplate
+
   def __init__(self, ProstateAblationSession):
     super(ProstateAblationZFrameRegistrationStepLogic, self).__init__(ProstateAblationSession)
     self.resourcesPath = os.path.join(self.modulePath, "Resources")
@@ -88,8 +105,11 @@ class ProstateAblationZFrameRegistrationStepLogic(ProstateAblationLogicBase):
     self.pathModelNode = None
     self.templateConfig = []
     self.templateMaxDepth = []
-    self.pathOrigins = []  ## Origins of needle paths (after transformation by parent transform node)
-    self.pathVectors = []  ## Normal vectors of needle paths (after transformation by parent transform node)
+    self._pathOrigins = numpy.empty((0, 3))
+    self._pathVectors = numpy.empty((0, 3))
+    self._worldToTemplate = None
+    self.templateTransformKey = None  ## (ID, transform to world MTime) of the parent transform the paths belong to
+    self.templateHoleIndex = None  ## nearest needle path lookup in the template frame, built once per template
 
     self.clearOldNodes()
     self.loadZFrameModel()
@@ -151,8 +171,8 @@ class ProstateAblationZFrameRegistrationStepLogic(ProstateAblationLogicBase):
     self.updateTemplateVectors()
 
   def createTemplateAndNeedlePathModel(self):
-    self.templatePathVectors = []
-    self.templatePathOrigins = []
+    templatePathVectors = []
+    templatePathOrigins = []
 
     zFrameTemplateModelFile= os.path.join(self.resourcesPath, self.ZFRAME_TEMPLATE_VTK_FILE_NAME)
     _, self.tempModelNode = slicer.util.loadModel(zFrameTemplateModelFile, returnNode=True)
@@ -165,14 +185,27 @@ class ProstateAblationZFrameRegistrationStepLogic(ProstateAblationLogicBase):
     for row in self.templateConfig:
       p, n = self.extractPointsAndNormalVectors(row)
 
-      self.templatePathOrigins.append([row[0], row[1], row[2], 1.0])
-      self.templatePathVectors.append([n[0], n[1], n[2], 1.0])
+      templatePathOrigins.append([row[0], row[1], row[2], 1.0])
+      templatePathVectors.append([n[0], n[1], n[2], 0.0])
       self.templateMaxDepth.append(row[6])
+    ## Nx4 homogeneous origins and directions of needle paths in the template frame
+    self.templatePathOrigins = numpy.array(templatePathOrigins, dtype=float).reshape(-1, 4)
+    self.templatePathVectors = numpy.array(templatePathVectors, dtype=float).reshape(-1, 4)
+    self.templateTransformKey = None
+    self.createTemplateHoleIndex()
     self.tempModelNode.GetDisplayNode().SetColor(0.5,0,1)
     self.tempModelNode.GetDisplayNode().SetSliceIntersectionVisibility(True)
     self.pathModelNode.GetDisplayNode().SetColor(0.8,0.5,1)
     self.pathModelNode.GetDisplayNode().SetSliceIntersectionVisibility(True)
 
+  def createTemplateHoleIndex(self):
+    self.templateHoleIndex = None
+    vectors = self.templatePathVectors[:, :3]
+    if TemplateHoleIndex.isApplicable(vectors):
+      self.templateHoleIndex = TemplateHoleIndex(self.templatePathOrigins[:, :3], vectors)
+    else:
+      logging.debug("Needle paths of the template are not parallel. Not using the template hole index.")
+
   def extractPointsAndNormalVectors(self, row):
     p1 = numpy.array(row[0:3])
     p2 = numpy.array(row[3:6])
@@ -187,26 +220,31 @@ class ProstateAblationZFrameRegistrationStepLogic(ProstateAblationLogicBase):
     if self.tempModelNode is None:
       return
 
-    trans = vtk.vtkMatrix4x4()
     transformNode = self.tempModelNode.GetParentTransformNode()
+    transformKey = (transformNode.GetID(), transformNode.GetTransformToWorldMTime()) if transformNode else None
+    if transformKey == self.templateTransformKey and len(self._pathOrigins) == len(self.templatePathOrigins):
+      return
+
+    trans = vtk.vtkMatrix4x4()
     if transformNode is not None:
       transformNode.GetMatrixTransformToWorld(trans)
     else:
       trans.Identity()
-    # Calculate offset
-    zero = [0.0, 0.0, 0.0, 1.0]
-    offset = trans.MultiplyDoublePoint(zero)
-
-    self.pathOrigins = []
-    self.pathVectors = []
-
-    for i, orig in enumerate(self.templatePathOrigins):
-      torig = trans.MultiplyDoublePoint(orig)
-      self.pathOrigins.append(numpy.array(torig[0:3]))
-      vec = self.templatePathVectors[i]
-      tvec = trans.MultiplyDoublePoint(vec)
-      self.pathVectors.append(numpy.array([tvec[0] - offset[0], tvec[1] - offset[1], tvec[2] - offset[2]]))
-      i += 1
+    matrix = numpy.array([[trans.GetElement(row, column) for column in range(4)] for row in range(4)])
+
+    # directions have a homogeneous coordinate of 0, so that the translation does not apply to them
+    self._pathOrigins = self.templatePathOrigins.dot(matrix.T)[:, :3]
+    self._pathVectors = self.templatePathVectors.dot(matrix.T)[:, :3]
+    self.updateWorldToTemplate(matrix)
+    self.templateTransformKey = transformKey
+
+  def updateWorldToTemplate(self, matrix):
+    rotation = matrix[:3, :3]
+    # lookups in the template frame preserve distances and depths only for rigid transforms
+    if numpy.allclose(rotation.T.dot(rotation), numpy.identity(3), atol=1e-6):
+      self._worldToTemplate = numpy.linalg.inv(matrix)
+    else:
+      self._worldToTemplate = None
 
   def setZFrameVisibility(self, visibility):
     self.setNodeVisibility(self.zFrameModelNode, visibility)
@@ -0,0 +1,213 @@
+import numpy
+
+try:
+  from scipy.spatial import cKDTree
+except ImportError:
+  cKDTree = None
+
+
+def computePathDistances(points, origins, vectors):
+  """ Returns the depths along and the squared perpendicular distances to all N needle paths as M x N arrays """
+  op = points[:, numpy.newaxis, :] - origins[numpy.newaxis, :, :]
+  aproj = numpy.einsum("mnk,nk->mn", op, vectors)
+  # |op - aproj * vec|^2 expanded, so that the perpendicular vectors are never built
+  mag2 = numpy.einsum("mnk,mnk->mn", op, op) + aproj ** 2 * (numpy.einsum("nk,nk->n", vectors, vectors) - 2)
+  return aproj, mag2
+
+
+def findNearestPaths(positions, origins, vectors, holeIndex=None, worldToTemplate=None):
+  """ Returns the indices of the needle paths closest to each of the M positions and the depths along these paths.
+
+  Positions are transformed into the template frame and looked up in the template hole index if both holeIndex and
+  worldToTemplate are given. Otherwise projection, perpendicular distance and depth are computed for all M x N pairs
+  of positions and paths at once. The index is -1 if there are no paths.
+
+  Args:
+    positions (array): Mx3 RAS positions
+    origins (array): Nx3 needle path origins in RAS
+    vectors (array): Nx3 needle path directions in RAS
+    holeIndex (TemplateHoleIndex): index of the needle paths in the template frame
+    worldToTemplate (array): 4x4 rigid transform from RAS into the template frame
+  """
+  points = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+  if not len(origins) or not len(points):
+    return numpy.full(len(points), -1, dtype=int), numpy.zeros(len(points))
+  if holeIndex is not None and worldToTemplate is not None:
+    return holeIndex.query(points.dot(worldToTemplate[:3, :3].T) + worldToTemplate[:3, 3])
+  aproj, mag2 = computePathDistances(points, origins, vectors)
+  minIndices = numpy.argmin(mag2, axis=1)
+  return minIndices, aproj[numpy.arange(len(points)), minIndices]
+
+
+class TemplateHoleIndex(object):
+  """ Constant time lookup of the needle path nearest to a position given in the frame of the template.
+
+  The needle paths of a template are parallel, so that the nearest path is the one whose hole is nearest to the
+  position projected onto the template plane. Holes are bucketed into a grid with cells as large as the typical hole
+  spacing and every cell lists the holes of its 3x3 neighbourhood, so that a lookup only compares a handful of holes.
+  Positions farther than one cell from every hole (i.e. outside of the template) and templates without a regular
+  hole spacing are resolved with a KD-tree if scipy is available or by comparing all holes otherwise.
+
+  Args:
+    origins (array): Nx3 needle path origins in the template frame
+    directions (array): Nx3 needle path directions in the template frame
+  """
+
+  PARALLEL_TOLERANCE = 1e-6
+
+  @classmethod
+  def isApplicable(cls, directions):
+    directions = numpy.asarray(directions, dtype=float).reshape(-1, 3)
+    if not len(directions):
+      return False
+    directions = directions / numpy.linalg.norm(directions, axis=1)[:, numpy.newaxis]
+    return bool(numpy.all(numpy.abs(directions - directions[0]) < cls.PARALLEL_TOLERANCE))
+
+  def __init__(self, origins, directions):
+    if not self.isApplicable(directions):
+      raise ValueError("The needle paths of the template are not parallel")
+    self.origins = numpy.asarray(origins, dtype=float).reshape(-1, 3)
+    direction = numpy.asarray(directions, dtype=float).reshape(-1, 3)[0]
+    self.direction = direction / numpy.linalg.norm(direction)
+    self.basis = self._getPlaneBasis(self.direction)
+    self.holes = self.origins.dot(self.basis.T)
+    self.cellSize = self._getHoleSpacing(self.holes)
+    self._tree = cKDTree(self.holes) if cKDTree is not None else None
+    self._buildCells()
+
+  @staticmethod
+  def _getPlaneBasis(direction):
+    helper = numpy.array([1.0, 0.0, 0.0]) if abs(direction[0]) < 0.9 else numpy.array([0.0, 1.0, 0.0])
+    u = numpy.cross(direction, helper)
+    u /= numpy.linalg.norm(u)
+    return numpy.array([u, numpy.cross(direction, u)])
+
+  @staticmethod
+  def _getHoleSpacing(holes):
+    if len(holes) < 2:
+      return 0.0
+    distances = numpy.linalg.norm(holes[:, numpy.newaxis, :] - holes[numpy.newaxis, :, :], axis=2)
+    numpy.fill_diagonal(distances, numpy.inf)
+    return float(numpy.median(distances.min(axis=1)))
+
+  def _buildCells(self):
+    self._cells = None
+    if not self.cellSize:
+      return
+    self._cellOrigin = self.holes.min(axis=0) - self.cellSize
+    holeCells = numpy.floor((self.holes - self._cellOrigin) / self.cellSize).astype(int)
+    shape = tuple(holeCells.max(axis=0) + 2)
+    candidates = {}
+    for hole, (i, j) in enumerate(holeCells):
+      for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+          candidates.setdefault((i + di, j + dj), []).append(hole)
+    width = max(len(holes) for holes in candidates.values())
+    self._cells = numpy.full(shape + (width,), -1, dtype=int)
+    for (i, j), holes in candidates.items():
+      if 0 <= i < shape[0] and 0 <= j < shape[1]:
+        self._cells[i, j, :len(holes)] = holes
+
+  def query(self, points):
+    """ Returns the indices of the nearest needle paths and the depths of the points along these paths
+
+    Args:
+      points (array): Mx3 positions in the template frame
+    """
+    points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+    projected = points.dot(self.basis.T)
+    indices = numpy.full(len(points), -1, dtype=int)
+    unresolved = numpy.ones(len(points), dtype=bool)
+    if self._cells is not None and len(points):
+      cells = numpy.floor((projected - self._cellOrigin) / self.cellSize).astype(int)
+      inside = numpy.all((cells >= 0) & (cells < self._cells.shape[:2]), axis=1)
+      candidates = self._cells[cells[inside, 0], cells[inside, 1]]
+      distances2 = ((self.holes[candidates] - projected[inside, numpy.newaxis, :]) ** 2).sum(axis=2)
+      distances2[candidates == -1] = numpy.inf
+      best = distances2.argmin(axis=1)
+      rows = numpy.arange(len(candidates))
+      # a hole closer than one cell is always part of the 3x3 neighbourhood
+      resolved = distances2[rows, best] <= self.cellSize ** 2
+      insideIndices = numpy.flatnonzero(inside)
+      indices[insideIndices[resolved]] = candidates[rows, best][resolved]
+      unresolved[insideIndices[resolved]] = False
+    if unresolved.any():
+      indices[unresolved] = self._queryAll(projected[unresolved])
+    depths = ((points - self.origins[indices]) * self.direction).sum(axis=1)
+    return indices, depths
+
+  def _queryAll(self, projected):
+    if self._tree is not None:
+      return self._tree.query(projected)[1]
+    distances2 = ((projected[:, numpy.newaxis, :] - self.holes[numpy.newaxis, :, :]) ** 2).sum(axis=2)
+    return distances2.argmin(axis=1)
+
+
+class ReachabilityGrid(object):
+  """ Nearest needle path, depth and in-range flag of every voxel of an axis aligned grid in RAS.
+
+  Arrays are indexed [k, j, i] with i along R, j along A and k along S, like the arrays of Slicer volumes. Looking up
+  a position reads the voxel it falls into, so that depths are the ones of the voxel center.
+
+  Args:
+    origin (array): RAS position of the center of voxel (0, 0, 0)
+    spacing (float): voxel size in mm
+    shape (tuple): number of voxels (K, J, I)
+  """
+
+  # voxels are looked up in chunks whose M x N x 3 float64 arrays of the exhaustive search stay below this size
+  CHUNK_BYTES = 8 * 1024 * 1024
+
+  @classmethod
+  def getChunkSize(cls, numberOfPaths):
+    return max(1, cls.CHUNK_BYTES // (max(1, numberOfPaths) * 3 * numpy.dtype(float).itemsize))
+
+  @classmethod
+  def create(cls, bounds, spacing, findNearestPaths, maxDepths, isCancelled=None):
+    """ Rasterizes the nearest needle paths within the RAS bounds (Rmin, Rmax, Amin, Amax, Smin, Smax)
+
+    Args:
+      findNearestPaths (callable): maps Mx3 RAS positions to the indices of the nearest paths and the depths along them
+      maxDepths (array): N maximum depths of the needle paths
+      isCancelled (callable): polled between chunks of voxels, the grid is not completed if it returns True
+
+    Returns:
+      ReachabilityGrid: None if cancelled
+    """
+    origin = numpy.array(bounds[0::2], dtype=float)
+    size = numpy.floor((numpy.array(bounds[1::2], dtype=float) - origin) / spacing).astype(int) + 1
+    grid = cls(origin, spacing, tuple(numpy.maximum(size, 1)[::-1]))
+    chunkSize = cls.getChunkSize(len(maxDepths))
+    for start in range(0, grid.paths.size, chunkSize):
+      if isCancelled and isCancelled():
+        return None
+      voxels = numpy.arange(start, min(start + chunkSize, grid.paths.size))
+      kji = numpy.array(numpy.unravel_index(voxels, grid.shape))
+      indices, depths = findNearestPaths(origin + spacing * kji[::-1].T)
+      grid.paths.flat[voxels] = indices
+      grid.depths.flat[voxels] = depths
+    maxDepths = numpy.append(numpy.asarray(maxDepths, dtype=float), 0)
+    # index -1 reads the appended maximum depth of 0, so that voxels without a path are never in range
+    grid.inRange = (grid.depths > 0) & (grid.depths < maxDepths[grid.paths])
+    return grid
+
+  def __init__(self, origin, spacing, shape):
+    self.origin = numpy.asarray(origin, dtype=float)
+    self.spacing = float(spacing)
+    self.shape = tuple(shape)
+    self.paths = numpy.full(self.shape, -1, dtype=numpy.int32)
+    self.depths = numpy.zeros(self.shape, dtype=numpy.float32)
+    self.inRange = numpy.zeros(self.shape, dtype=bool)
+
+  def lookup(self, positions):
+    """ Returns path indices, depths and in-range flags for the M positions and whether they are within the grid.
+
+    Positions outside of the grid have the path index -1.
+    """
+    points = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+    ijk = numpy.rint((points - self.origin) / self.spacing).astype(int)
+    inside = numpy.all((ijk >= 0) & (ijk < self.shape[::-1]), axis=1)
+    ijk[~inside] = 0
+    k, j, i = ijk[:, 2], ijk[:, 1], ijk[:, 0]
+    return (numpy.where(inside, self.paths[k, j, i], -1), numpy.where(inside, self.depths[k, j, i], 0.0),
+            inside & self.inRange[k, j, i], inside)
@@ -0,0 +1,260 @@
+import time
+import logging
+import numpy
+
+import vtk
+import slicer
+
+from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
+
+from ProstateAblationUtils.dicomHeaders import pydicom
+from ProstateAblationUtils.dicomIndex import IntraopSeriesIndex
+
+
+def readDICOMSlice(filename, out=None):
+  """ Decodes the rescaled pixel data of a single-frame DICOM file. Safe to be called from a worker thread.
+
+  If out is given, the pixels are written into it instead of a new array.
+  """
+  return getRescaledPixels(pydicom.dcmread(filename, force=True), out, filename)
+
+
+def getRescaledPixels(dataset, out=None, name=None):
+  """ Returns the rescaled pixel data of a single-frame dataset, see readDICOMSlice """
+  pixels = dataset.pixel_array
+  slope = float(dataset.get("RescaleSlope", 1) or 1)
+  intercept = float(dataset.get("RescaleIntercept", 0) or 0)
+  if out is None:
+    return pixels * slope + intercept if slope != 1 or intercept != 0 else pixels
+  if pixels.shape != out.shape:
+    raise ValueError("Unexpected slice dimensions %s in %s" % (pixels.shape, name))
+  out[...] = pixels
+  if out.dtype.kind != "f":
+    slope, intercept = int(slope), int(intercept)
+  if slope != 1:
+    out *= slope
+  if intercept != 0:
+    out += intercept
+  return out
+
+
+def getRescaledDataType(header, dataType):
+  slope = IntraopSeriesIndex.getFloatValues(header, "RescaleSlope") or [1.0]
+  intercept = IntraopSeriesIndex.getFloatValues(header, "RescaleIntercept") or [0.0]
+  if slope[0] != 1.0 or intercept[0] != 0.0:
+    if slope[0] != int(slope[0]) or intercept[0] != int(intercept[0]):
+      return numpy.float32
+    return numpy.int32 if numpy.dtype(dataType).itemsize >= 2 else numpy.int16
+  return dataType
+
+
+def getSliceDataType(header):
+  bitsAllocated = int(header.get("BitsAllocated") or 16)
+  signed = header.get("PixelRepresentation") == "1"
+  dataType = {8: numpy.uint8, 16: numpy.uint16, 32: numpy.uint32}[bitsAllocated]
+  if signed:
+    dataType = {8: numpy.int8, 16: numpy.int16, 32: numpy.int32}[bitsAllocated]
+  return getRescaledDataType(header, dataType)
+
+
+class SliceGeometry(object):
+  """ Position and orientation of a single slice in LPS as described by its header fields. """
+
+  def __init__(self, header):
+    self.position = numpy.array(IntraopSeriesIndex.getFloatValues(header, "ImagePositionPatient"))
+    orientation = IntraopSeriesIndex.getFloatValues(header, "ImageOrientationPatient")
+    spacing = IntraopSeriesIndex.getFloatValues(header, "PixelSpacing")
+    if len(self.position) != 3 or len(orientation) != 6 or len(spacing) != 2:
+      raise ValueError("Incomplete geometry information")
+    self.rowDirection = numpy.array(orientation[0:3])
+    self.columnDirection = numpy.array(orientation[3:6])
+    self.normal = numpy.cross(self.rowDirection, self.columnDirection)
+    self.pixelSpacing = spacing
+    self.dimensions = (int(header["Rows"]), int(header["Columns"]))
+
+  @property
+  def distance(self):
+    return float(numpy.dot(self.normal, self.position))
+
+  def isCompatible(self, other, tolerance=1e-4):
+    return self.dimensions == other.dimensions and \
+           numpy.allclose(self.rowDirection, other.rowDirection, atol=tolerance) and \
+           numpy.allclose(self.columnDirection, other.columnDirection, atol=tolerance) and \
+           numpy.allclose(self.pixelSpacing, other.pixelSpacing, atol=tolerance)
+
+
+def computeIJKToRASMatrix(geometries, defaultSliceSpacing=1.0):
+  """ Computes the IJK to RAS matrix for slices sorted along their normal. """
+  first = geometries[0]
+  sliceSpacing = defaultSliceSpacing
+  if len(geometries) > 1:
+    sliceSpacing = (geometries[-1].distance - first.distance) / (len(geometries) - 1)
+  lpsToRAS = numpy.diag([-1.0, -1.0, 1.0])
+  matrix = vtk.vtkMatrix4x4()
+  columns = [first.rowDirection * first.pixelSpacing[1],
+             first.columnDirection * first.pixelSpacing[0],
+             first.normal * sliceSpacing,
+             first.position]
+  for col, vector in enumerate(columns):
+    for row, value in enumerate(lpsToRAS.dot(vector)):
+      matrix.SetElement(row, col, value)
+  return matrix
+
+
+def createOrUpdateVolumeNode(volumeNode, array, ijkToRAS, name):
+  if volumeNode is None:
+    volumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode", name)
+    volumeNode.CreateDefaultDisplayNodes()
+  else:
+    volumeNode.SetName(name)
+  slicer.util.updateVolumeFromArray(volumeNode, array)
+  volumeNode.SetIJKToRASMatrix(ijkToRAS)
+  return volumeNode
+
+
+def sortSlices(files, headers):
+  """ Returns (filename, SliceGeometry) tuples sorted along the slice normal.
+
+  Raises:
+    ValueError: if a header misses geometry information or the slices do not share orientation and dimensions
+  """
+  slices = [(filename, SliceGeometry(header)) for filename, header in zip(files, headers)]
+  reference = slices[0][1]
+  for filename, geometry in slices:
+    if not reference.isCompatible(geometry):
+      raise ValueError("Slice geometry of %s differs from the rest of the series" % filename)
+  return sorted(slices, key=lambda s: s[1].distance)
+
+
+def checkUniformSliceSpacing(geometries, tolerance=0.01):
+  distances = numpy.diff([geometry.distance for geometry in geometries])
+  if len(distances) and (numpy.any(distances <= 0) or numpy.ptp(distances) > tolerance * max(distances.max(), 1.0)):
+    raise ValueError("Slices are not equally spaced")
+
+
+def decodeSeriesVolume(files, headers):
+  """ Decodes a single-frame series into one array. Safe to be called from a worker thread.
+
+  Slices are sorted by their position taken from the given headers and decoded straight into one preallocated
+  array, so the series is parsed exactly once.
+
+  Returns:
+    (array, geometries) with the geometries sorted like the slices of the array
+
+  Raises:
+    ValueError: if the series cannot be represented as a regular volume
+  """
+  if pydicom is None:
+    raise ValueError("pydicom is not available")
+  slices = sortSlices(files, headers)
+  geometries = [geometry for _, geometry in slices]
+  checkUniformSliceSpacing(geometries)
+  array = numpy.empty((len(slices),) + geometries[0].dimensions, dtype=getSliceDataType(headers[0]))
+  for index, (filename, _) in enumerate(slices):
+    readDICOMSlice(filename, out=array[index])
+  return array, geometries
+
+
+def createSeriesVolumeNode(array, geometries, name):
+  return createOrUpdateVolumeNode(None, array, computeIJKToRASMatrix(geometries), name)
+
+
+def loadSeriesVolume(files, headers, name):
+  """ Loads a single-frame series into a new scalar volume node.
+
+  Raises:
+    ValueError: if the series cannot be represented as a regular volume
+  """
+  array, geometries = decodeSeriesVolume(files, headers)
+  return createSeriesVolumeNode(array, geometries, name)
+
+
+class ProgressiveSeriesAssembler(ModuleLogicMixin):
+  """ Builds the volume of a series while its slices are still being received.
+
+  The volume node is updated in place at most every UPDATE_INTERVAL seconds and holds all slices received so far,
+  sorted along the slice normal. Until finalize is called, the node name and the RECEIVED_SLICES_ATTRIBUTE mark the
+  received slab.
+  """
+
+  UPDATE_INTERVAL = 0.5
+  RECEIVED_SLICES_ATTRIBUTE = "ProstateAblation.ReceivedSlices"
+
+  @property
+  def numberOfSlices(self):
+    return len(self._slices)
+
+  @property
+  def expectedNumberOfSlices(self):
+    return self._expectedNumberOfSlices
+
+  def __init__(self, name):
+    self.name = name
+    self.volumeNode = None
+    self.finalized = False
+    self.files = []
+    self.valid = pydicom is not None
+    self._slices = {}
+    self._referenceGeometry = None
+    self._expectedNumberOfSlices = None
+    self._modified = False
+    self.lastUpdateTime = 0
+
+  def addSlice(self, filename, header, pixels=None):
+    """ Adds a received slice. pixels may hold the already decoded slice, otherwise it is read from the file. """
+    if not self.valid or self.finalized or filename in self._slices:
+      return
+    try:
+      geometry = SliceGeometry(header)
+      if self._referenceGeometry and not self._referenceGeometry.isCompatible(geometry):
+        raise ValueError("Slice geometry differs from the first received slice")
+      if pixels is None:
+        pixels = readDICOMSlice(filename)
+    except Exception as exc:
+      logging.info("Progressive assembly disabled for %s: %s" % (self.name, exc))
+      self.valid = False
+      return
+    self._referenceGeometry = self._referenceGeometry or geometry
+    self._slices[filename] = (geometry, pixels)
+    try:
+      self._expectedNumberOfSlices = int(header.get("ImagesInAcquisition")) or None
+    except (TypeError, ValueError):
+      pass
+    self._modified = True
+
+  def update(self, force=False):
+    if not self.valid or not self._modified or not self._slices:
+      return self.volumeNode
+    if not force and time.time() - self.lastUpdateTime < self.UPDATE_INTERVAL:
+      return self.volumeNode
+    slices = sorted(self._slices.values(), key=lambda s: s[0].distance)
+    geometries = [geometry for geometry, _ in slices]
+    array = numpy.empty((len(slices),) + geometries[0].dimensions, dtype=slices[0][1].dtype)
+    for index, (_, pixels) in enumerate(slices):
+      array[index] = pixels
+    self.volumeNode = createOrUpdateVolumeNode(self.volumeNode, array, computeIJKToRASMatrix(geometries),
+                                               self.name if self.finalized else self.getReceivingName())
+    if self.finalized:
+      self.volumeNode.RemoveAttribute(self.RECEIVED_SLICES_ATTRIBUTE)
+    else:
+      self.volumeNode.SetAttribute(self.RECEIVED_SLICES_ATTRIBUTE, self.getReceivedSlab())
+    self._modified = False
+    self.lastUpdateTime = time.time()
+    return self.volumeNode
+
+  def getReceivedSlab(self):
+    return "%d/%s" % (self.numberOfSlices, self._expectedNumberOfSlices or "?")
+
+  def getReceivingName(self):
+    return "%s [receiving %s]" % (self.name, self.getReceivedSlab())
+
+  def finalize(self):
+    """ Marks the series complete and returns the final volume node or None if the volume could not be assembled """
+    if not self.valid:
+      return None
+    self.finalized = True
+    self._modified = True
+    self.update(force=True)
+    self.files = list(self._slices.keys())
+    self._slices = {}
+    return self.volumeNode
@@ -0,0 +1,102 @@
+import logging
+from collections import OrderedDict
+
+import slicer
+
+from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
+
+
+class SeriesVolumeCache(ModuleLogicMixin):
+  """ Loaded series volumes in least recently used order, limited by a memory budget.
+
+  Accessing a series marks it as most recently used. Volumes that were removed from the scene by someone else are
+  treated as not loaded.
+
+  Args:
+    budget (int): memory budget in bytes for the image data of all cached volumes. 0 disables eviction.
+  """
+
+  def __init__(self, budget=0):
+    self.budget = budget
+    self._volumes = OrderedDict()
+
+  def __contains__(self, series):
+    return self._getPresentVolume(series) is not None
+
+  def __getitem__(self, series):
+    volume = self._getPresentVolume(series)
+    if volume is None:
+      raise KeyError(series)
+    self._volumes[series] = self._volumes.pop(series)
+    return volume
+
+  def __setitem__(self, series, volume):
+    self._volumes.pop(series, None)
+    self._volumes[series] = volume
+
+  def __len__(self):
+    return len(self._volumes)
+
+  def _getPresentVolume(self, series):
+    volume = self._volumes.get(series)
+    if volume is not None and not slicer.mrmlScene.IsNodePresent(volume):
+      del self._volumes[series]
+      volume = None
+    return volume
+
+  def get(self, series, default=None):
+    """ Returns the volume of a series without marking it as used """
+    volume = self._getPresentVolume(series)
+    return default if volume is None else volume
+
+  def keys(self):
+    return list(self._volumes.keys())
+
+  def values(self):
+    return list(self._volumes.values())
+
+  def items(self):
+    return list(self._volumes.items())
+
+  def pop(self, series, default=None):
+    return self._volumes.pop(series, default)
+
+  def clear(self):
+    self._volumes.clear()
+
+  @staticmethod
+  def getMemorySize(volume):
+    imageData = volume.GetImageData() if volume else None
+    if not imageData:
+      return 0
+    return imageData.GetActualMemorySize() * 1024
+
+  def getTotalMemorySize(self):
+    return sum(self.getMemorySize(volume) for volume in self._volumes.values())
+
+  def evict(self, pinnedVolumes=None):
+    """ Removes least recently used volumes from the scene until the cached image data fits into the budget.
+
+    The most recently used volume and volumes listed in pinnedVolumes are never evicted.
+
+    Returns:
+      list of evicted series
+    """
+    if not self.budget:
+      return []
+    pinnedVolumes = [v for v in pinnedVolumes or [] if v is not None]
+    totalSize = self.getTotalMemorySize()
+    evicted = []
+    for series, volume in list(self._volumes.items())[:-1]:
+      if totalSize <= self.budget:
+        break
+      if volume in pinnedVolumes:
+        continue
+      totalSize -= self.getMemorySize(volume)
+      del self._volumes[series]
+      if slicer.mrmlScene.IsNodePresent(volume):
+        slicer.mrmlScene.RemoveNode(volume)
+      evicted.append(series)
+    if evicted:
+      logging.info("Evicted series volumes to stay within the memory budget: %s" % evicted)
+    return evicted
@@ -0,0 +1,135 @@
+import os
+import re
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import vtk
+import slicer
+from vtk.util import numpy_support
+
+from SlicerDevelopmentToolboxUtils.mixins import ModuleLogicMixin
+
+
+class SeriesVoxelCache(ModuleLogicMixin):
+  """ Stores the voxels of loaded series as .npy files next to a JSON file holding their geometry.
+
+  Cached series are memory-mapped when they are loaded again, so that the pixel data is neither decoded nor copied.
+  An entry is only used as long as the DICOM files of the series did not change. Entries are written on a worker
+  thread and become visible once they were written completely.
+  """
+
+  DIRECTORY_NAME = "VoxelCache"
+  VERSION = 1
+
+  def __init__(self, outputDirectory):
+    self.directory = os.path.join(outputDirectory, self.DIRECTORY_NAME)
+    self._executor = ThreadPoolExecutor(max_workers=1)
+    self._pending = {}
+
+  def _getBaseName(self, series):
+    return os.path.join(self.directory, re.sub(r"[^\w.-]+", "_", series))
+
+  def getFingerprint(self, files):
+    fingerprint = []
+    for filename in sorted(files):
+      try:
+        stat = os.stat(filename)
+      except OSError:
+        return None
+      fingerprint.append([os.path.basename(filename), stat.st_size, stat.st_mtime])
+    return fingerprint
+
+  def _readMetadata(self, series, files):
+    baseName = self._getBaseName(series)
+    if not os.path.exists(baseName + ".json") or not os.path.exists(baseName + ".npy"):
+      return None
+    try:
+      with open(baseName + ".json") as metadataFile:
+        metadata = json.load(metadataFile)
+    except ValueError:
+      return None
+    if metadata.get("version") != self.VERSION or metadata.get("fingerprint") != self.getFingerprint(files):
+      return None
+    return metadata
+
+  def contains(self, series, files):
+    return self._readMetadata(series, files) is not None
+
+  def load(self, series, files):
+    """ Returns a new volume node backed by the memory-mapped voxels of the series or None if it is not cached """
+    metadata = self._readMetadata(series, files)
+    if metadata is None:
+      return None
+    try:
+      # copy-on-write: modifications of the volume never reach the cache file
+      array = numpy.load(self._getBaseName(series) + ".npy", mmap_mode="c")
+    except (IOError, OSError, ValueError) as exc:
+      logging.warning("Could not read voxel cache of %s: %s" % (series, exc))
+      return None
+    imageData = vtk.vtkImageData()
+    imageData.SetDimensions(array.shape[2], array.shape[1], array.shape[0])
+    scalars = numpy_support.numpy_to_vtk(array.reshape(-1), deep=False)
+    imageData.GetPointData().SetScalars(scalars)
+    # the VTK array does not own the memory-mapped buffer
+    imageData.voxelCacheArray = array
+    ijkToRAS = vtk.vtkMatrix4x4()
+    for index, value in enumerate(metadata["ijkToRAS"]):
+      ijkToRAS.SetElement(index // 4, index % 4, value)
+    volumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode", series)
+    volumeNode.SetAndObserveImageData(imageData)
+    volumeNode.SetIJKToRASMatrix(ijkToRAS)
+    volumeNode.CreateDefaultDisplayNodes()
+    return volumeNode
+
+  def store(self, series, files, volumeNode):
+    """ Writes the voxels of a single-component volume once, unless a valid entry exists already.
+
+    Args:
+      series (str): series the volume belongs to
+      files (list): DICOM files the volume was decoded from, their fingerprint validates the entry
+      volumeNode (vtkMRMLScalarVolumeNode): volume to write
+    """
+    imageData = volumeNode.GetImageData() if volumeNode else None
+    fingerprint = self.getFingerprint(files)
+    if not imageData or imageData.GetNumberOfScalarComponents() != 1 or not fingerprint or \
+        self.isPending(series, fingerprint) or self.contains(series, files):
+      return
+    if not os.path.exists(self.directory):
+      self.createDirectory(self.directory)
+    ijkToRAS = vtk.vtkMatrix4x4()
+    volumeNode.GetIJKToRASMatrix(ijkToRAS)
+    metadata = {"version": self.VERSION, "series": series, "fingerprint": fingerprint,
+                "ijkToRAS": [ijkToRAS.GetElement(i // 4, i % 4) for i in range(16)]}
+    # the scalars may be reallocated or edited while the write is pending, so the writer gets its own copy
+    array = numpy.array(slicer.util.arrayFromVolume(volumeNode), copy=True)
+    self._pending[series] = (fingerprint, self._executor.submit(self._write, series, array, metadata))
+
+  def isPending(self, series, fingerprint):
+    """ Returns whether the voxels of the series decoded from files with the given fingerprint are being written.
+
+    Pending writes are tracked on the calling thread only, finished ones are dropped when queried.
+    """
+    pending = self._pending.get(series)
+    if pending and pending[1].done():
+      del self._pending[series]
+      pending = None
+    return pending is not None and pending[0] == fingerprint
+
+  def _write(self, series, array, metadata):
+    baseName = self._getBaseName(series)
+    try:
+      if os.path.exists(baseName + ".json"):
+        os.remove(baseName + ".json")
+      with open(baseName + ".npy.tmp", "wb") as arrayFile:
+        numpy.save(arrayFile, array)
+      os.replace(baseName + ".npy.tmp", baseName + ".npy")
+      with open(baseName + ".json.tmp", "w") as metadataFile:
+        json.dump(metadata, metadataFile)
+      os.replace(baseName + ".json.tmp", baseName + ".json")
+    except (IOError, OSError) as exc:
+      logging.warning("Could not write voxel cache of %s: %s" % (series, exc))
+
+  def waitForPendingWrites(self):
+    self._executor.submit(lambda: None).result()
@@ -0,0 +1,160 @@
+""" Ingest throughput benchmark for ProstateAblation
+
+Run from within 3D Slicer, for example:
+
+  Slicer --no-main-window --python-script Testing/ProstateAblationBenchmark.py --series 4 --slices 60 --rate 30
+
+Synthetic series are pushed by a simulated scanner into the DICOM/Intraop directory of a temporary case. The
+benchmark reports
+
+  * for every series the latency from the last slice being written to the NewImageSeriesReceivedEvent that announces
+    the series with all of its slices (live ingest through the running receiver)
+  * the time spent in importDICOMSeries, createLoadableFileListForSeries and getOrCreateVolumeForSeries for every
+    series when importing already received files (offline ingest)
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import slicer
+
+from ProstateAblationUtils.session import ProstateAblationSession
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ScannerSimulator import ScannerSimulator, SyntheticSeries, SyntheticStudy
+
+DESCRIPTIONS = ["COVER TEMPLATE", "COVER PROSTATE", "GUIDANCE", "VIBE"]
+
+
+class ProstateAblationIngestBenchmark(object):
+
+  def __init__(self, numberOfSeries, numberOfSlices, rows, columns, slicesPerSecond, seriesInterval, timeout):
+    self.numberOfSeries = numberOfSeries
+    self.numberOfSlices = numberOfSlices
+    self.rows = rows
+    self.columns = columns
+    self.slicesPerSecond = slicesPerSecond
+    self.seriesInterval = seriesInterval
+    self.timeout = timeout
+    self.session = ProstateAblationSession()
+    self.rootDirectory = tempfile.mkdtemp(prefix="ProstateAblationBenchmark")
+
+  def createStudy(self, firstSeriesNumber=1):
+    series = [SyntheticSeries(firstSeriesNumber + i, DESCRIPTIONS[i % len(DESCRIPTIONS)], self.numberOfSlices,
+                              rows=self.rows, columns=self.columns) for i in range(self.numberOfSeries)]
+    return SyntheticStudy(series)
+
+  def run(self):
+    try:
+      return {"live": self.runLiveIngest(), "offline": self.runOfflineIngest()}
+    finally:
+      self.session.close(save=False)
+      shutil.rmtree(self.rootDirectory, ignore_errors=True)
+
+  def runLiveIngest(self):
+    self.session.createNewCase(os.path.join(self.rootDirectory, "LiveCase"))
+    study = self.createStudy()
+    simulator = ScannerSimulator(study, self.session.intraopDICOMDirectory, self.slicesPerSecond, self.seriesInterval)
+    completionTimes = {}
+
+    def onNewImageSeriesReceived(caller, event):
+      now = time.time()
+      for series in study.series:
+        record = self.session.seriesRegistry.get(series.seriesNumber)
+        if series.seriesNumber not in completionTimes and record and len(record.files) == series.numberOfSlices:
+          completionTimes[series.seriesNumber] = now
+
+    self.session.addEventObserver(self.session.NewImageSeriesReceivedEvent, onNewImageSeriesReceived)
+    simulator.start()
+    startTime = time.time()
+    try:
+      while len(completionTimes) < len(study.series) and time.time() - startTime < self.timeout:
+        slicer.app.processEvents()
+        time.sleep(0.001)
+    finally:
+      simulator.stop()
+      simulator.join()
+      self.session.removeEventObserver(self.session.NewImageSeriesReceivedEvent, onNewImageSeriesReceived)
+
+    results = []
+    for series in study.series:
+      lastSliceTime = simulator.lastSliceTimes.get(series.seriesNumber)
+      completionTime = completionTimes.get(series.seriesNumber)
+      results.append({
+        "series": series.name,
+        "slices": series.numberOfSlices,
+        "receiveDuration": lastSliceTime - simulator.firstSliceTimes[series.seriesNumber] if lastSliceTime else None,
+        "lastSliceToNewImageSeriesReceived": completionTime - lastSliceTime if completionTime and lastSliceTime
+                                             else None})
+    self.session.close(save=False)
+    return results
+
+  def runOfflineIngest(self):
+    self.session.createNewCase(os.path.join(self.rootDirectory, "OfflineCase"))
+    self.session.resetIntraopDICOMReceiver()
+    study = self.createStudy()
+    simulator = ScannerSimulator(study, self.session.intraopDICOMDirectory)
+    simulator.run()
+
+    results = []
+    for series in study.series:
+      files = [os.path.basename(f) for f in simulator.files[series.seriesNumber]]
+      timings = {"series": series.name, "slices": series.numberOfSlices}
+      timings["importDICOMSeries"] = self.measure(self.session.importDICOMSeries, files)
+      self.session.seriesPrefetcher.reset()
+      timings["createLoadableFileListForSeries"] = self.measure(self.session.createLoadableFileListForSeries,
+                                                                series.name)
+      timings["getOrCreateVolumeForSeries"] = self.measure(self.session.getOrCreateVolumeForSeries, series.name)
+      results.append(timings)
+    self.session.close(save=False)
+    return results
+
+  def measure(self, function, *args):
+    startTime = time.time()
+    function(*args)
+    return time.time() - startTime
+
+
+def printResults(results):
+  print("Live ingest (latency from last slice written to NewImageSeriesReceivedEvent)")
+  for result in results["live"]:
+    latency = result["lastSliceToNewImageSeriesReceived"]
+    print("  %-24s %4d slices  received in %6.2fs  latency %s" % (
+      result["series"], result["slices"], result["receiveDuration"] or 0,
+      "%.3fs" % latency if latency is not None else "timed out"))
+  print("Offline ingest")
+  for result in results["offline"]:
+    print("  %-24s %4d slices  import %.3fs  file list %.6fs  volume %.3fs" % (
+      result["series"], result["slices"], result["importDICOMSeries"], result["createLoadableFileListForSeries"],
+      result["getOrCreateVolumeForSeries"]))
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="Measure the intraop DICOM ingest of ProstateAblation.")
+  parser.add_argument("--series", type=int, default=4, help="number of series")
+  parser.add_argument("--slices", type=int, default=60, help="number of slices per series")
+  parser.add_argument("--rows", type=int, default=256, help="rows per slice")
+  parser.add_argument("--columns", type=int, default=256, help="columns per slice")
+  parser.add_argument("--rate", type=float, default=30, help="slices per second written by the scanner (0: no limit)")
+  parser.add_argument("--series-interval", type=float, default=2, help="seconds between two series")
+  parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the live ingest")
+  parser.add_argument("--output", help="write the results as JSON into this file")
+  args = parser.parse_args(argv)
+
+  benchmark = ProstateAblationIngestBenchmark(args.series, args.slices, args.rows, args.columns, args.rate,
+                                              args.series_interval, args.timeout)
+  results = benchmark.run()
+  printResults(results)
+  if args.output:
+    with open(args.output, "w") as outputFile:
+      json.dump(results, outputFile, indent=2)
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
+  slicer.util.exit()
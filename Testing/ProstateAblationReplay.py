@@ -0,0 +1,127 @@
+""" Replay of a recorded intraop reception for ProstateAblation
+
+Cases received with RecordArrivalTimeline enabled (see Resources/default.cfg) hold the arrival time, size and series
+of every received file in ProstateAblationOutputs/ArrivalTimeline.jsonl. Run from within 3D Slicer, for example:
+
+  Slicer --no-main-window --python-script Testing/ProstateAblationReplay.py /path/to/archived/case --speed 2
+
+The files of the archived case are written into the DICOM/Intraop directory of a new case with the recorded timing, so
+that they go through the DICOM receiver and importDICOMSeries exactly like during the procedure. For every series the
+replay reports the latency from its last file being written to the last change of its loadable files, next to the
+indexing latency recorded during the procedure.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import slicer
+
+from ProstateAblationUtils.session import ProstateAblationSession
+from ProstateAblationUtils.replay import ArrivalTimeline, DICOMReplayEngine, DirectoryReplaySource
+
+
+class ProstateAblationArrivalReplay(object):
+
+  def __init__(self, caseDirectory, speed, timeout, targetDirectory=None):
+    self.caseDirectory = caseDirectory
+    self.speed = speed
+    self.timeout = timeout
+    self.session = ProstateAblationSession()
+    self.timeline = ArrivalTimeline(os.path.join(caseDirectory, "ProstateAblationOutputs"), caseDirectory)
+    self.rootDirectory = None if targetDirectory else tempfile.mkdtemp(prefix="ProstateAblationReplay")
+    self.targetDirectory = targetDirectory or os.path.join(self.rootDirectory, "ReplayedCase")
+
+  def run(self):
+    if not len(self.timeline):
+      raise ValueError("No arrival timeline found in %s" % self.timeline.filename)
+    try:
+      return self.replay()
+    finally:
+      self.session.close(save=False)
+      if self.rootDirectory:
+        shutil.rmtree(self.rootDirectory, ignore_errors=True)
+
+  def replay(self):
+    self.session.createNewCase(self.targetDirectory)
+    engine = DICOMReplayEngine(DirectoryReplaySource(self.caseDirectory), self.session.intraopDICOMDirectory,
+                               timeline=self.timeline.createReplayTimeline(), speed=self.speed)
+    fileCounts = {}
+    changeTimes = {}
+
+    def onNewImageSeriesReceived(caller, event):
+      now = time.time()
+      for record in self.session.seriesRegistry:
+        if fileCounts.get(record.number) != len(record.files):
+          fileCounts[record.number] = len(record.files)
+          changeTimes[record.number] = now
+
+    self.session.addEventObserver(self.session.NewImageSeriesReceivedEvent, onNewImageSeriesReceived)
+    engine.start()
+    startTime = time.time()
+    try:
+      while engine.isRunning and time.time() - startTime < self.timeout:
+        slicer.app.processEvents()
+        time.sleep(0.001)
+      idleTime = time.time()
+      while time.time() - idleTime < 5 and time.time() - startTime < self.timeout:
+        slicer.app.processEvents()
+        time.sleep(0.001)
+    finally:
+      engine.stop()
+      engine.join()
+      self.session.removeEventObserver(self.session.NewImageSeriesReceivedEvent, onNewImageSeriesReceived)
+    return self.createResults(engine, fileCounts, changeTimes)
+
+  def createResults(self, engine, fileCounts, changeTimes):
+    recorded = {}
+    for entry in self.timeline.entries:
+      times = recorded.setdefault(entry["series"], {"files": 0, "time": 0, "indexed": 0})
+      times["files"] += 1
+      times["time"] = max(times["time"], entry["time"])
+      times["indexed"] = max(times["indexed"], entry["indexed"])
+    results = []
+    for seriesNumber in sorted(recorded, key=lambda number: (number is None, number)):
+      lastWriteTime = engine.lastWriteTimes.get(seriesNumber)
+      changeTime = changeTimes.get(seriesNumber)
+      results.append({
+        "series": seriesNumber,
+        "files": recorded[seriesNumber]["files"],
+        "loadableFiles": fileCounts.get(seriesNumber, 0),
+        "recordedLatency": recorded[seriesNumber]["indexed"] - recorded[seriesNumber]["time"],
+        "replayedLatency": changeTime - lastWriteTime if changeTime and lastWriteTime else None})
+    return results
+
+
+def printResults(results):
+  print("Latency from the last file of a series being written to the series being updated")
+  for result in results:
+    latency = result["replayedLatency"]
+    print("  series %-6s %4d files  %4d loadable  recorded %7.3fs  replayed %s" % (
+      result["series"], result["files"], result["loadableFiles"], result["recordedLatency"],
+      "%.3fs" % latency if latency is not None else "-"))
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="Replay the recorded intraop reception of a ProstateAblation case.")
+  parser.add_argument("case", help="case directory holding ProstateAblationOutputs/ArrivalTimeline.jsonl")
+  parser.add_argument("--speed", type=float, default=1, help="speed multiplier (0: no delay)")
+  parser.add_argument("--target", help="directory of the new case (default: temporary directory, removed afterwards)")
+  parser.add_argument("--timeout", type=float, default=3600, help="seconds to wait for the replay")
+  parser.add_argument("--output", help="write the results as JSON into this file")
+  args = parser.parse_args(argv)
+
+  results = ProstateAblationArrivalReplay(args.case, args.speed, args.timeout, args.target).run()
+  printResults(results)
+  if args.output:
+    with open(args.output, "w") as outputFile:
+      json.dump(results, outputFile, indent=2)
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
+  slicer.util.exit()
@@ -1,9 +1,25 @@
 import unittest
-import os, inspect, slicer
+from unittest import mock
+import os, inspect, slicer, vtk
 from ProstateAblationUtils.session import ProstateAblationSession
 from ProstateAblationUtils.sessionData import SessionData
+from ProstateAblationUtils.dicomIndex import IntraopSeriesIndex, DICOMHeaderCache
+from ProstateAblationUtils.dicomHeaders import DICOMHeaderExtractor
+from ProstateAblationUtils.dicomIngest import DICOMIndexingWorker, InotifyFileWatcher
+from ProstateAblationUtils.volumeCache import SeriesVolumeCache
+from ProstateAblationUtils.seriesPrefetch import SeriesPrefetcher
+from ProstateAblationUtils.voxelCache import SeriesVoxelCache
+from ProstateAblationUtils.seriesRegistry import SeriesRegistry
+from ProstateAblationUtils.volumeAssembly import sortSlices, checkUniformSliceSpacing, computeIJKToRASMatrix
+from ProstateAblationUtils.replay import ReplayTimingProfile, ArrivalTimeline, DICOMReplayEngine, ZipReplaySource
+from ProstateAblationUtils.dicomListener import InProcessDICOMListener
+from ProstateAblationUtils.templateHoleIndex import TemplateHoleIndex, ReachabilityGrid, findNearestPaths
 
-__all__ = ['ProstateAblationSessionTests', 'RegistrationResultsTest']
+__all__ = ['ProstateAblationSessionTests', 'RegistrationResultsTest', 'IntraopSeriesIndexTest', 'DICOMHeaderCacheTest',
+           'DICOMIndexingWorkerTest', 'InotifyFileWatcherTest', 'DICOMHeaderExtractorTest', 'SliceSortingTest', 'SeriesVolumeCacheTest', 'SeriesPrefetcherTest', 'SeriesVoxelCacheTest', 'SeriesRegistryTest', 'ReplayTimingProfileTest', 'ReplaySourceTest',
+           'ArrivalTimelineTest', 'InProcessDICOMListenerTest', 'TemplateHoleIndexTest', 'ReachabilityGridTest', 'ZFrameTemplatePathsTest',
+           'TargetTableModelTest', 'AlternativeHolesTest', 'TargetsHoverGuidanceTest',
+           'ZFrameGuidanceRegistryTest']
 
 tempDir =  os.path.join(slicer.app.temporaryPath, "ProstateAblationSessionResults")
 
@@ -16,6 +32,9 @@ class ProstateAblationSessionTests(unittest.TestCase):
   def runTest(self):
     self.test_ProstateAblationSessionEvents()
     self.test_ProstateAblationSessionSingleton()
+    self.test_Series_being_assembled_is_announced_when_complete()
+    self.test_Prefetch_of_outdated_files_is_discarded()
+    self.test_Quarantine_keeps_reference_patient()
 
   def test_ProstateAblationSessionEvents(self):
     self.directoryChangedEventCalled = False
@@ -31,6 +50,73 @@ class ProstateAblationSessionTests(unittest.TestCase):
     self.assertTrue(self.session is session)
     self.assertTrue(session.directory == self.session.directory)
 
+  def test_Series_being_assembled_is_announced_when_complete(self):
+
+    class AssemblerStub(object):
+      valid = True
+      finalized = False
+      volumeNode = slicer.vtkMRMLScalarVolumeNode()
+
+      def update(self, force=False):
+        return self.volumeNode
+
+      def finalize(self):
+        self.finalized = True
+        return self.volumeNode
+
+    announced = []
+
+    @vtk.calldata_type(vtk.VTK_STRING)
+    def onNewImageSeriesReceived(caller, event, callData):
+      announced.append(callData)
+
+    self.session.addEventObserver(self.session.NewImageSeriesReceivedEvent, onNewImageSeriesReceived)
+    record = self.session.seriesRegistry.add(99, "VIBE")
+    assembler = self.session.seriesAssemblers[record.name] = AssemblerStub()
+    self.session._pendingNewSeries = [record.name]
+    try:
+      self.assertTrue(self.session.isSeriesBeingAssembled(record.name))
+      self.assertIsNone(self.session.getOrCreateVolumeForSeries(record.name))
+      self.assertTrue(self.session.getOrCreateVolumeForSeries(record.name, partial=True) is assembler.volumeNode)
+      self.assertEqual(announced, [])
+      self.session.finalizeSeriesAssemblers()
+      self.assertFalse(self.session.isSeriesBeingAssembled(record.name))
+      self.assertEqual(announced, [[record.name].__str__()])
+      self.assertTrue(self.session.getOrCreateVolumeForSeries(record.name) is assembler.volumeNode)
+    finally:
+      self.session.removeEventObserver(self.session.NewImageSeriesReceivedEvent, onNewImageSeriesReceived)
+      self.session.seriesRegistry.remove(99)
+      self.session.alreadyLoadedSeries.pop(record.name, None)
+
+  def test_Prefetch_of_outdated_files_is_discarded(self):
+    record = self.session.seriesRegistry.add(98, "VIBE")
+    record.files = ["1.dcm", "2.dcm"]
+    try:
+      # slices were added to the series while the first one was decoded
+      self.session.onSeriesPrefetched(record.name, ["1.dcm"], None, None)
+      self.assertFalse(record.name in self.session.alreadyLoadedSeries)
+    finally:
+      self.session.seriesRegistry.remove(98)
+
+  def test_Quarantine_keeps_reference_patient(self):
+    for number, patientID, patientName in [(95, "ID1", "Doe^John"), (96, "ID1", "Doe^John"), (97, "ID2", "Roe^Jane")]:
+      self.session.seriesRegistry.add(number, "VIBE", patientID, patientName).files = ["%d.dcm" % number]
+    try:
+      self.assertEqual(self.session.verifyPatientIDEquality(["96: VIBE", "97: VIBE"]), ["97: VIBE"])
+      self.assertFalse("97: VIBE" in self.session.seriesRegistry)
+      # the reference is kept even if the series it was taken from is gone by the time the user reviews
+      self.session.seriesRegistry.remove(95)
+      self.session.seriesRegistry.remove(96)
+      self.assertIsNone(self.session.getPatientIDValidationSource())
+      self.assertEqual(self.session.getQuarantineReference("97: VIBE"), ("ID1", "Doe^John"))
+      self.session.acceptQuarantinedSeries("97: VIBE")
+      self.assertIsNone(self.session.getQuarantineReference("97: VIBE"))
+      self.assertTrue("97: VIBE" in self.session.seriesRegistry)
+    finally:
+      for number in [95, 96, 97]:
+        self.session.seriesRegistry.remove(number)
+      self.session.quarantinedSeries.pop("97: VIBE", None)
+
 
 class RegistrationResultsTest(unittest.TestCase):
 
@@ -50,4 +136,912 @@ class RegistrationResultsTest(unittest.TestCase):
   def test_Writing_json(self):
     self.registrationResults.resumed = True
     self.registrationResults.completed = True
-    self.registrationResults.save(tempDir)
\ No newline at end of file
+    self.registrationResults.save(tempDir)
+
+
+class IntraopSeriesIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.index = IntraopSeriesIndex()
+
+  def runTest(self):
+    self.test_Grouping_by_series_number()
+    self.test_Invalid_series_number()
+    self.test_Remove_series()
+    self.test_Skip_duplicate_instance()
+    self.test_Replace_duplicate_instance()
+
+  def createHeader(self, seriesNumber, description="COVER PROSTATE", uid=None):
+    return {"SeriesNumber": seriesNumber, "SeriesDescription": description, "PatientID": "1", "PatientName": "Doe",
+            "SOPInstanceUID": uid or IntraopSeriesIndex.TAG_NOT_IN_INSTANCE}
+
+  def test_Grouping_by_series_number(self):
+    self.index.addHeader("a.dcm", self.createHeader("3"))
+    self.index.addHeader("b.dcm", self.createHeader("3"))
+    self.index.addHeader("c.dcm", self.createHeader("12", "COVER TEMPLATE"))
+    self.assertEqual(self.index.seriesNumbers, [3, 12])
+    self.assertEqual(self.index.getFileList(3), ["a.dcm", "b.dcm"])
+    self.assertEqual(self.index.getSeriesHeader(12)["SeriesDescription"], "COVER TEMPLATE")
+    self.assertTrue("c.dcm" in self.index)
+
+  def test_Invalid_series_number(self):
+    self.index.addHeader("d.dcm", self.createHeader(IntraopSeriesIndex.TAG_NOT_IN_INSTANCE))
+    self.assertEqual(self.index.seriesNumbers, [])
+    self.assertTrue("d.dcm" in self.index)
+
+  def test_Remove_series(self):
+    self.index.addHeader("a.dcm", self.createHeader("3"))
+    self.assertEqual(self.index.removeSeries(3), ["a.dcm"])
+    self.assertEqual(self.index.getFileList(3), [])
+    self.assertFalse("a.dcm" in self.index)
+
+  def test_Skip_duplicate_instance(self):
+    self.index.addHeader("a.dcm", self.createHeader("3", uid="1.2.3"))
+    self.index.addHeader("b.dcm", self.createHeader("3", uid="1.2.4"))
+    self.assertEqual(self.index.getDuplicate("a2.dcm", self.createHeader("3", uid="1.2.3")), "a.dcm")
+    self.index.addHeader("a2.dcm", self.createHeader("3", uid="1.2.3"))
+    self.assertEqual(self.index.getFileList(3), ["a.dcm", "b.dcm"])
+    self.assertTrue("a2.dcm" in self.index)
+
+  def test_Replace_duplicate_instance(self):
+    self.index.addHeader("a.dcm", self.createHeader("3", uid="1.2.3"))
+    self.index.addHeader("b.dcm", self.createHeader("3", uid="1.2.4"))
+    self.index.addHeader("a2.dcm", self.createHeader("3", uid="1.2.3"), replaceDuplicate=True)
+    self.assertEqual(self.index.getFileList(3), ["a2.dcm", "b.dcm"])
+    self.assertFalse("a.dcm" in self.index)
+
+
+class DICOMHeaderCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.caseDirectory = os.path.join(tempDir, "HeaderCacheCase")
+    self.outputDirectory = os.path.join(self.caseDirectory, "ProstateAblationOutputs")
+    if not os.path.exists(self.caseDirectory):
+      os.makedirs(self.caseDirectory)
+    self.dicomFile = os.path.join(self.caseDirectory, "1.dcm")
+    with open(self.dicomFile, 'w') as f:
+      f.write("dummy")
+    cacheFile = os.path.join(self.outputDirectory, DICOMHeaderCache.FILE_NAME)
+    if os.path.exists(cacheFile):
+      os.remove(cacheFile)
+
+  def runTest(self):
+    self.test_Reopen_reads_flushed_entries()
+    self.test_Modified_file_is_invalidated()
+    self.test_Incomplete_header_is_rewritten()
+
+  def test_Reopen_reads_flushed_entries(self):
+    cache = DICOMHeaderCache(self.outputDirectory, self.caseDirectory)
+    cache.put(self.dicomFile, {"SeriesNumber": "5"})
+    cache.flush()
+    reopened = DICOMHeaderCache(self.outputDirectory, self.caseDirectory)
+    self.assertEqual(reopened.get(self.dicomFile), {"SeriesNumber": "5"})
+
+  def test_Modified_file_is_invalidated(self):
+    cache = DICOMHeaderCache(self.outputDirectory, self.caseDirectory)
+    cache.put(self.dicomFile, {"SeriesNumber": "5"})
+    with open(self.dicomFile, 'a') as f:
+      f.write("changed")
+    self.assertIsNone(cache.get(self.dicomFile))
+
+  def test_Incomplete_header_is_rewritten(self):
+    cache = DICOMHeaderCache(self.outputDirectory, self.caseDirectory)
+    cache.put(self.dicomFile, {"SeriesNumber": "5"})
+    cache.flush()
+    reopened = DICOMHeaderCache(self.outputDirectory, self.caseDirectory, requiredFields=["SeriesNumber", "Rows"])
+    self.assertIsNone(reopened.get(self.dicomFile))
+    reopened.put(self.dicomFile, {"SeriesNumber": "5", "Rows": "16"})
+    reopened.flush()
+    reopened = DICOMHeaderCache(self.outputDirectory, self.caseDirectory, requiredFields=["SeriesNumber", "Rows"])
+    self.assertEqual(reopened.get(self.dicomFile), {"SeriesNumber": "5", "Rows": "16"})
+
+
+class DICOMIndexingWorkerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.handled, self.finished = [], []
+    self.worker = DICOMIndexingWorker(lambda filename: None, self.onFilesIndexed, lambda: self.finished.append(True))
+    self.worker.BATCH_SIZE = 2
+
+  def tearDown(self):
+    self.worker.shutdown()
+
+  def runTest(self):
+    self.test_Failing_batch_is_skipped()
+
+  def onFilesIndexed(self, batch):
+    if any(filename == "b.dcm" for filename, _ in batch):
+      raise ValueError("Missing SeriesDescription")
+    self.handled += [filename for filename, _ in batch]
+
+  def test_Failing_batch_is_skipped(self):
+    self.worker.enqueue([(filename, {"SeriesNumber": "3"}, True) for filename in ["a.dcm", "b.dcm", "c.dcm", "d.dcm"]])
+    self.worker.waitForCompletion()
+    self.assertEqual(self.handled, ["c.dcm", "d.dcm"])
+    self.assertEqual(self.finished, [True])
+    self.assertFalse(self.worker.busy)
+    self.assertFalse(self.worker.timer.isActive())
+
+
+@unittest.skipUnless(DICOMHeaderExtractor([]).isAvailable, "pydicom is not available")
+@unittest.skipUnless(InotifyFileWatcher.isAvailable(), "inotify is not available")
+class InotifyFileWatcherTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = os.path.join(slicer.app.temporaryPath, "InotifyFileWatcherTest", "Intraop")
+    self.stagingDirectory = os.path.join(os.path.dirname(self.directory), "staging")
+    for directory in [self.directory, self.stagingDirectory]:
+      if not os.path.exists(directory):
+        os.makedirs(directory)
+    self.completed = []
+    self.watcher = InotifyFileWatcher(self.directory, lambda filename: filename.endswith("known.dcm"),
+                                      self.completed.append)
+    self.watcher.start()
+
+  def tearDown(self):
+    import shutil
+    self.watcher.stop()
+    shutil.rmtree(os.path.dirname(self.directory), ignore_errors=True)
+
+  def runTest(self):
+    self.test_Completed_files_are_reported_once()
+
+  def writeFile(self, filename):
+    with open(filename, "wb") as f:
+      for _ in range(3):
+        f.write(b"\0" * 1024)
+        f.flush()
+
+  def test_Completed_files_are_reported_once(self):
+    self.writeFile(os.path.join(self.directory, "written.dcm"))
+    self.writeFile(os.path.join(self.stagingDirectory, "moved.dcm"))
+    os.rename(os.path.join(self.stagingDirectory, "moved.dcm"), os.path.join(self.directory, "moved.dcm"))
+    self.writeFile(os.path.join(self.directory, "known.dcm"))
+    with open(os.path.join(self.directory, "written.dcm"), "rb") as f:
+      f.read()
+    self.watcher.readEvents()
+    self.watcher.readEvents()
+    self.assertEqual(self.completed, [["moved.dcm", "written.dcm"]])
+
+
+class DICOMHeaderExtractorTest(unittest.TestCase):
+
+  def setUp(self):
+    import pydicom
+    from pydicom.dataset import Dataset
+    self.directory = os.path.join(slicer.app.temporaryPath, "DICOMHeaderExtractorTest")
+    if not os.path.exists(self.directory):
+      os.makedirs(self.directory)
+    self.files = []
+    for index in range(6):
+      dataset = Dataset()
+      dataset.SeriesNumber = 3
+      dataset.SeriesDescription = "COVER PROSTATE"
+      dataset.InstanceNumber = index + 1
+      filename = os.path.join(self.directory, "%d.dcm" % index)
+      pydicom.dcmwrite(filename, dataset, implicit_vr=True, little_endian=True)
+      self.files.append(filename)
+    self.extractor = DICOMHeaderExtractor(["SeriesNumber", "SeriesDescription", "InstanceNumber"],
+                                          processPoolThreshold=4)
+
+  def tearDown(self):
+    import shutil
+    self.extractor.shutdown()
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+  def runTest(self):
+    self.test_Headers_in_submission_order()
+    self.test_Parsing_stops_before_pixel_data()
+    self.test_Only_large_batches_use_the_process_pool()
+
+  def test_Headers_in_submission_order(self):
+    missingFile = os.path.join(self.directory, "missing.dcm")
+    headers = {}
+    for chunk, future in self.extractor.submit(self.files + [missingFile]):
+      headers.update(zip(chunk, future.result(timeout=60)))
+    self.assertEqual([headers[f]["InstanceNumber"] for f in self.files], ["1", "2", "3", "4", "5", "6"])
+    self.assertEqual(headers[self.files[0]]["SeriesDescription"], "COVER PROSTATE")
+    self.assertIsNone(headers[missingFile])
+
+  def test_Parsing_stops_before_pixel_data(self):
+    import pydicom
+    from pydicom.dataset import Dataset
+    dataset = Dataset()
+    dataset.SeriesNumber = 7
+    dataset.InstanceNumber = 1
+    dataset.BitsAllocated = 16
+    dataset.PixelData = b"\0" * 4096
+    filename = os.path.join(self.directory, "truncated.dcm")
+    pydicom.dcmwrite(filename, dataset, implicit_vr=True, little_endian=True)
+    # a file still being written by the scanner ends within its pixel data
+    with open(filename, "r+b") as f:
+      f.truncate(os.path.getsize(filename) - 2048)
+    self.assertEqual(self.extractor.read(filename), {"SeriesNumber": "7", "SeriesDescription": "",
+                                                     "InstanceNumber": "1"})
+
+  def test_Only_large_batches_use_the_process_pool(self):
+    with mock.patch.object(self.extractor, "_getProcessPool", return_value=None) as getProcessPool:
+      for chunk, future in self.extractor.submit(self.files[:3]):
+        future.result(timeout=60)
+      getProcessPool.assert_not_called()
+      for chunk, future in self.extractor.submit(self.files):
+        future.result(timeout=60)
+      getProcessPool.assert_called_once_with()
+
+
+class SliceSortingTest(unittest.TestCase):
+
+  def runTest(self):
+    self.test_Sorting_by_position()
+    self.test_Non_uniform_spacing()
+
+  def createHeader(self, z):
+    return {"ImagePositionPatient": "[-100.0, -120.0, %s]" % z, "ImageOrientationPatient": "1\\0\\0\\0\\1\\0",
+            "PixelSpacing": "[0.5, 0.75]", "Rows": "4", "Columns": "3"}
+
+  def test_Sorting_by_position(self):
+    slices = sortSlices(["b.dcm", "c.dcm", "a.dcm"], [self.createHeader(z) for z in [3.0, 6.0, 0.0]])
+    self.assertEqual([filename for filename, _ in slices], ["a.dcm", "b.dcm", "c.dcm"])
+    matrix = computeIJKToRASMatrix([geometry for _, geometry in slices])
+    self.assertAlmostEqual(matrix.GetElement(0, 0), -0.75)
+    self.assertAlmostEqual(matrix.GetElement(1, 1), -0.5)
+    self.assertAlmostEqual(matrix.GetElement(2, 2), 3.0)
+    self.assertAlmostEqual(matrix.GetElement(0, 3), 100.0)
+
+  def test_Non_uniform_spacing(self):
+    slices = sortSlices(["a.dcm", "b.dcm", "c.dcm"], [self.createHeader(z) for z in [0.0, 3.0, 7.0]])
+    with self.assertRaises(ValueError):
+      checkUniformSliceSpacing([geometry for _, geometry in slices])
+
+
+class SeriesVolumeCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.volumes = [self.createVolume("%d: VIBE" % i) for i in range(4)]
+    self.cache = SeriesVolumeCache(budget=2 * SeriesVolumeCache.getMemorySize(self.volumes[0]))
+    for volume in self.volumes:
+      self.cache[volume.GetName()] = volume
+
+  def tearDown(self):
+    for volume in self.volumes:
+      if slicer.mrmlScene.IsNodePresent(volume):
+        slicer.mrmlScene.RemoveNode(volume)
+
+  def runTest(self):
+    self.test_Least_recently_used_are_evicted()
+    self.test_Pinned_volumes_are_kept()
+
+  def createVolume(self, name):
+    import numpy
+    volume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode", name)
+    slicer.util.updateVolumeFromArray(volume, numpy.zeros((16, 64, 64), dtype=numpy.int16))
+    return volume
+
+  def test_Least_recently_used_are_evicted(self):
+    self.cache["0: VIBE"]
+    self.assertEqual(self.cache.evict(), ["1: VIBE", "2: VIBE"])
+    self.assertEqual(self.cache.keys(), ["0: VIBE", "3: VIBE"])
+    self.assertFalse(slicer.mrmlScene.IsNodePresent(self.volumes[1]))
+
+  def test_Pinned_volumes_are_kept(self):
+    self.assertEqual(self.cache.evict(pinnedVolumes=[self.volumes[0]]), ["1: VIBE", "2: VIBE"])
+    self.assertTrue("0: VIBE" in self.cache)
+
+
+class SeriesPrefetcherTest(unittest.TestCase):
+
+  def setUp(self):
+    self.loaded = []
+    self.prefetcher = SeriesPrefetcher(lambda *args: self.loaded.append(args))
+    # the decoded "volume" is the list of files it was decoded from
+    patcher = mock.patch("ProstateAblationUtils.seriesPrefetch.decodeSeriesVolume",
+                         lambda files, headers: (list(files), headers))
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.addCleanup(self.prefetcher.shutdown)
+
+  def runTest(self):
+    self.test_Decoded_files_are_handed_over()
+    self.test_Result_of_other_files_is_dropped()
+
+  def test_Decoded_files_are_handed_over(self):
+    files = ["1.dcm", "2.dcm"]
+    self.prefetcher.enqueue("1: VIBE", files, [{}, {}], 0)
+    files.append("3.dcm")
+    self.prefetcher._current[2].result()
+    self.prefetcher.processResult()
+    self.assertEqual(self.loaded, [("1: VIBE", ["1.dcm", "2.dcm"], ["1.dcm", "2.dcm"], [{}, {}])])
+
+  def test_Result_of_other_files_is_dropped(self):
+    self.prefetcher.enqueue("1: VIBE", ["1.dcm", "2.dcm"], [{}, {}], 0)
+    self.assertIsNone(self.prefetcher.take("1: VIBE", ["1.dcm", "2.dcm", "3.dcm"]))
+    self.assertFalse(self.prefetcher.isPending("1: VIBE"))
+    self.prefetcher.enqueue("1: VIBE", ["1.dcm", "2.dcm"], [{}, {}], 0)
+    self.assertEqual(self.prefetcher.take("1: VIBE", ["1.dcm", "2.dcm"]), (["1.dcm", "2.dcm"], [{}, {}]))
+    self.assertEqual(self.loaded, [])
+
+
+class SeriesVoxelCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    import numpy
+    self.outputDirectory = os.path.join(slicer.app.temporaryPath, "SeriesVoxelCacheTest")
+    if not os.path.exists(self.outputDirectory):
+      os.makedirs(self.outputDirectory)
+    self.files = []
+    for index in range(3):
+      self.files.append(os.path.join(self.outputDirectory, "%d.dcm" % index))
+      with open(self.files[-1], "w") as f:
+        f.write("slice %d" % index)
+    self.cache = SeriesVoxelCache(self.outputDirectory)
+    self.volume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+    slicer.util.updateVolumeFromArray(self.volume, numpy.arange(24, dtype=numpy.int16).reshape(2, 3, 4))
+    self.nodes = [self.volume]
+
+  def tearDown(self):
+    import shutil
+    self.cache.waitForPendingWrites()
+    for node in self.nodes:
+      slicer.mrmlScene.RemoveNode(node)
+    shutil.rmtree(self.outputDirectory, ignore_errors=True)
+
+  def runTest(self):
+    self.test_Entry_is_valid_for_decoded_files()
+    self.test_Edits_while_writing_do_not_reach_the_cache()
+
+  def test_Entry_is_valid_for_decoded_files(self):
+    import numpy
+    # the third slice was received after the first two were decoded
+    self.cache.store("1: VIBE", self.files[:2], self.volume)
+    self.cache.waitForPendingWrites()
+    self.assertFalse(self.cache.contains("1: VIBE", self.files))
+    self.assertTrue(self.cache.contains("1: VIBE", self.files[:2]))
+    self.nodes.append(self.cache.load("1: VIBE", self.files[:2]))
+    self.assertTrue(numpy.array_equal(slicer.util.arrayFromVolume(self.nodes[-1]),
+                                      slicer.util.arrayFromVolume(self.volume)))
+
+  def test_Edits_while_writing_do_not_reach_the_cache(self):
+    import numpy, threading
+    expected = slicer.util.arrayFromVolume(self.volume).copy()
+    writing = threading.Event()
+    self.cache._executor.submit(writing.wait)
+    self.cache.store("1: VIBE", self.files, self.volume)
+    self.assertTrue(self.cache.isPending("1: VIBE", self.cache.getFingerprint(self.files)))
+    slicer.util.arrayFromVolume(self.volume)[:] = 0
+    slicer.util.updateVolumeFromArray(self.volume, numpy.ones((4, 4, 4), dtype=numpy.int16))
+    writing.set()
+    self.cache.waitForPendingWrites()
+    self.assertFalse(self.cache.isPending("1: VIBE", self.cache.getFingerprint(self.files)))
+    self.nodes.append(self.cache.load("1: VIBE", self.files))
+    self.assertTrue(numpy.array_equal(slicer.util.arrayFromVolume(self.nodes[-1]), expected))
+
+
+class SeriesRegistryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.registry = SeriesRegistry()
+    for number, description in [(12, "COVER PROSTATE"), (3, "COVER TEMPLATE"), (7, "VIBE")]:
+      self.registry.add(number, description)
+
+  def runTest(self):
+    self.test_Sorted_by_series_number()
+    self.test_Lookup()
+    self.test_Remove()
+
+  def test_Sorted_by_series_number(self):
+    self.assertEqual(self.registry.names, ["3: COVER TEMPLATE", "7: VIBE", "12: COVER PROSTATE"])
+    self.assertEqual([record.number for record in reversed(self.registry)], [12, 7, 3])
+
+  def test_Lookup(self):
+    self.assertTrue(self.registry.add(7, "OTHER") is self.registry.get(7))
+    self.assertEqual(self.registry.getByName("7: VIBE").number, 7)
+    self.assertTrue("12: COVER PROSTATE" in self.registry)
+    self.assertEqual(self.registry.getFiles("99: UNKNOWN"), [])
+
+  def test_Remove(self):
+    record = self.registry.remove(7)
+    self.assertEqual(self.registry.names, ["3: COVER TEMPLATE", "12: COVER PROSTATE"])
+    self.assertFalse("7: VIBE" in self.registry)
+    self.registry.insert(record)
+    self.assertEqual(len(self.registry), 3)
+
+
+class ReplayTimingProfileTest(unittest.TestCase):
+
+  def setUp(self):
+    self.headers = {"b.dcm": (2, "COVER PROSTATE", 2), "a.dcm": (2, "COVER PROSTATE", 1),
+                    "c.dcm": (1, "COVER TEMPLATE", 1)}
+
+  def runTest(self):
+    self.test_Series_and_slice_order()
+    self.test_Series_type_override()
+
+  def test_Series_and_slice_order(self):
+    timeline = ReplayTimingProfile(sliceInterval=0.5, seriesInterval=10).createTimeline(self.headers)
+    self.assertEqual(timeline, [(0.0, "c.dcm", 1), (10.0, "a.dcm", 2), (10.5, "b.dcm", 2)])
+
+  def test_Series_type_override(self):
+    profile = ReplayTimingProfile(sliceInterval=0.5, seriesInterval=10, overrides={"prostate": (1, 30)})
+    self.assertEqual([entry[0] for entry in profile.createTimeline(self.headers)], [0.0, 30.0, 31.0])
+
+
+class ReplaySourceTest(unittest.TestCase):
+
+  def setUp(self):
+    import io, zipfile
+    from ScannerSimulator import SyntheticSeries, SyntheticStudy
+    self.directory = os.path.join(slicer.app.temporaryPath, "ReplaySourceTest")
+    if not os.path.exists(self.directory):
+      os.makedirs(self.directory)
+    series = SyntheticSeries(4, "COVER PROSTATE", 3, rows=16, columns=16)
+    study = SyntheticStudy([series])
+    self.zipFilename = os.path.join(self.directory, "sample.zip")
+    with zipfile.ZipFile(self.zipFilename, "w", zipfile.ZIP_DEFLATED) as zipFile:
+      for index in range(series.numberOfSlices):
+        data = io.BytesIO()
+        series.createDataset(index, study).save_as(data, write_like_original=False)
+        zipFile.writestr("Intraop/%d.dcm" % index, data.getvalue())
+      zipFile.writestr("Intraop/notes.txt", "not a DICOM file")
+
+  def tearDown(self):
+    import shutil
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+  def runTest(self):
+    self.test_Headers_are_read_from_zip_members()
+    self.test_Reading_headers_stops_when_requested()
+
+  def test_Headers_are_read_from_zip_members(self):
+    source = ZipReplaySource(self.zipFilename)
+    try:
+      self.assertEqual(source.readHeaders(), {"Intraop/%d.dcm" % index: (4, "COVER PROSTATE", index + 1)
+                                              for index in range(3)})
+    finally:
+      source.close()
+
+  def test_Reading_headers_stops_when_requested(self):
+    import threading
+    source = ZipReplaySource(self.zipFilename)
+    stopEvent = threading.Event()
+    stopEvent.set()
+    with mock.patch.object(source, "open", wraps=source.open) as openMember:
+      self.assertIsNone(source.readHeaders(stopEvent))
+      openMember.assert_not_called()
+    engine = DICOMReplayEngine(source, os.path.join(self.directory, "Destination"), speed=0)
+    engine.stop()
+    engine.run()
+    self.assertIsNone(engine.timeline)
+    self.assertEqual(engine.numberOfWrittenFiles, 0)
+
+
+class ArrivalTimelineTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = os.path.join(slicer.app.temporaryPath, "ArrivalTimelineTest")
+    self.dicomDirectory = os.path.join(self.directory, "DICOM", "Intraop")
+    if not os.path.exists(self.dicomDirectory):
+      os.makedirs(self.dicomDirectory)
+    self.files = []
+    for index, modificationTime in enumerate([1000.0, 1002.5, 1001.0]):
+      filename = os.path.join(self.dicomDirectory, "%d.dcm" % index)
+      with open(filename, "w") as f:
+        f.write("x" * (index + 1))
+      os.utime(filename, (modificationTime, modificationTime))
+      self.files.append(filename)
+
+  def tearDown(self):
+    import shutil
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+  def runTest(self):
+    self.test_Reopen_reads_flushed_entries()
+    self.test_Replay_timeline_follows_arrival()
+
+  def createTimeline(self):
+    return ArrivalTimeline(os.path.join(self.directory, "ProstateAblationOutputs"), self.directory)
+
+  def test_Reopen_reads_flushed_entries(self):
+    timeline = self.createTimeline()
+    for filename in self.files:
+      timeline.record(filename, 3)
+    timeline.record(self.files[0], 3)
+    timeline.flush()
+    timeline = self.createTimeline()
+    self.assertEqual(len(timeline), 3)
+    self.assertTrue(self.files[1] in timeline)
+    self.assertEqual(timeline.entries[1]["size"], 2)
+
+  def test_Replay_timeline_follows_arrival(self):
+    timeline = self.createTimeline()
+    for seriesNumber, filename in zip([3, 4, 3], self.files):
+      timeline.record(filename, seriesNumber)
+    self.assertEqual(timeline.createReplayTimeline(),
+                     [(0.0, os.path.join("DICOM", "Intraop", "0.dcm"), 3),
+                      (1.0, os.path.join("DICOM", "Intraop", "2.dcm"), 3),
+                      (2.5, os.path.join("DICOM", "Intraop", "1.dcm"), 4)])
+
+
+@unittest.skipUnless(InProcessDICOMListener.isAvailable(), "pynetdicom is not available")
+class InProcessDICOMListenerTest(unittest.TestCase):
+
+  def setUp(self):
+    import socket
+    from ScannerSimulator import SyntheticSeries, SyntheticStudy
+    self.directory = os.path.join(slicer.app.temporaryPath, "InProcessDICOMListenerTest", "Intraop")
+    if not os.path.exists(self.directory):
+      os.makedirs(self.directory)
+    sock = socket.socket()
+    sock.bind(("", 0))
+    self.port = sock.getsockname()[1]
+    sock.close()
+    self.series = SyntheticSeries(5, "COVER PROSTATE", 3, rows=16, columns=16)
+    self.study = SyntheticStudy([self.series])
+    self.received, self.finished = [], []
+    self.listener = InProcessDICOMListener(self.directory, IntraopSeriesIndex.HEADER_TAGS.keys(), self.onReceived,
+                                           lambda: self.finished.append(True), port=self.port)
+    self.listener.start()
+
+  def tearDown(self):
+    import shutil
+    self.listener.stop()
+    shutil.rmtree(os.path.dirname(self.directory), ignore_errors=True)
+
+  def runTest(self):
+    self.test_Received_instances_are_handed_over_once_written()
+
+  def onReceived(self, instances):
+    # files are handed over once they are complete
+    self.assertTrue(all(os.path.exists(filename) for filename, _, _ in instances))
+    self.received.extend(instances)
+
+  def sendSeries(self):
+    from pynetdicom import AE
+    ae = AE()
+    ae.add_requested_context(self.series.createDataset(0, self.study).SOPClassUID)
+    association = ae.associate("localhost", self.port, ae_title=self.listener.aeTitle)
+    self.assertTrue(association.is_established)
+    for index in range(self.series.numberOfSlices):
+      status = association.send_c_store(self.series.createDataset(index, self.study))
+      self.assertEqual(status.Status, 0)
+    association.release()
+
+  def test_Received_instances_are_handed_over_once_written(self):
+    import time
+    self.sendSeries()
+    startTime = time.time()
+    while not self.finished and time.time() - startTime < 10:
+      self.listener.processResults()
+      time.sleep(0.01)
+    self.assertEqual(len(self.received), 3)
+    filename, header, pixels = self.received[0]
+    self.assertEqual(header["SeriesNumber"], "5")
+    self.assertEqual(pixels.shape, (16, 16))
+    self.assertEqual(os.listdir(self.listener.incomingDirectory), [])
+
+
+class TemplateHoleIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    import numpy
+    # staggered rows like the cryoablation template: holes 5mm apart, every other row shifted by 2.5mm
+    self.origins = numpy.array([[x + 2.5 * (row % 2), row * 4.33, 30.0]
+                                for row in range(-4, 5) for x in range(-20, 21, 5)])
+    self.directions = numpy.tile([0.0, 0.0, 1.0], (len(self.origins), 1))
+    self.index = TemplateHoleIndex(self.origins, self.directions)
+
+  def runTest(self):
+    self.test_Matches_exhaustive_search()
+    self.test_Non_parallel_paths_are_rejected()
+
+  def test_Matches_exhaustive_search(self):
+    import numpy
+    points = numpy.random.RandomState(0).uniform(-40, 40, (500, 3))
+    indices, depths = self.index.query(points)
+    distances = numpy.linalg.norm(points[:, numpy.newaxis, :2] - self.origins[numpy.newaxis, :, :2], axis=2)
+    expected = distances.argmin(axis=1)
+    rows = numpy.arange(len(points))
+    self.assertTrue(numpy.allclose(distances[rows, indices], distances[rows, expected]))
+    self.assertTrue(numpy.allclose(depths, points[:, 2] - 30.0))
+
+  def test_Non_parallel_paths_are_rejected(self):
+    directions = self.directions.copy()
+    directions[0] = [0.0, 0.1, 1.0]
+    self.assertFalse(TemplateHoleIndex.isApplicable(directions))
+    self.assertRaises(ValueError, TemplateHoleIndex, self.origins, directions)
+
+
+class ReachabilityGridTest(unittest.TestCase):
+
+  def setUp(self):
+    import numpy
+    from functools import partial
+    self.origins = numpy.array([[x, y, 0.0] for y in range(-10, 11, 5) for x in range(-10, 11, 5)])
+    self.vectors = numpy.tile([0.0, 0.0, 1.0], (len(self.origins), 1))
+    self.findPaths = partial(findNearestPaths, origins=self.origins, vectors=self.vectors)
+    self.maxDepths = numpy.full(len(self.origins), 20.0)
+    # chunks of 100 voxels
+    ReachabilityGrid.CHUNK_BYTES, self.chunkBytes = 100 * len(self.origins) * 3 * 8, ReachabilityGrid.CHUNK_BYTES
+    self.grid = ReachabilityGrid.create([-15, 15, -15, 15, -5, 25], 1.0, self.findPaths, self.maxDepths)
+
+  def tearDown(self):
+    ReachabilityGrid.CHUNK_BYTES = self.chunkBytes
+
+  def runTest(self):
+    self.test_Lookup_matches_nearest_paths()
+    self.test_In_range()
+    self.test_Outside_of_grid()
+    self.test_Cancel()
+    self.test_Chunk_size_is_bounded_by_the_number_of_paths()
+
+  def test_Lookup_matches_nearest_paths(self):
+    import numpy
+    points = numpy.array(numpy.meshgrid(range(-15, 16), range(-15, 16), range(-5, 26))).reshape(3, -1).T
+    paths, depths, _, inside = self.grid.lookup(points)
+    expectedPaths, expectedDepths = self.findPaths(points)
+    self.assertTrue(inside.all())
+    distances = numpy.linalg.norm(points[:, numpy.newaxis, :2] - self.origins[numpy.newaxis, :, :2], axis=2)
+    rows = numpy.arange(len(points))
+    self.assertTrue(numpy.allclose(distances[rows, paths], distances[rows, expectedPaths]))
+    self.assertTrue(numpy.allclose(depths, expectedDepths))
+
+  def test_In_range(self):
+    _, _, inRange, _ = self.grid.lookup([[0, 0, 10], [0, 0, -3], [0, 0, 22]])
+    self.assertEqual(list(inRange), [True, False, False])
+
+  def test_Outside_of_grid(self):
+    paths, _, inRange, inside = self.grid.lookup([[0, 0, 40], [-20, 0, 10]])
+    self.assertEqual(list(paths), [-1, -1])
+    self.assertFalse(inRange.any())
+    self.assertFalse(inside.any())
+
+  def test_Cancel(self):
+    self.assertIsNone(ReachabilityGrid.create([-15, 15, -15, 15, -5, 25], 1.0, self.findPaths, self.maxDepths,
+                                              isCancelled=lambda: True))
+
+  def test_Chunk_size_is_bounded_by_the_number_of_paths(self):
+    chunkSizes = []
+
+    def findPaths(points):
+      chunkSizes.append(len(points))
+      return self.findPaths(points)
+
+    ReachabilityGrid.create([-15, 15, -15, 15, -5, 25], 1.0, findPaths, self.maxDepths)
+    self.assertEqual(max(chunkSizes), 100)
+    self.assertEqual(sum(chunkSizes), self.grid.paths.size)
+    ReachabilityGrid.CHUNK_BYTES = self.chunkBytes
+    self.assertEqual(ReachabilityGrid.getChunkSize(312), 8 * 1024 * 1024 // (312 * 3 * 8))
+    self.assertEqual(ReachabilityGrid.getChunkSize(10 ** 9), 1)
+
+
+class ZFrameTemplatePathsTest(unittest.TestCase):
+
+  def setUp(self):
+    from ProstateAblationUtils.steps.zFrameRegistration import ProstateAblationZFrameRegistrationStepLogic
+    self.logic = ProstateAblationZFrameRegistrationStepLogic(ProstateAblationSession())
+    self.parentTransformID = self.logic.tempModelNode.GetTransformNodeID()
+    self.transform = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLinearTransformNode", "ZFrameTemplatePathsTest")
+    self.setTransform(rotation=30, translation=[10, -20, 5])
+    self.logic.tempModelNode.SetAndObserveTransformNodeID(self.transform.GetID())
+
+  def tearDown(self):
+    self.logic.tempModelNode.SetAndObserveTransformNodeID(self.parentTransformID)
+    slicer.mrmlScene.RemoveNode(self.transform)
+
+  def runTest(self):
+    self.test_Matches_per_path_transform()
+    self.test_Transform_change_invalidates_paths()
+
+  def setTransform(self, rotation, translation):
+    transform = vtk.vtkTransform()
+    transform.Translate(translation)
+    transform.RotateWXYZ(rotation, 1, 2, 3)
+    self.transform.SetMatrixTransformToParent(transform.GetMatrix())
+
+  def computePerPath(self):
+    import numpy
+    matrix = vtk.vtkMatrix4x4()
+    self.transform.GetMatrixTransformToWorld(matrix)
+    offset = matrix.MultiplyDoublePoint([0.0, 0.0, 0.0, 1.0])
+    origins, vectors = [], []
+    for row in self.logic.templateConfig:
+      origins.append(matrix.MultiplyDoublePoint([row[0], row[1], row[2], 1.0])[:3])
+      _, n = self.logic.extractPointsAndNormalVectors(row)
+      vector = matrix.MultiplyDoublePoint([n[0], n[1], n[2], 1.0])
+      vectors.append([vector[index] - offset[index] for index in range(3)])
+    return numpy.array(origins), numpy.array(vectors)
+
+  def test_Matches_per_path_transform(self):
+    import numpy
+    origins, vectors = self.computePerPath()
+    self.assertTrue(len(origins) > 0)
+    self.assertTrue(numpy.allclose(self.logic.pathOrigins, origins))
+    self.assertTrue(numpy.allclose(self.logic.pathVectors, vectors))
+    self.assertTrue(numpy.allclose(self.logic.worldToTemplate.dot(numpy.append(origins[0], 1.0))[:3],
+                                   self.logic.templateConfig[0][:3]))
+
+  def test_Transform_change_invalidates_paths(self):
+    import numpy
+    pathOrigins = self.logic.pathOrigins
+    self.assertTrue(self.logic.pathOrigins is pathOrigins)
+    self.setTransform(rotation=-45, translation=[0, 5, 30])
+    origins, vectors = self.computePerPath()
+    self.assertFalse(self.logic.pathOrigins is pathOrigins)
+    self.assertTrue(numpy.allclose(self.logic.pathOrigins, origins))
+    self.assertTrue(numpy.allclose(self.logic.pathVectors, vectors))
+
+
+class TargetTableModelTest(unittest.TestCase):
+
+  def setUp(self):
+    from ProstateAblationUtils.steps.plugins.targetsDefinitionTable import CustomTargetTableModel
+    from ProstateAblationUtils.steps.plugins.targetsDistanceTable import TargetsDistanceTableModel
+    self.session = ProstateAblationSession()
+    self.targets = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsFiducialNode", "TargetTableModelTest")
+    for position in [[0, 0, 0], [10, 0, 0], [0, 10, 0]]:
+      self.targets.AddFiducialFromArray(position)
+    self.models = [CustomTargetTableModel(self.session, self.targets),
+                   TargetsDistanceTableModel(self.session, self.targets)]
+    self.changedRows = []
+    for model in self.models:
+      rows = []
+      model.dataChanged.connect(lambda topLeft, bottomRight, *args, rows=rows:
+                                rows.append((topLeft.row(), bottomRight.row())))
+      self.changedRows.append(rows)
+
+  def tearDown(self):
+    for model in self.models:
+      model.targetList = None
+    slicer.mrmlScene.RemoveNode(self.targets)
+
+  def runTest(self):
+    self.test_Moving_a_target_refreshes_its_row()
+
+  def test_Moving_a_target_refreshes_its_row(self):
+    guidance = self.session.guidanceRegistry.getOrCreate(self.targets)
+    for model in self.models:
+      self.assertTrue(model.currentGuidanceComputation is guidance)
+    holes = [guidance.getZFrameHole(row) for row in range(3)]
+    self.targets.SetNthFiducialPositionFromArray(1, [0, 10, 0])
+    for rows in self.changedRows:
+      self.assertEqual(rows, [(1, 1)])
+    self.assertFalse(1 in guidance.computedHoles)
+    self.assertTrue(0 in guidance.computedHoles and 2 in guidance.computedHoles)
+    self.assertEqual(guidance.getZFrameHole(1), holes[2])
+
+
+class AlternativeHolesTest(unittest.TestCase):
+
+  def setUp(self):
+    import numpy, types, qt
+    from ProstateAblationUtils.steps.plugins.targetsDefinitionTable import CustomTargetTableModel, \
+      ZFrameGuidanceRegistry
+    self.toolTipRole = qt.Qt.ToolTipRole
+    # three parallel holes along the z axis, 100 mm deep
+    registration = types.SimpleNamespace(pathOrigins=numpy.array([[0., 0., 0.], [10., 0., 0.], [25., 0., 0.]]),
+                                         pathVectors=numpy.array([[0., 0., 1.]] * 3),
+                                         templateMaxDepth=[100.0] * 3, templateIndex=[['A', 1], ['B', 1], ['C', 1]],
+                                         templateHoleIndex=None, worldToTemplate=None)
+    self.session = ProstateAblationSession()
+    for patcher in [mock.patch.object(ZFrameGuidanceRegistry, "zFrameRegistration", registration),
+                    mock.patch.object(ProstateAblationSession, "zFrameRegistrationSuccessful", True)]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self.targets = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsFiducialNode", "AlternativeHolesTest")
+    for position in [[12, 0, 50], [24, 0, -5]]:
+      self.targets.AddFiducialFromArray(position)
+    self.model = CustomTargetTableModel(self.session, self.targets)
+
+  def tearDown(self):
+    self.model.targetList = None
+    slicer.mrmlScene.RemoveNode(self.targets)
+
+  def runTest(self):
+    self.test_Table_ranks_the_nearest_holes()
+    self.test_Ranking_is_limited_by_the_number_of_holes()
+
+  def toolTip(self, row):
+    return self.model.data(self.model.index(row, 3), self.toolTipRole)
+
+  def test_Table_ranks_the_nearest_holes(self):
+    self.assertEqual(self.toolTip(0), "Nearest holes:\n"
+                                      "(B, 1): 2.0 mm off, depth 5.0\n"
+                                      "(A, 1): 12.0 mm off, depth 5.0\n"
+                                      "(C, 1): 13.0 mm off, depth 5.0")
+    self.assertEqual(self.toolTip(1), "Nearest holes:\n"
+                                      "(C, 1): 1.0 mm off, depth (-0.5)\n"
+                                      "(B, 1): 14.0 mm off, depth (-0.5)\n"
+                                      "(A, 1): 24.0 mm off, depth (-0.5)")
+    self.targets.SetNthFiducialPositionFromArray(0, [1, 0, 50])
+    self.assertTrue(self.toolTip(0).startswith("Nearest holes:\n(A, 1): 1.0 mm off"))
+
+  def test_Ranking_is_limited_by_the_number_of_holes(self):
+    import numpy
+    guidance = self.model.currentGuidanceComputation
+    self.assertTrue(guidance.NUMBER_OF_ALTERNATIVE_PATHS > 3)
+    self.assertEqual(len(guidance.getAlternativeHoles(0)), 3)
+    indices, depths, inRange, distances = guidance.findAlternativePaths([[12, 0, 50], [24, 0, -5]], k=10)
+    self.assertEqual(indices.tolist(), [[1, 0, 2], [2, 1, 0]])
+    self.assertEqual(inRange.tolist(), [[True] * 3, [False] * 3])
+    self.assertTrue(numpy.allclose(distances, [[2.0, 12.0, 13.0], [1.0, 14.0, 24.0]]))
+    indices, depths, inRange, distances = guidance.findAlternativePaths([[12, 0, 50]], k=1)
+    self.assertEqual(indices.tolist(), [[1]])
+
+
+class TargetsHoverGuidanceTest(unittest.TestCase):
+
+  class KeyPress(object):
+
+    def __init__(self, keySym):
+      self.keySym = keySym
+
+    def GetKeySym(self):
+      return self.keySym
+
+  def setUp(self):
+    from ProstateAblationUtils.steps.plugins.targetsDefinitionTable import TargetsDefinitionTable
+    self.table = TargetsDefinitionTable(ProstateAblationSession())
+    self.targets = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsFiducialNode", "TargetsHoverGuidanceTest")
+    for label, position in [("T1", [0, 0, 0]), ("T2", [30, 40, 0])]:
+      self.targets.SetNthFiducialLabel(self.targets.AddFiducialFromArray(position), label)
+
+  def tearDown(self):
+    self.table.disableHoverGuidance()
+    slicer.mrmlScene.RemoveNode(self.targets)
+
+  def runTest(self):
+    self.test_Guidance_key_toggles_the_readout()
+    self.test_Readout_lists_the_distance_to_each_target()
+
+  def test_Guidance_key_toggles_the_readout(self):
+    self.table.onKeyPressedEvent(self.KeyPress('x'), "KeyPressEvent")
+    self.assertIsNone(self.table.cursorObserver)
+    self.table.onKeyPressedEvent(self.KeyPress(self.table.HOVER_GUIDANCE_KEY), "KeyPressEvent")
+    self.assertIsNotNone(self.table.cursorObserver)
+    self.table.onKeyPressedEvent(self.KeyPress(self.table.HOVER_GUIDANCE_KEY), "KeyPressEvent")
+    self.assertIsNone(self.table.cursorObserver)
+    self.assertIsNone(self.table.hoverAnnotation)
+
+  def test_Readout_lists_the_distance_to_each_target(self):
+    with mock.patch.object(type(self.table), "currentTargets", self.targets), \
+         mock.patch.object(type(self.table.session), "zFrameRegistrationSuccessful", False):
+      self.assertEqual(self.table.getHoverGuidanceText([0, 0, 0]), "T1: 0.0 mm\nT2: 50.0 mm")
+
+
+class ZFrameGuidanceRegistryTest(unittest.TestCase):
+
+  def setUp(self):
+    from ProstateAblationUtils.steps.plugins.targetsDefinitionTable import ZFrameGuidanceRegistry
+    self.registry = ZFrameGuidanceRegistry(ProstateAblationSession())
+    self.targets = [slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsFiducialNode", "ZFrameGuidanceRegistryTest")
+                    for _ in range(2)]
+    for targets in self.targets:
+      targets.AddFiducialFromArray([0, 0, 0])
+
+  def tearDown(self):
+    self.registry.cleanup()
+    for targets in self.targets:
+      if slicer.mrmlScene.IsNodePresent(targets):
+        slicer.mrmlScene.RemoveNode(targets)
+
+  def runTest(self):
+    self.test_Entries_are_shared_and_released_with_their_node()
+    self.test_Cleanup_stops_observing_the_scene()
+
+  def test_Entries_are_shared_and_released_with_their_node(self):
+    guidance = self.registry.getOrCreate(self.targets[0])
+    self.assertTrue(self.registry.getOrCreate(self.targets[0]) is guidance)
+    self.assertFalse(self.targets[1] in self.registry)
+    slicer.mrmlScene.RemoveNode(self.targets[0])
+    self.assertFalse(self.targets[0] in self.registry)
+    self.assertIsNone(guidance.targetList)
+
+  def test_Cleanup_stops_observing_the_scene(self):
+    guidance = self.registry.getOrCreate(self.targets[0])
+    observers = list(self.registry._sceneObservers)
+    self.assertEqual(len(observers), 2)
+    self.registry.cleanup()
+    self.assertIsNone(guidance.targetList)
+    self.assertTrue(all(slicer.mrmlScene.GetCommand(observer) is None for observer in observers))
+    # the scene is observed again once new entries are created
+    self.registry.getOrCreate(self.targets[1])
+    self.assertEqual(len(self.registry._sceneObservers), 2)
@@ -0,0 +1,176 @@
+""" Synthetic intraop series and a scanner simulator writing them into a directory at a given rate.
+
+This module is only used by the tests and the benchmark. It must not import slicer, qt or vtk, so that it can be used
+from a plain Python interpreter as well. pydicom is required for creating any synthetic data.
+"""
+
+import os
+import time
+import logging
+import threading
+
+import numpy
+
+try:
+  import pydicom
+  from pydicom.dataset import Dataset, FileDataset, FileMetaDataset
+  from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+except ImportError:
+  pydicom = None
+
+MR_IMAGE_STORAGE = "1.2.840.10008.5.1.4.1.1.4"
+
+
+def requirePydicom():
+  if pydicom is None:
+    raise RuntimeError("pydicom is required for creating synthetic DICOM data, install it with "
+                       "slicer.util.pip_install('pydicom')")
+
+
+class SyntheticSeries(object):
+  """ Description of a synthetic axial MR series
+
+  Args:
+    seriesNumber (int): SeriesNumber
+    description (str): SeriesDescription, e.g. "COVER PROSTATE"
+    numberOfSlices (int): number of slices
+    rows (int): number of rows per slice
+    columns (int): number of columns per slice
+    spacing (tuple): row, column and slice spacing in mm
+  """
+
+  def __init__(self, seriesNumber, description, numberOfSlices, rows=256, columns=256, spacing=(0.8, 0.8, 3.0)):
+    self.seriesNumber = seriesNumber
+    self.description = description
+    self.numberOfSlices = numberOfSlices
+    self.rows = rows
+    self.columns = columns
+    self.spacing = spacing
+    requirePydicom()
+    self.seriesInstanceUID = generate_uid()
+
+  @property
+  def name(self):
+    return "{}: {}".format(self.seriesNumber, self.description)
+
+  def createDataset(self, index, study):
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = MR_IMAGE_STORAGE
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset = FileDataset(None, {}, file_meta=meta, preamble=b"\0" * 128)
+    dataset.is_little_endian = True
+    dataset.is_implicit_VR = False
+    dataset.SOPClassUID = MR_IMAGE_STORAGE
+    dataset.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    dataset.Modality = "MR"
+    dataset.PatientID = study.patientID
+    dataset.PatientName = study.patientName
+    dataset.StudyInstanceUID = study.studyInstanceUID
+    dataset.FrameOfReferenceUID = study.frameOfReferenceUID
+    dataset.SeriesInstanceUID = self.seriesInstanceUID
+    dataset.SeriesNumber = self.seriesNumber
+    dataset.SeriesDescription = self.description
+    dataset.InstanceNumber = index + 1
+    dataset.ImagesInAcquisition = self.numberOfSlices
+    dataset.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    dataset.ImagePositionPatient = [-self.columns * self.spacing[1] / 2.0, -self.rows * self.spacing[0] / 2.0,
+                                    (index - self.numberOfSlices / 2.0) * self.spacing[2]]
+    dataset.PixelSpacing = list(self.spacing[:2])
+    dataset.SliceThickness = self.spacing[2]
+    dataset.Rows = self.rows
+    dataset.Columns = self.columns
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = "MONOCHROME2"
+    dataset.BitsAllocated = 16
+    dataset.BitsStored = 12
+    dataset.HighBit = 11
+    dataset.PixelRepresentation = 0
+    dataset.PixelData = study.createPixels(self.rows, self.columns, index).tobytes()
+    return dataset
+
+
+class SyntheticStudy(object):
+  """ Patient and study information shared by a list of synthetic series """
+
+  def __init__(self, series, patientID="SIMULATED", patientName="Simulated^Patient"):
+    self.series = series
+    self.patientID = patientID
+    self.patientName = patientName
+    requirePydicom()
+    self.studyInstanceUID = generate_uid()
+    self.frameOfReferenceUID = generate_uid()
+    self._random = numpy.random.RandomState(0)
+
+  def createPixels(self, rows, columns, index):
+    return self._random.randint(0, 4096, size=(rows, columns)).astype(numpy.uint16)
+
+
+class ScannerSimulator(object):
+  """ Writes the slices of a synthetic study into a directory like a scanner pushing to the DICOM receiver.
+
+  Files are written on a background thread so that the receiving application keeps running its event loop.
+
+  Args:
+    study (SyntheticStudy): series to be written in order
+    destination (str): directory to write the files into, e.g. the intraop DICOM directory of a case
+    slicesPerSecond (float): rate limit for writing slices. 0 writes as fast as possible.
+    seriesInterval (float): pause in seconds between two series
+  """
+
+  def __init__(self, study, destination, slicesPerSecond=0, seriesInterval=0):
+    requirePydicom()
+    self.study = study
+    self.destination = destination
+    self.slicesPerSecond = slicesPerSecond
+    self.seriesInterval = seriesInterval
+    self.firstSliceTimes = {}
+    self.lastSliceTimes = {}
+    self.files = {}
+    self._thread = None
+    self._stopped = False
+
+  @property
+  def isRunning(self):
+    return self._thread is not None and self._thread.is_alive()
+
+  def start(self):
+    self._stopped = False
+    self._thread = threading.Thread(target=self.run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    self._stopped = True
+
+  def join(self, timeout=None):
+    if self._thread:
+      self._thread.join(timeout)
+
+  def run(self):
+    if not os.path.exists(self.destination):
+      os.makedirs(self.destination)
+    interval = 1.0 / self.slicesPerSecond if self.slicesPerSecond else 0
+    nextTime = time.time()
+    for seriesIndex, series in enumerate(self.study.series):
+      if seriesIndex and self.seriesInterval:
+        time.sleep(self.seriesInterval)
+        nextTime = time.time()
+      self.files[series.seriesNumber] = []
+      for index in range(series.numberOfSlices):
+        if self._stopped:
+          return
+        if interval:
+          time.sleep(max(0, nextTime - time.time()))
+          nextTime += interval
+        self.writeSlice(series, index)
+
+  def writeSlice(self, series, index):
+    filename = os.path.join(self.destination, "%s.%04d.dcm" % (series.seriesInstanceUID, index + 1))
+    dataset = series.createDataset(index, self.study)
+    dataset.save_as(filename, write_like_original=False)
+    now = time.time()
+    self.firstSliceTimes.setdefault(series.seriesNumber, now)
+    self.lastSliceTimes[series.seriesNumber] = now
+    self.files[series.seriesNumber].append(filename)
+    logging.debug("Simulated scanner wrote %s" % filename)